@@ -0,0 +1,359 @@
+"""
+Benchmarks the label pipeline on synthetic jobs and compares the results to a stored baseline.
+
+Two benchmarks are run for each combination of page count, label kind and output mode:
+
+- 'process' times `tesseract.process` on one job, with the time spent in each stage.
+- 'watcher' runs the watcher stack (observer, debounce scheduler, event queue and job executor), copies a workbook into
+  a cut list directory and times it until the job is finished, debounce included.
+
+Every repetition runs in a fresh interpreter with its own state directory, so caches never leak from one run to the
+next and the peak RSS of each run can be measured. Everything runs offline; tesseract and poppler must be installed.
+
+Usage:
+    python -m benchmarks.run --pages 8,64 --kinds scanned,text --save-baseline
+    python -m benchmarks.run --pages 8,64 --kinds scanned,text  # exits with 1 on a regression
+    python -m benchmarks.run --benchmarks process --kinds scanned --ocr-dpis 500,300,200  # accuracy per OCR dpi
+    python -m benchmarks.run --benchmarks process --kinds scanned --ocr-backends pytesseract,tiled  # per OCR backend
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+NAMESPACE = 'TAG_WATCHER_'
+
+# Scenarios at other OCR resolutions or with other OCR backends are suffixed with them, so the names of the baseline
+# scenarios do not change.
+DEFAULT_OCR_DPI = 500
+
+DEFAULT_OCR_BACKEND = "pytesseract"
+
+
+def get_peak_rss() -> Dict[str, float]:
+    """
+    Returns the peak resident set size of this process and of its largest waited-for child, in MiB.
+    """
+    to_mib = 1 / 1024 if sys.platform != "darwin" else 1 / 1024 / 1024
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * to_mib,
+        "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * to_mib,
+    }
+
+
+# Child side: one repetition of one scenario, in a fresh interpreter.
+
+def run_process(scenario: dict, excel_path: Path, pdf_path: Path, work_dir: Path) -> dict:
+    from utilities import metrics, tesseract
+
+    output_path = work_dir / "output.pdf"
+    started_at = time.perf_counter()
+    with metrics.job() as report:
+        pages = tesseract.process(pdf_path=pdf_path, excel_path=excel_path, output_path=output_path)
+    wall = time.perf_counter() - started_at
+    if pages is None:
+        raise RuntimeError(f"Processing '{pdf_path.name}' failed, see the log.")
+    return {"wall": wall, "stages": report["stages"], "names": [name for name, _ in pages]}
+
+
+def run_watcher(scenario: dict, excel_path: Path, pdf_path: Path, work_dir: Path) -> dict:
+    from watchdog.observers import Observer
+
+    import settings
+    from utilities import handler, metrics
+    from utilities.executor import JobExecutor
+    from utilities.scheduler import DebounceScheduler
+    from utilities.work_queue import WorkQueue
+
+    cut_list_dir = settings.WATCHING_DIR / settings.KEYWORD / "benchmark" / "briefing" / settings.CUT_LIST_DIR
+    cut_list_dir.mkdir(parents=True)
+    shutil.copy(pdf_path, cut_list_dir / pdf_path.name)
+
+    event_queue = WorkQueue()
+    scheduler = DebounceScheduler(delay=scenario["debounce"])
+    executor = JobExecutor(max_workers=1)
+    event_handler = handler.ExcelEventHandler(event_queue, scheduler)
+    threads = [threading.Thread(target=handler.worker, args=(event_queue, executor)),
+               threading.Thread(target=handler.delayed_scan_worker, args=(scheduler, event_handler))]
+    for thread in threads:
+        thread.start()
+    observer = Observer()
+    observer.schedule(event_handler, path=str(settings.WATCHING_DIR), recursive=True)
+    observer.start()
+    try:
+        started_at = time.perf_counter()
+        shutil.copy(excel_path, cut_list_dir / excel_path.name)
+        deadline = started_at + scenario["timeout"]
+        while metrics.JOBS.total() < 1:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"No job finished within {scenario['timeout']}s.")
+            time.sleep(0.01)
+        wall = time.perf_counter() - started_at
+    finally:
+        observer.stop()
+        observer.join()
+        scheduler.stop()
+        event_queue.put(None)
+        for thread in threads:
+            thread.join()
+    if metrics.JOBS.get("processed") != 1:
+        raise RuntimeError(f"The job did not complete: {dict(metrics.JOBS.values)}")
+    job_duration = metrics.JOB_DURATION.get_sum("processed")
+    stages = {name: metrics.STAGE_DURATION.get_sum(name) for (name,) in list(metrics.STAGE_DURATION.values)}
+    stages["job"] = job_duration
+    stages["debounce"] = scenario["debounce"]
+    stages["dispatch"] = max(wall - job_duration - scenario["debounce"], 0.0)
+    return {"wall": wall, "stages": stages}
+
+
+BENCHMARKS = {"process": run_process, "watcher": run_watcher}
+
+
+def run_child(arguments: argparse.Namespace) -> None:
+    scenario = json.loads(arguments.child)
+    if arguments.verbose:
+        from utilities import logs
+        logs.configure()
+    else:
+        logging.disable(logging.INFO)
+    result = BENCHMARKS[scenario["benchmark"]](scenario, Path(scenario["excel_path"]), Path(scenario["pdf_path"]),
+                                               Path(scenario["work_dir"]))
+    result.update(get_peak_rss())
+    Path(arguments.child_output).write_text(json.dumps(result))
+
+
+# Parent side: data generation, scenarios, aggregation and comparison.
+
+def get_child_environment(scenario: dict, work_dir: Path, ocr_cache: bool) -> Dict[str, str]:
+    environment = dict(os.environ)
+    environment.update({
+        NAMESPACE + "STATE_DIR": str(work_dir / "state"),
+        NAMESPACE + "WATCHING_DIR": str(work_dir / "watch"),
+        NAMESPACE + "OUTPUT_MODE": scenario["output_mode"],
+        NAMESPACE + "OCR_DPI": str(scenario["ocr_dpi"]),
+        NAMESPACE + "OCR_BACKEND": scenario["ocr_backend"],
+        NAMESPACE + "OCR_CACHE_ENABLED": str(ocr_cache),
+        NAMESPACE + "RECONCILE_ON_STARTUP": "False",
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(BASE_DIR), os.environ.get("PYTHONPATH")])),
+    })
+    return environment
+
+
+def run_repetition(scenario: dict, work_dir: Path, arguments: argparse.Namespace) -> dict:
+    work_dir.mkdir(parents=True)
+    child_output = work_dir / "result.json"
+    command = [sys.executable, "-m", "benchmarks.run", "--child", json.dumps(dict(scenario, work_dir=str(work_dir))),
+               "--child-output", str(child_output)]
+    if arguments.verbose:
+        command.append("--verbose")
+    environment = get_child_environment(scenario, work_dir=work_dir, ocr_cache=arguments.ocr_cache)
+    completed = subprocess.run(command, cwd=BASE_DIR, env=environment, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario '{scenario['name']}' failed:\n{completed.stdout}")
+    if arguments.verbose:
+        print(completed.stdout)
+    return json.loads(child_output.read_text())
+
+
+def summarize(scenario: dict, runs: List[dict], expected_names: List[str]) -> dict:
+    walls = [run["wall"] for run in runs]
+    stage_names = sorted({name for run in runs for name in run["stages"]})
+    summary = {
+        "pages": scenario["pages"],
+        "wall": statistics.median(walls),
+        "wall_min": min(walls),
+        "wall_max": max(walls),
+        "pages_per_second": scenario["pages"] / statistics.median(walls),
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "peak_child_rss_mb": max(run["peak_child_rss_mb"] for run in runs),
+        "stages": {name: statistics.median(run["stages"].get(name, 0.0) for run in runs) for name in stage_names},
+    }
+    if "names" in runs[0]:
+        matches = sum(name == expected for name, expected in zip(runs[0]["names"], expected_names))
+        summary["accuracy"] = matches / len(expected_names)
+    return summary
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """
+    Returns a description of every regression of the results against the baseline: a median wall time or a peak RSS
+    more than `threshold` above the baseline, or a lower name accuracy.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric in ("wall", "peak_rss_mb", "peak_child_rss_mb"):
+            if reference.get(metric) and result[metric] > reference[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {result[metric]:.3f} vs {reference[metric]:.3f} "
+                                   f"(+{(result[metric] / reference[metric] - 1) * 100:.1f}%)")
+        if "accuracy" in reference and result.get("accuracy", 1.0) < reference["accuracy"]:
+            regressions.append(f"{name}: accuracy {result['accuracy']:.3f} vs {reference['accuracy']:.3f}")
+    return regressions
+
+
+def print_results(results: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    print(f"{'scenario':<34} {'wall (s)':>10} {'baseline':>10} {'pages/s':>9} {'rss (MiB)':>10} {'child':>8}")
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get("wall")
+        reference = f"{reference:.3f}" if reference is not None else "-"
+        print(f"{name:<34} {result['wall']:>10.3f} {reference:>10} "
+              f"{result['pages_per_second']:>9.2f} {result['peak_rss_mb']:>10.1f} {result['peak_child_rss_mb']:>8.1f}")
+        stages = ", ".join(f"{stage} {seconds:.3f}" for stage, seconds in result["stages"].items())
+        print(f"    {stages}")
+
+
+def get_metadata() -> dict:
+    from utilities import functions
+
+    tesseract_cmd = functions.get_tesseract_cmd()
+    version = subprocess.run([str(tesseract_cmd), "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             text=True).stdout.splitlines()
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "tesseract": version[0] if version else None,
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def get_scenarios(arguments: argparse.Namespace) -> List[dict]:
+    scenarios = []
+    for benchmark in arguments.benchmarks:
+        for pages in arguments.pages:
+            for kind in arguments.kinds:
+                for output_mode in arguments.output_modes:
+                    for ocr_dpi in arguments.ocr_dpis:
+                        for ocr_backend in arguments.ocr_backends:
+                            suffix = "" if ocr_dpi == DEFAULT_OCR_DPI else f"-{ocr_dpi}dpi"
+                            suffix += "" if ocr_backend == DEFAULT_OCR_BACKEND else f"-{ocr_backend}"
+                            scenarios.append({
+                                "name": f"{benchmark}-{kind}-{output_mode}-{pages}p{suffix}",
+                                "benchmark": benchmark,
+                                "pages": pages,
+                                "rows": max(arguments.rows, pages),
+                                "kind": kind,
+                                "output_mode": output_mode,
+                                "ocr_dpi": ocr_dpi,
+                                "ocr_backend": ocr_backend,
+                                "debounce": arguments.debounce,
+                                "timeout": arguments.timeout,
+                            })
+    return scenarios
+
+
+def run(arguments: argparse.Namespace) -> int:
+    for tool in ("pdftoppm", "pdftotext", "pdfinfo"):
+        if shutil.which(tool) is None:
+            print(f"'{tool}' was not found, install poppler to run the benchmarks.", file=sys.stderr)
+            return 2
+    baseline_path = Path(arguments.baseline)
+    baseline = json.loads(baseline_path.read_text())["results"] if baseline_path.exists() else {}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="tag-watcher-bench-") as temporary_dir:
+        # Keep the state of the data generation out of the real state directory.
+        os.environ[NAMESPACE + "STATE_DIR"] = str(Path(temporary_dir) / "state")
+        from benchmarks import synthetic
+
+        try:
+            metadata = get_metadata()
+        except FileNotFoundError as e:
+            print(e, file=sys.stderr)
+            return 2
+        data: Dict[tuple, tuple] = {}
+        for scenario in get_scenarios(arguments):
+            data_key = (scenario["pages"], scenario["rows"], scenario["kind"])
+            if data_key not in data:
+                directory = Path(temporary_dir) / "data" / "-".join(map(str, data_key))
+                excel_path, pdf_path = synthetic.make_job(directory, pages=scenario["pages"], rows=scenario["rows"],
+                                                          kind=scenario["kind"], seed=arguments.seed)
+                data[data_key] = (excel_path, pdf_path, synthetic.get_tag_names(scenario["pages"], seed=arguments.seed))
+            excel_path, pdf_path, names = data[data_key]
+            scenario.update(excel_path=str(excel_path), pdf_path=str(pdf_path))
+            print(f"Running {scenario['name']} x{arguments.repeat}...", flush=True)
+            runs = [run_repetition(scenario, Path(temporary_dir) / "runs" / f"{scenario['name']}-{repetition}",
+                                   arguments) for repetition in range(arguments.repeat)]
+            results[scenario["name"]] = summarize(scenario, runs, expected_names=names)
+
+    print_results(results, baseline)
+    report = {"metadata": metadata, "results": results}
+    if arguments.output:
+        Path(arguments.output).write_text(json.dumps(report, indent=2))
+    if arguments.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"Saved the baseline to '{baseline_path}'.")
+        return 0
+    if not baseline:
+        print(f"No baseline at '{baseline_path}', run with --save-baseline to create one.")
+        return 0
+    regressions = compare(results, baseline, threshold=arguments.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regression above {arguments.threshold:.0%} against '{baseline_path}'.")
+    return 1 if regressions else 0
+
+
+def parse_list(cast):
+    return lambda value: [cast(item) for item in value.split(",") if item]
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the label pipeline on synthetic jobs.")
+    parser.add_argument("--benchmarks", type=parse_list(str), default=["process", "watcher"],
+                        help="Comma separated benchmarks to run: process, watcher. Defaults to both.")
+    parser.add_argument("--pages", type=parse_list(int), default=[8, 64], help="Comma separated page counts.")
+    parser.add_argument("--rows", type=int, default=2000, help="Workbook rows, at least the page count.")
+    parser.add_argument("--kinds", type=parse_list(str), default=["scanned", "text"],
+                        help="Comma separated label kinds: scanned (OCR), text (text layer).")
+    parser.add_argument("--output-modes", type=parse_list(str), default=["raster"],
+                        help="Comma separated output modes: raster, vector.")
+    parser.add_argument("--ocr-dpis", type=parse_list(int), default=[DEFAULT_OCR_DPI],
+                        help=f"Comma separated resolutions the name regions are rendered at for OCR. Defaults to "
+                             f"{DEFAULT_OCR_DPI}.")
+    parser.add_argument("--ocr-backends", type=parse_list(str), default=[DEFAULT_OCR_BACKEND],
+                        help=f"Comma separated OCR backends: pytesseract, tiled. Defaults to {DEFAULT_OCR_BACKEND}.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of each scenario, the median is kept.")
+    parser.add_argument("--debounce", type=float, default=0.5, help="Debounce delay of the watcher benchmark.")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for a watcher job.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data.")
+    parser.add_argument("--ocr-cache", action="store_true", help="Keep the OCR cache enabled.")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="The baseline JSON file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative increase of wall time or peak RSS reported as a regression.")
+    parser.add_argument("--output", help="Also write the results to this JSON file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the log of the benchmarked code.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = get_parser().parse_args(argv)
+    if arguments.child:
+        run_child(arguments)
+        return 0
+    return run(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Synthetic '_ETQs.pdf' label sheets and 'DATA - Paineis' workbooks for the benchmarks.
+
+The labels follow the geometry the pipeline assumes at 500 dpi: the tag name is printed inside `CROP_REGION` and an old
+value inside `MASK_REGION`. 'scanned' labels are single images, read by OCR; 'text' labels are drawn with PDF text
+operators, so their names come from the text layer.
+"""
+import io
+import random
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import img2pdf
+import openpyxl
+import pikepdf
+from PIL import Image, ImageDraw, ImageFont
+
+from utilities import functions, tesseract, workbook
+
+# 100 x 50 mm labels, which contain the crop and mask regions at 500 dpi.
+PAGE_SIZE = (1968, 984)
+
+NAME_FONT_SIZE = 96
+
+VALUE_FONT_SIZE = 110
+
+LABEL_KINDS = ('scanned', 'text')
+
+
+def get_tag_names(pages: int, seed: int = 0) -> List[str]:
+    """
+    Returns one distinct tag name per page, as `tesseract.normalize_name` reads them back from the labels.
+    """
+    numbers = random.Random(seed).sample(range(10000, 100000), pages)
+    return [f"PAINEL_{number}" for number in numbers]
+
+
+def get_label_text(name: str) -> str:
+    # The last word of a label is dropped by `tesseract.normalize_name`, like the piece count of the real labels.
+    return f"{name.replace('_', ' ')} 1"
+
+
+def get_font(size: int) -> ImageFont.FreeTypeFont:
+    for font_name in ("DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf", "Arial Bold.ttf"):
+        try:
+            return ImageFont.truetype(font_name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def draw_label(name: str, old_value: int) -> Image.Image:
+    """
+    Draws a grayscale label at 500 dpi with its tag name in the crop region and an old value in the mask region.
+    """
+    image = Image.new("L", PAGE_SIZE, color=255)
+    draw = ImageDraw.Draw(image)
+    top, bottom, left, right = tesseract.CROP_REGION
+    draw.rectangle((20, 20, PAGE_SIZE[0] - 20, PAGE_SIZE[1] - 20), outline=0, width=6)
+    draw.text((left + 20, 120), "CLIENTE BENCHMARK", fill=0, font=get_font(NAME_FONT_SIZE))
+    draw.text((left + 20, 300), "MDF 18MM BRANCO", fill=0, font=get_font(NAME_FONT_SIZE))
+    draw.text((left + 20, (top + bottom) // 2), get_label_text(name), fill=0, font=get_font(NAME_FONT_SIZE),
+              anchor="lm")
+    (mask_left, mask_top), (mask_right, mask_bottom) = tesseract.MASK_REGION
+    draw.text(((mask_left + mask_right) // 2, (mask_top + mask_bottom) // 2), str(old_value), fill=0,
+              font=get_font(VALUE_FONT_SIZE), anchor="mm")
+    return image
+
+
+def write_scanned_pdf(pdf_path: Path, names: List[str], seed: int = 0) -> None:
+    generator = random.Random(seed)
+    pages = []
+    for name in names:
+        buffer = io.BytesIO()
+        draw_label(name, old_value=generator.randint(1, 999)).save(buffer, format="PNG")
+        pages.append(buffer.getvalue())
+    layout = img2pdf.get_fixed_dpi_layout_fun((tesseract.DPI, tesseract.DPI))
+    pdf_path.write_bytes(img2pdf.convert(pages, layout_fun=layout))
+
+
+def write_text_pdf(pdf_path: Path, names: List[str], seed: int = 0) -> None:
+    generator = random.Random(seed)
+    scale = 72 / tesseract.DPI
+    width, height = PAGE_SIZE[0] * scale, PAGE_SIZE[1] * scale
+    top, bottom, left, _ = tesseract.CROP_REGION
+    (mask_left, _), (_, mask_bottom) = tesseract.MASK_REGION
+    name_size, value_size = NAME_FONT_SIZE * scale, VALUE_FONT_SIZE * scale
+    with pikepdf.new() as pdf:
+        font = pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+                                                    BaseFont=pikepdf.Name('/Helvetica-Bold'),
+                                                    Encoding=pikepdf.Name.WinAnsiEncoding))
+        for name in names:
+            name_y = height - (top + bottom) / 2 * scale - name_size / 3
+            value_y = height - (mask_bottom - 40) * scale
+            commands = (f"BT /F1 {name_size:.2f} Tf {(left + 20) * scale:.2f} {name_y:.2f} Td "
+                        f"({get_label_text(name)}) Tj ET\n"
+                        f"BT /F1 {value_size:.2f} Tf {(mask_left + 40) * scale:.2f} {value_y:.2f} Td "
+                        f"({generator.randint(1, 999)}) Tj ET\n")
+            page = pdf.add_blank_page(page_size=(width, height))
+            page.add_resource(font, pikepdf.Name.Font, name=pikepdf.Name.F1)
+            page.contents_add(pikepdf.Stream(pdf, commands.encode("ascii")))
+        pdf.save(pdf_path)
+
+
+def write_workbook(excel_path: Path, names: List[str], rows: int, seed: int = 0) -> None:
+    """
+    Writes a workbook whose 'DATA - Paineis' sheet has the tag names of the labels among `rows` rows, with the name
+    in column A and the value in column H like the real cut lists.
+    """
+    generator = random.Random(seed)
+    all_names = list(names) + [f"PECA_{index}" for index in range(max(rows - len(names), 0))]
+    generator.shuffle(all_names)
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet(workbook.SHEET_NAME)
+    sheet.append([workbook.TAG_NAME_HEADER, "DESCRICAO (B)", "MATERIAL (C)", "COMP (D)", "LARG (E)", "ESP (F)",
+                  "QTD (G)", workbook.TAG_VALUE_HEADER])
+    for name in all_names:
+        sheet.append([name, "LATERAL", "MDF BRANCO", generator.randint(100, 2750), generator.randint(50, 1830), 18,
+                      generator.randint(1, 4), generator.randint(1, 999)])
+    book.save(excel_path)
+
+
+def make_job(directory: Path, pages: int, rows: Optional[int] = None, kind: str = 'scanned', seed: int = 0,
+             stem: str = "lista") -> Tuple[Path, Path]:
+    """
+    Writes a matching workbook and label sheet into a directory.
+
+    Args:
+        directory (Path): The directory to write to, usually a cut list directory.
+        pages (int): The number of labels.
+        rows (int, optional): The number of workbook rows, at least `pages`. Defaults to `pages`.
+        kind (str, optional): 'scanned' or 'text', see `LABEL_KINDS`. Defaults to 'scanned'.
+        seed (int, optional): The seed of the names and values, so runs are reproducible. Defaults to 0.
+        stem (str, optional): The file name of the workbook, without extension. Defaults to 'lista'.
+
+    Returns:
+        Tuple[Path, Path]: The workbook and label sheet paths.
+    """
+    if kind not in LABEL_KINDS:
+        raise ValueError(f"Unknown label kind '{kind}', expected one of {LABEL_KINDS}.")
+    directory.mkdir(parents=True, exist_ok=True)
+    names = get_tag_names(pages, seed=seed)
+    excel_path = directory / f"{stem}.xlsx"
+    pdf_path = functions.get_pdf_path(excel_path=excel_path)
+    if kind == 'scanned':
+        write_scanned_pdf(pdf_path, names, seed=seed)
+    else:
+        write_text_pdf(pdf_path, names, seed=seed)
+    write_workbook(excel_path, names, rows=max(rows or pages, pages), seed=seed)
+    return excel_path, pdf_path
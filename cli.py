@@ -0,0 +1,161 @@
+"""
+Batch processing of '.xlsx'/'_ETQs.pdf' pairs without the watcher, e.g. to backfill a client after a template change.
+
+Usage:
+    python cli.py process "/home/app/media/public/mofreitas/clientes/ACME" -j 8
+    python cli.py reprocess "/path/to/clientes/*/briefing/Listas de Corte e Etiquetas/*_ETQs.pdf"
+
+'process' skips pairs whose output is up to date and only re-stamps the pages that changed when just the workbook
+changed, like the watcher. 'reprocess' processes every pair in full. The exit code is 1 when a job failed.
+"""
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import settings
+from utilities import functions, logs
+from utilities.reconcile import DirectoryCrawler
+
+logger = logging.getLogger(__name__)
+
+FAILED_STATUSES = ('failed', 'invalid')
+
+
+def run_workbook(excel_path: str, force: bool) -> dict:
+    """
+    Entry point of a job in a worker process, see `executor.run_job`.
+    """
+    from utilities import task
+    return task.process_workbook(excel_path, force=force)
+
+
+def find_workbooks(directory: Path) -> Iterator[Path]:
+    """
+    Yields the valid workbooks of every cut list directory below a directory.
+    """
+    _, seen = DirectoryCrawler(directory).crawl(previous={})
+    for path, (_, children) in sorted(seen.items()):
+        if children is not None:
+            continue
+        try:
+            with os.scandir(path) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Cannot list '{path}': {e}")
+            continue
+        for entry in entries:
+            if entry.is_file() and functions.path_classifier.is_valid_path(entry.path):
+                yield Path(entry.path)
+
+
+def resolve_workbooks(arguments: List[str]) -> List[Path]:
+    """
+    Resolves files, directories and glob patterns to the Excel file of each pair, without duplicates. A '_ETQs.pdf'
+    file stands for its Excel file.
+    """
+    workbooks: Dict[Path, None] = {}
+    for argument in arguments:
+        paths = [Path(path) for path in sorted(glob.glob(argument, recursive=True))] if glob.has_magic(argument) \
+            else [Path(argument)]
+        if not paths:
+            logger.warning(f"No file matches '{argument}'.")
+        for path in paths:
+            if path.is_dir():
+                workbooks.update(dict.fromkeys(functions.validate_path(workbook) for workbook in find_workbooks(path)))
+            elif path.name.endswith("_ETQs.pdf"):
+                workbooks[functions.validate_path(functions.get_excel_path(path))] = None
+            elif path.suffix.lower() == ".xlsx":
+                workbooks[functions.validate_path(path)] = None
+            else:
+                logger.warning(f"Ignoring '{path}', it is neither a directory, an '.xlsx' nor an '_ETQs.pdf' file.")
+    return list(workbooks)
+
+
+def print_summary(reports: Dict[Path, Optional[dict]], elapsed: float) -> None:
+    statuses: Dict[str, int] = {}
+    for report in reports.values():
+        status = report["status"] if report else "failed"
+        statuses[status] = statuses.get(status, 0) + 1
+    pages = sum(report["pages"] for report in reports.values() if report)
+    counts = ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
+    elapsed = max(elapsed, 1e-9)
+    print(f"{len(reports)} jobs in {elapsed:.1f}s: {counts or 'nothing to do'}. {pages} pages, "
+          f"{pages / elapsed:.2f} pages/s, {len(reports) / elapsed:.2f} jobs/s.")
+    failures = [path for path, report in reports.items() if not report or report["status"] in FAILED_STATUSES]
+    for path in failures:
+        print(f"FAILED {path}", file=sys.stderr)
+
+
+def run(workbooks: List[Path], force: bool, jobs: int) -> int:
+    reports: Dict[Path, Optional[dict]] = {}
+    started_at = time.perf_counter()
+    context = multiprocessing.get_context(settings.WORKER_START_METHOD)
+    pool = ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=logs.configure_worker,
+                               initargs=logs.get_worker_args())
+    try:
+        futures = {pool.submit(run_workbook, str(path), force): path for path in workbooks}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                report = future.result()
+                detail = f"{report['status']}, {report['pages']} pages in {report['duration']:.1f}s"
+            except Exception as e:
+                report = None
+                detail = f"failed: {e!r}"
+            reports[path] = report
+            print(f"[{len(reports)}/{len(workbooks)}] {path.name}: {detail}", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        print("Interrupted, cancelling the pending jobs.", file=sys.stderr)
+        pool.shutdown(wait=True, cancel_futures=True)
+        print_summary(reports, time.perf_counter() - started_at)
+        return 130
+    pool.shutdown(wait=True)
+    print_summary(reports, time.perf_counter() - started_at)
+    return 1 if any(not report or report["status"] in FAILED_STATUSES for report in reports.values()) else 0
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Process '.xlsx'/'_ETQs.pdf' pairs without the watcher.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, description in (("process", "Process the pairs whose output is missing or out of date."),
+                                 ("reprocess", "Process every pair in full, even if its output is up to date.")):
+        subparser = subparsers.add_parser(command, help=description, description=description)
+        subparser.add_argument("paths", nargs="+", help="'.xlsx' or '_ETQs.pdf' files, directories or glob patterns.")
+        subparser.add_argument("-j", "--jobs", type=int, default=settings.NUM_WORKER_THREADS,
+                               help=f"Number of parallel jobs. Defaults to {settings.NUM_WORKER_THREADS}.")
+        subparser.add_argument("--dry-run", action="store_true", help="List the pairs without processing them.")
+        subparser.add_argument("-v", "--verbose", action="store_true", help="Log to the console and the log file.")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = get_parser().parse_args(argv)
+    if arguments.verbose:
+        logs.configure()
+    else:
+        logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+    workbooks = resolve_workbooks(arguments.paths)
+    if arguments.dry_run:
+        for path in workbooks:
+            print(path)
+        return 0
+    if not workbooks:
+        print("No pairs to process.", file=sys.stderr)
+        return 0
+    try:
+        functions.get_tesseract_cmd()
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 2
+    return run(workbooks, force=arguments.command == "reprocess", jobs=max(arguments.jobs, 1))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
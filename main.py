@@ -1,46 +1,138 @@
-import logging.config
-import queue
-import threading
 import time
 
+STARTED_AT = time.perf_counter()
+
+import logging
+import signal
+import sys
+import threading
+
 from watchdog.observers import Observer
 
 import settings
-from utilities import handler
+from utilities import functions, handler, inotify, logs, metrics
+from utilities.admission import StabilityGate
+from utilities.executor import JobExecutor
+from utilities.inotify import SharedInotifyObserver
+from utilities.leases import LeaseBoard, coordination_worker
+from utilities.polling import CutListPollingObserver
+from utilities.reconcile import Reconciler, reconcile_worker
+from utilities.scheduler import DebounceScheduler
+from utilities.watches import CUT_LIST, WatchManager
+from utilities.work_queue import WorkQueue
 
-logging.config.dictConfig(settings.LOGGER)
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    # Queues and Sets
-    event_queue = queue.Queue()
-    delayed_scan_queue = queue.Queue()
-    directories_in_queue = set()
+    logs.configure()
+
+    # Tesseract
+    try:
+        logger.info(f"Using tesseract at '{functions.get_tesseract_cmd()}'.")
+    except FileNotFoundError as e:
+        logger.critical(f"Cannot start: {e}")
+        sys.exit(1)
+
+    # Queues and Schedulers
+    event_queue = WorkQueue(maxsize=settings.EVENT_QUEUE_SIZE)
+    scheduler = DebounceScheduler(delay=settings.DELAY_FOR_SCAN)
+    gate = StabilityGate(event_queue)
+
+    # Executor
+    executor = JobExecutor(max_workers=settings.NUM_WORKER_THREADS)
+
+    # Job board shared with the other replicas
+    board = LeaseBoard() if settings.COORDINATION_DIR else None
 
     # Threads
-    worker_thread = threading.Thread(target=handler.worker, args=(event_queue,))
-    delayed_scan_thread = threading.Thread(target=handler.delayed_scan_worker,
-                                           args=(event_queue, delayed_scan_queue, directories_in_queue))
+    worker_thread = threading.Thread(target=handler.worker, args=(event_queue, executor, board))
+
+    # Watchdog
+    logger.info(f"Watching DIR: {settings.WATCHING_DIR}")
+    event_handler = handler.ExcelEventHandler(event_queue, scheduler, gate=gate)
+    delayed_scan_thread = threading.Thread(target=handler.delayed_scan_worker, args=(scheduler, event_handler))
+    gate_thread = threading.Thread(target=gate.run)
 
     worker_thread.start()
     delayed_scan_thread.start()
+    gate_thread.start()
 
-    # Watchdog
-    logger.info(f"Watching DIR: {settings.WATCHING_DIR}")
-    event_handler = handler.ExcelEventHandler(event_queue, delayed_scan_queue, directories_in_queue)
-    observer = Observer()
-    observer.schedule(event_handler, path=settings.WATCHING_DIR, recursive=True)
+    coordination_stop = threading.Event()
+    if board is not None:
+        logger.info(f"Sharing jobs with the other replicas in '{board.directory}' as '{board.owner}'.")
+        board.start()
+        coordination_thread = threading.Thread(target=coordination_worker, args=(board, executor, coordination_stop))
+        coordination_thread.start()
+
+    watch_manager = None
+    if settings.OBSERVER == "polling":
+        observer = CutListPollingObserver()
+        observer.schedule(event_handler, path=settings.WATCHING_DIR, recursive=True)
+    else:
+        observer = SharedInotifyObserver() if inotify.is_supported() else Observer()
+        watch_manager = WatchManager(observer, event_handler)
+
+    # Metrics
+    metrics.register_gauge("tag_watcher_event_queue_depth", "Events waiting for a worker.", event_queue.qsize)
+    metrics.register_gauge("tag_watcher_delayed_scan_queue_depth", "Directories waiting for their debounce deadline.",
+                           lambda: len(scheduler))
+    metrics.register_gauge("tag_watcher_unstable_files", "Files waiting for them and their PDF file to stop changing.",
+                           lambda: len(gate))
+    metrics.register_gauge("tag_watcher_running_jobs", "Jobs running on the worker processes.",
+                           executor.running_count)
+    metrics_stop = threading.Event()
+    threading.Thread(target=metrics.summary_worker, args=(metrics_stop,), daemon=True).start()
+    if settings.METRICS_PORT:
+        metrics.start_server()
 
     observer.start()
+    if watch_manager is not None:
+        watch_manager.start()
+        metrics.register_gauge("tag_watcher_watches", "Directories watched by the native observer.",
+                               lambda: len(watch_manager))
+        metrics.register_gauge("tag_watcher_cut_list_watches", "Cut list directories watched by the native observer.",
+                               lambda: watch_manager.count(CUT_LIST))
+    logger.info(f"Tag watcher started in {time.perf_counter() - STARTED_AT:.3f}s.")
+
+    # Reconciliation
+    reconcile_trigger = threading.Event()
+    reconcile_stop = threading.Event()
+    reconcile_thread = threading.Thread(target=reconcile_worker, daemon=True,
+                                        args=(Reconciler(event_queue), reconcile_trigger, reconcile_stop))
+    reconcile_thread.start()
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: reconcile_trigger.set())
 
     try:
         while True:
             time.sleep(settings.SLEEP_DURATION)
     except KeyboardInterrupt:
+        if watch_manager is not None:
+            watch_manager.stop()
         observer.stop()
     observer.join()
 
+    # Stop metrics and reconciliation threads
+    metrics_stop.set()
+    reconcile_stop.set()
+    reconcile_trigger.set()
+
+    # Stop delayed scan thread
+    scheduler.stop()
+    delayed_scan_thread.join()
+
+    # Stop the stability gate, files still changing are found again by the next reconciliation
+    gate.stop()
+    gate_thread.join()
+
+    # Stop claiming jobs, the jobs left on the board are taken by the other replicas
+    coordination_stop.set()
+    if board is not None:
+        coordination_thread.join()
+
     # Stop worker thread
     event_queue.put(None)
     worker_thread.join()
+    if board is not None:
+        board.stop()
 
@@ -1,6 +1,7 @@
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import socket
 
 
 def str_to_bool(target) -> bool:
@@ -38,8 +39,52 @@ MAPPING_FILE = os.environ.get(parse_env("MAPPING_FILE"), "MAPPING.xlsx")
 
 SLEEP_DURATION = int(os.environ.get(parse_env("DELAY_FOR_SCAN"), 1))
 
+STABILITY_PROBE_INTERVAL = float(os.environ.get(parse_env("STABILITY_PROBE_INTERVAL"), 1))
+
+STABILITY_CHECKS = int(os.environ.get(parse_env("STABILITY_CHECKS"), 2))
+
+STABILITY_TIMEOUT = float(os.environ.get(parse_env("STABILITY_TIMEOUT"), 600))
+
+STABILITY_PDF_TIMEOUT = float(os.environ.get(parse_env("STABILITY_PDF_TIMEOUT"), 5))
+
 NUM_WORKER_THREADS = int(os.environ.get(parse_env("NUM_WORKER_THREADS"), 4))
 
+COORDINATION_DIR = os.environ.get(parse_env("COORDINATION_DIR"))
+
+REPLICA_ID = os.environ.get(parse_env("REPLICA_ID"), f"{socket.gethostname()}-{os.getpid()}")
+
+LEASE_TTL = float(os.environ.get(parse_env("LEASE_TTL"), 60))
+
+LEASE_POLL_INTERVAL = float(os.environ.get(parse_env("LEASE_POLL_INTERVAL"), 1))
+
+EVENT_QUEUE_SIZE = int(os.environ.get(parse_env("EVENT_QUEUE_SIZE"), 1000))
+
+WORKER_START_METHOD = os.environ.get(parse_env("WORKER_START_METHOD"), "spawn")
+
+TESSERACT_CMD = os.environ.get(parse_env("TESSERACT_CMD"))
+
+OUTPUT_MODE = os.environ.get(parse_env("OUTPUT_MODE"), "raster")
+
+RASTER_CHUNK_SIZE = int(os.environ.get(parse_env("RASTER_CHUNK_SIZE"), 4))
+
+TEXT_LAYER_ENABLED = str_to_bool(os.environ.get(parse_env("TEXT_LAYER_ENABLED"), True))
+
+WORKBOOK_CACHE_SIZE = int(os.environ.get(parse_env("WORKBOOK_CACHE_SIZE"), 32))
+
+OCR_BACKEND = os.environ.get(parse_env("OCR_BACKEND"), "pytesseract")
+
+OCR_BATCH_SIZE = int(os.environ.get(parse_env("OCR_BATCH_SIZE"), 64))
+
+PIPELINE_DEPTH = int(os.environ.get(parse_env("PIPELINE_DEPTH"), 1))
+
+OCR_DPI = int(os.environ.get(parse_env("OCR_DPI"), 500))
+
+OUTPUT_DPI = int(os.environ.get(parse_env("OUTPUT_DPI"), 500))
+
+TEMPLATE_FILE_NAME = os.environ.get(parse_env("TEMPLATE_FILE_NAME"), "label-template.json")
+
+LABEL_TEMPLATE = os.environ.get(parse_env("LABEL_TEMPLATE"))
+
 PATH_REFERENCE = os.environ.get(parse_env("PATH_REFERENCE"), "mofreitas/clientes/")
 
 WATCHING_DIR = os.environ.get(parse_env("WATCHING_DIR"), BASE_DIR / '/home/app/media/public/mofreitas')
@@ -50,12 +95,61 @@ CUT_LIST_DIR = "Listas de Corte e Etiquetas"
 
 KEYWORD = "clientes"
 
+PATH_CACHE_SIZE = int(os.environ.get(parse_env("PATH_CACHE_SIZE"), 4096))
+
+OBSERVER = os.environ.get(parse_env("OBSERVER"), "native")
+
+POLLING_INTERVAL = float(os.environ.get(parse_env("POLLING_INTERVAL"), 10))
+
+POLLING_DISCOVERY_INTERVAL = float(os.environ.get(parse_env("POLLING_DISCOVERY_INTERVAL"), 300))
+
+WATCH_DISCOVERY_INTERVAL = float(os.environ.get(parse_env("WATCH_DISCOVERY_INTERVAL"), 3600))
+
 LOG_DIR = BASE_DIR.joinpath('logs')
 
 LOG_DIR.mkdir(exist_ok=True, parents=True)
 
+PROFILE_SAMPLE_RATE = float(os.environ.get(parse_env("PROFILE_SAMPLE_RATE"), 0))
+
+PROFILE_MEMORY = str_to_bool(os.environ.get(parse_env("PROFILE_MEMORY"), False))
+
+PROFILE_TOP_N = int(os.environ.get(parse_env("PROFILE_TOP_N"), 20))
+
+PROFILE_DIR = Path(os.environ.get(parse_env("PROFILE_DIR"), LOG_DIR.joinpath('profiles')))
+
+STATE_DIR = Path(os.environ.get(parse_env("STATE_DIR"), BASE_DIR.joinpath('state')))
+
+STATE_DIR.mkdir(exist_ok=True, parents=True)
+
+MANIFEST_FILE = STATE_DIR.joinpath('manifest.sqlite3')
+
+RECONCILE_INDEX_FILE = STATE_DIR.joinpath('reconcile.sqlite3')
+
+RECONCILE_ON_STARTUP = str_to_bool(os.environ.get(parse_env("RECONCILE_ON_STARTUP"), True))
+
+RECONCILE_INTERVAL = int(os.environ.get(parse_env("RECONCILE_INTERVAL"), 0))
+
+RECONCILE_WORKERS = int(os.environ.get(parse_env("RECONCILE_WORKERS"), 16))
+
+OCR_CACHE_ENABLED = str_to_bool(os.environ.get(parse_env("OCR_CACHE_ENABLED"), True))
+
+OCR_CACHE_SIZE = int(os.environ.get(parse_env("OCR_CACHE_SIZE"), 100000))
+
+OCR_CACHE_FILE = STATE_DIR.joinpath('ocr-cache.sqlite3')
+
+METRICS_HOST = os.environ.get(parse_env("METRICS_HOST"), "127.0.0.1")
+
+METRICS_PORT = int(os.environ.get(parse_env("METRICS_PORT"), 0))
+
+METRICS_LOG_INTERVAL = int(os.environ.get(parse_env("METRICS_LOG_INTERVAL"), 300))
+
+LOG_LEVEL = os.environ.get(parse_env("LOG_LEVEL"), "INFO").upper()
+
+LOG_RATE_LIMIT = float(os.environ.get(parse_env("LOG_RATE_LIMIT"), 10))
+
 LOGGER = {
     "version": 1,
+    "disable_existing_loggers": False,
     "formatters": {
         "simple": {
             "format": "%(asctime)s - level: %(levelname)s - loc: %(name)s - func: %(funcName)s - msg: %(message)s"
@@ -77,18 +171,8 @@ LOGGER = {
             "formatter": "simple"
         }
     },
-    "loggers": {
-        "utilities": {
-            "level": "DEBUG",
-            "handlers": [
-                "console",
-                "file"
-            ],
-            "propagate": True
-        }
-    },
     "root": {
-        "level": "DEBUG",
+        "level": LOG_LEVEL,
         "handlers": [
             "console",
             "file"
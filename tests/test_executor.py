@@ -0,0 +1,167 @@
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from watchdog.events import FileCreatedEvent
+
+from utilities.executor import JobExecutor
+
+REPORT = {"status": "processed", "pages": 0, "duration": 0.0, "stages": {}, "counters": {}}
+
+
+class ThreadJobExecutor(JobExecutor):
+    """
+    Runs the jobs on threads, so `run_job` can be replaced by a fake in the test process.
+    """
+
+    def __init__(self, max_workers: int, pools=None) -> None:
+        self.pools = list(pools or [])
+        self.created = 0
+        super().__init__(max_workers=max_workers)
+
+    def _create_pool(self):
+        self.created += 1
+        return self.pools.pop(0) if self.pools else ThreadPoolExecutor(max_workers=self.max_workers)
+
+
+class BrokenPool:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("A worker process died.")
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class FailingPool(ThreadPoolExecutor):
+    """
+    Accepts `accepted` jobs, then fails like a pool that was shut down.
+    """
+
+    def __init__(self, accepted: int) -> None:
+        super().__init__(max_workers=4)
+        self.accepted = accepted
+
+    def submit(self, *args, **kwargs):
+        if self.accepted <= 0:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        self.accepted -= 1
+        return super().submit(*args, **kwargs)
+
+
+class FakeJobs:
+    """
+    Fake `run_job` recording the events it runs and how many jobs of a key run at once. Jobs block until released.
+    """
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+        self.started = []
+        self.running = {}
+        self.max_running = {}
+        self._lock = threading.Lock()
+        self._started = threading.Condition(self._lock)
+
+    def __call__(self, event_type, event):
+        key = event.src_path
+        with self._lock:
+            self.started.append(event)
+            self.running[key] = self.running.get(key, 0) + 1
+            self.max_running[key] = max(self.max_running.get(key, 0), self.running[key])
+            self._started.notify_all()
+        self.release.wait(5)
+        with self._lock:
+            self.running[key] -= 1
+        return dict(REPORT)
+
+    def wait_started(self, count: int) -> None:
+        with self._started:
+            if not self._started.wait_for(lambda: len(self.started) >= count, timeout=5):
+                raise AssertionError(f"Only {len(self.started)} of {count} jobs started.")
+
+
+class JobExecutorTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.jobs = FakeJobs()
+        patcher = mock.patch("utilities.executor.run_job", self.jobs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def make_event(self, name: str) -> FileCreatedEvent:
+        return FileCreatedEvent(os.path.join(os.path.realpath(self.directory.name), name))
+
+    def test_events_of_a_running_key_are_parked_and_the_latest_wins(self):
+        executor = ThreadJobExecutor(max_workers=4)
+        first, second, third = (self.make_event("a.xlsx") for _ in range(3))
+        superseded = mock.Mock()
+        executor.submit('created', first)
+        self.jobs.wait_started(1)
+        executor.submit('modified', second, callback=superseded)
+        executor.submit('modified', third)
+        superseded.assert_called_once_with()
+        self.assertEqual(executor.running_count(), 1)
+
+        self.jobs.release.set()
+        executor.shutdown()
+        self.assertEqual(len(self.jobs.started), 2)
+        self.assertIs(self.jobs.started[0], first)
+        self.assertIs(self.jobs.started[1], third)
+        self.assertEqual(self.jobs.max_running[first.src_path], 1)
+
+    def test_different_keys_run_concurrently(self):
+        executor = ThreadJobExecutor(max_workers=2)
+        executor.submit('created', self.make_event("a.xlsx"))
+        executor.submit('created', self.make_event("b.xlsx"))
+        self.jobs.wait_started(2)
+        self.assertEqual(executor.running_count(), 2)
+        self.jobs.release.set()
+        executor.shutdown()
+
+    def test_submit_blocks_while_every_worker_is_busy(self):
+        executor = ThreadJobExecutor(max_workers=1)
+        executor.submit('created', self.make_event("a.xlsx"))
+        self.jobs.wait_started(1)
+        submitted = threading.Event()
+
+        def submit():
+            executor.submit('created', self.make_event("b.xlsx"))
+            submitted.set()
+
+        threading.Thread(target=submit).start()
+        self.assertFalse(submitted.wait(0.2))
+        self.jobs.release.set()
+        self.assertTrue(submitted.wait(5))
+        executor.shutdown()
+        self.assertEqual(len(self.jobs.started), 2)
+
+    def test_broken_pool_is_replaced(self):
+        executor = ThreadJobExecutor(max_workers=2, pools=[BrokenPool()])
+        self.jobs.release.set()
+        executor.submit('created', self.make_event("a.xlsx"))
+        executor.shutdown()
+        self.assertEqual(executor.created, 2)
+        self.assertEqual(len(self.jobs.started), 1)
+
+    def test_shutdown_returns_when_a_parked_job_cannot_be_restarted(self):
+        executor = ThreadJobExecutor(max_workers=2, pools=[FailingPool(accepted=1)])
+        completed = mock.Mock()
+        executor.submit('created', self.make_event("a.xlsx"))
+        self.jobs.wait_started(1)
+        executor.submit('modified', self.make_event("a.xlsx"), callback=completed)
+        self.jobs.release.set()
+        shutdown = threading.Thread(target=executor.shutdown)
+        shutdown.start()
+        shutdown.join(5)
+        self.assertFalse(shutdown.is_alive())
+        completed.assert_called_once_with()
+        self.assertEqual(len(self.jobs.started), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from utilities.leases import LeaseBoard, get_job_id
+
+
+class LeaseBoardTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.board_dir = Path(self.directory.name) / "board"
+        self.excel_path = Path(os.path.realpath(self.directory.name)) / "a.xlsx"
+        self.first = LeaseBoard(self.board_dir, owner="first", ttl=60)
+        self.second = LeaseBoard(self.board_dir, owner="second", ttl=60)
+
+    def expire(self, job_id: str) -> None:
+        expired_at = time.time() - 120
+        os.utime(self.first.get_lease_path(job_id), (expired_at, expired_at))
+
+    def test_a_held_lease_cannot_be_acquired(self):
+        self.assertTrue(self.first.acquire("job"))
+        self.assertFalse(self.second.acquire("job"))
+        self.first.release("job")
+        self.assertTrue(self.second.acquire("job"))
+
+    def test_an_expired_lease_is_broken(self):
+        self.assertTrue(self.first.acquire("job"))
+        self.expire("job")
+        self.assertTrue(self.second.acquire("job"))
+        self.assertEqual(self.second.read_lease(self.second.get_lease_path("job"))["owner"], "second")
+        # The first replica notices it lost the lease and does not remove the new one.
+        self.first.heartbeat()
+        self.first.release("job")
+        self.assertTrue(self.second.get_lease_path("job").exists())
+        self.assertEqual(list(self.board_dir.joinpath("leases").glob("*.expired")), [])
+
+    def test_published_jobs_are_claimed_once_and_the_latest_event_wins(self):
+        self.first.publish('created', self.excel_path)
+        self.first.publish('modified', self.excel_path)
+        jobs = self.first.claim(limit=4)
+        self.assertEqual([(job.job_id, job.event_type) for job in jobs], [(get_job_id(str(self.excel_path)),
+                                                                          'modified')])
+        self.assertEqual(self.second.claim(limit=4), [])
+        self.first.complete(jobs[0].job_id)
+        self.assertEqual(list(self.board_dir.joinpath("jobs").iterdir()), [])
+        self.assertEqual(list(self.board_dir.joinpath("leases").iterdir()), [])
+
+    def test_running_job_of_an_expired_replica_is_taken_over(self):
+        self.first.publish('created', self.excel_path)
+        job, = self.first.claim(limit=1)
+        self.assertEqual(self.second.claim(limit=1), [])
+        self.expire(job.job_id)
+        taken, = self.second.claim(limit=1)
+        self.assertEqual(taken.job_id, job.job_id)
+        self.assertEqual(taken.path, str(self.excel_path))
+        self.assertFalse(self.first.get_running_path(job.job_id).exists())
+        self.assertTrue(self.second.get_running_path(job.job_id).exists())
+
+    def test_jobs_interrupted_by_a_shutdown_are_published_again(self):
+        self.first.publish('created', self.excel_path)
+        job, = self.first.claim(limit=1)
+        restarted = LeaseBoard(self.board_dir, owner="first", ttl=60)
+        restarted.start()
+        restarted.stop()
+        self.assertFalse(restarted.get_running_path(job.job_id).exists())
+        self.assertTrue(self.board_dir.joinpath("jobs", f"{job.job_id}.json").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from utilities.manifest import JobKey, Manifest
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.root = Path(self.directory.name)
+        self.manifest = Manifest(self.root / "manifest.sqlite3")
+        self.excel_path = self.root / "a.xlsx"
+        self.pdf_path = self.root / "a_ETQs.pdf"
+        self.output_path = self.root / "a_ETQs_output.pdf"
+        self.excel_path.write_bytes(b"workbook")
+        self.pdf_path.write_bytes(b"labels")
+        self.output_path.write_bytes(b"output")
+
+    def get_key(self) -> JobKey:
+        return self.manifest.get_job_key(excel_path=self.excel_path, pdf_path=self.pdf_path, config={"dpi": 500})
+
+    def test_digest_is_reused_while_size_and_mtime_are_unchanged(self):
+        digest = self.manifest.get_file_digest(self.excel_path)
+        stat = self.excel_path.stat()
+        self.excel_path.write_bytes(b"WORKBOOK")
+        os.utime(self.excel_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self.manifest.get_file_digest(self.excel_path), digest)
+        os.utime(self.excel_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(self.manifest.get_file_digest(self.excel_path), digest)
+
+    def test_recorded_output_is_up_to_date_until_an_input_changes(self):
+        key = self.get_key()
+        self.assertFalse(self.manifest.is_up_to_date(self.output_path, key))
+        self.manifest.record(self.output_path, key)
+        self.assertTrue(self.manifest.is_up_to_date(self.output_path, key))
+        # A re-save with the same content is still up to date.
+        os.utime(self.excel_path, ns=(0, self.excel_path.stat().st_mtime_ns + 10 ** 9))
+        self.assertTrue(self.manifest.is_up_to_date(self.output_path, self.get_key()))
+        self.excel_path.write_bytes(b"changed")
+        self.assertFalse(self.manifest.is_up_to_date(self.output_path, self.get_key()))
+        self.assertNotEqual(self.get_key().excel_digest, key.excel_digest)
+
+    def test_changed_or_missing_output_is_not_up_to_date(self):
+        key = self.get_key()
+        self.manifest.record(self.output_path, key)
+        self.output_path.write_bytes(b"edited by hand")
+        self.assertIsNone(self.manifest.get_recorded_key(self.output_path))
+        self.manifest.record(self.output_path, key)
+        self.output_path.unlink()
+        self.assertFalse(self.manifest.is_up_to_date(self.output_path, key))
+
+    def test_pages_are_recorded_with_the_output(self):
+        key = self.get_key()
+        self.manifest.record(self.output_path, key, pages=[("PAINEL_1", 3), ("PAINEL_2", None)])
+        self.assertEqual(self.manifest.get_pages(self.output_path), [("PAINEL_1", 3), ("PAINEL_2", None)])
+        self.manifest.record(self.output_path, key)
+        self.assertIsNone(self.manifest.get_pages(self.output_path))
+
+    def test_records_are_shared_between_replicas(self):
+        shared_dir = self.root / "coordination" / "outputs"
+        first = Manifest(self.root / "first.sqlite3", shared_dir=shared_dir)
+        second = Manifest(self.root / "second.sqlite3", shared_dir=shared_dir)
+        key = first.get_job_key(excel_path=self.excel_path, pdf_path=self.pdf_path, config={"dpi": 500})
+        first.record(self.output_path, key, pages=[("PAINEL_1", 3)])
+        self.assertTrue(second.is_up_to_date(self.output_path, key))
+        self.assertEqual(second.get_pages(self.output_path), [("PAINEL_1", 3)])
+        self.assertEqual([path.name for path in shared_dir.iterdir() if path.name.startswith(".")], [])
+        # An output rewritten by another replica is no longer up to date for the first one either.
+        self.output_path.write_bytes(b"rewritten")
+        second.record(self.output_path, key._replace(excel_digest="other"))
+        self.assertNotEqual(first.get_recorded_key(self.output_path), key)
+        self.assertIsNone(first.get_pages(self.output_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import queue
+import tempfile
+import unittest
+from pathlib import Path
+
+import settings
+from utilities import functions
+from utilities.manifest import Manifest
+from utilities.reconcile import DirectoryIndex, Reconciler
+from utilities.work_queue import WorkQueue
+
+
+class ReconcilerTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        base = Path(os.path.realpath(self.directory.name))
+        self.root = base / "clientes"
+        self.cut_list_dir = self.root / "client" / "project" / "briefing" / settings.CUT_LIST_DIR
+        self.cut_list_dir.joinpath("CORRECTED").mkdir(parents=True)
+        self.manifest = Manifest(base / "manifest.sqlite3")
+        self.event_queue = WorkQueue(maxsize=10)
+        self.reconciler = Reconciler(self.event_queue, root=self.root, workers=2,
+                                     index=DirectoryIndex(base / "index.sqlite3"), manifest=self.manifest)
+
+    def make_pair(self, name: str, processed: bool = True) -> Path:
+        excel_path = self.cut_list_dir / f"{name}.xlsx"
+        pdf_path = functions.get_pdf_path(excel_path=excel_path)
+        excel_path.write_bytes(b"workbook")
+        pdf_path.write_bytes(b"labels")
+        if processed:
+            output_path = functions.get_output_path(pdf_path)
+            output_path.write_bytes(b"output")
+            self.manifest.record(output_path, self.manifest.get_job_key(excel_path, pdf_path, config={"dpi": 500}))
+        return excel_path
+
+    def drain(self) -> list:
+        paths = []
+        while True:
+            try:
+                paths.append(self.event_queue.get(block=False)[1].src_path)
+            except queue.Empty:
+                return paths
+
+    @staticmethod
+    def resave(excel_path: Path, content: bytes) -> None:
+        excel_path.write_bytes(content)
+        output_path = functions.get_output_path(functions.get_pdf_path(excel_path=excel_path))
+        mtime_ns = output_path.stat().st_mtime_ns + 10 ** 9
+        os.utime(excel_path, ns=(mtime_ns, mtime_ns))
+
+    def test_second_pass_over_an_unchanged_tree_enqueues_nothing(self):
+        self.make_pair("a")
+        missing = self.make_pair("b", processed=False)
+        self.assertEqual(self.reconciler.run(), 1)
+        self.assertEqual(self.drain(), [str(missing)])
+        functions.get_output_path(functions.get_pdf_path(excel_path=missing)).write_bytes(b"output")
+        self.assertEqual(self.reconciler.run(), 0)
+        self.assertEqual(self.reconciler.run(), 0)
+        self.assertEqual(self.drain(), [])
+
+    def test_resave_without_changes_is_not_stale(self):
+        excel_path = self.make_pair("a")
+        self.assertEqual(self.reconciler.run(), 0)
+        # The output is now older than the workbook, but the manifest knows the content did not change.
+        self.resave(excel_path, b"workbook")
+        self.assertEqual(self.reconciler.run(force=True), 0)
+        self.assertEqual(self.reconciler.run(), 0)
+        self.resave(excel_path, b"changed")
+        self.assertEqual(self.reconciler.run(force=True), 1)
+        self.assertEqual(self.drain(), [str(excel_path)])
+
+    def test_output_unknown_to_the_manifest_is_stale_when_older_than_its_inputs(self):
+        excel_path = self.make_pair("a")
+        output_path = functions.get_output_path(functions.get_pdf_path(excel_path=excel_path))
+        output_path.write_bytes(b"written by another version")
+        os.utime(output_path, ns=(0, 0))
+        self.assertEqual(self.reconciler.run(), 1)
+        self.assertEqual(self.drain(), [str(excel_path)])
+
+
+if __name__ == "__main__":
+    unittest.main()
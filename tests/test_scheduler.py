@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+from utilities.scheduler import DebounceScheduler
+
+
+class DebounceSchedulerTest(unittest.TestCase):
+
+    def test_key_is_released_once_after_being_quiet(self):
+        scheduler = DebounceScheduler(delay=0.2)
+        scheduler.schedule("a")
+        time.sleep(0.1)
+        scheduler.schedule("a")
+        started_at = time.monotonic()
+        self.assertEqual(scheduler.pop_due(), ["a"])
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.15)
+        self.assertEqual(len(scheduler), 0)
+
+    def test_due_keys_are_released_together(self):
+        scheduler = DebounceScheduler(delay=10)
+        scheduler.schedule("a", delay=0)
+        scheduler.schedule("b", delay=0)
+        scheduler.schedule("c")
+        self.assertEqual(sorted(scheduler.pop_due()), ["a", "b"])
+        self.assertIn("c", scheduler)
+
+    def test_run_returns_once_stopped(self):
+        scheduler = DebounceScheduler(delay=0)
+        released = []
+        thread = threading.Thread(target=scheduler.run, args=(released.append,))
+        thread.start()
+        scheduler.schedule("a")
+        deadline = time.monotonic() + 5
+        while not released and time.monotonic() < deadline:
+            time.sleep(0.01)
+        scheduler.stop()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(released, ["a"])
+
+    def test_callback_errors_do_not_stop_the_scheduler(self):
+        scheduler = DebounceScheduler(delay=0)
+        released = []
+
+        def callback(key):
+            released.append(key)
+            if key == "a":
+                raise ValueError(key)
+
+        thread = threading.Thread(target=scheduler.run, args=(callback,))
+        thread.start()
+        scheduler.schedule("a")
+        scheduler.schedule("b", delay=0.05)
+        deadline = time.monotonic() + 5
+        while len(released) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        scheduler.stop()
+        thread.join(5)
+        self.assertEqual(released, ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
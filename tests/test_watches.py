@@ -0,0 +1,140 @@
+import errno
+import os
+import queue
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from watchdog.events import FileSystemEventHandler
+
+import settings
+from utilities import inotify
+from utilities.inotify import SharedInotifyObserver
+from utilities.watches import CUT_LIST, PARENT, WatchManager
+
+CLIENTS = 100
+
+PROJECTS = 2
+
+
+class RecordingHandler(FileSystemEventHandler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.events = queue.Queue()
+        self.scanned = []
+
+    def on_any_event(self, event):
+        self.events.put(event)
+
+    def add_to_dir_queue(self, path: Path):
+        self.scanned.append(path)
+
+
+class FailingObserver:
+    """
+    Observer whose non-recursive watches each open an inotify instance, failing like Linux once `limit` are open.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.scheduled = {}
+
+    def schedule(self, event_handler, path, recursive=False):
+        if not recursive and len(self.scheduled) >= self.limit:
+            raise OSError(errno.EMFILE, "inotify instance limit reached")
+        watch = object()
+        self.scheduled[watch] = (path, recursive)
+        return watch
+
+    def unschedule(self, watch):
+        del self.scheduled[watch]
+
+
+def make_tree(root: str) -> list:
+    cut_lists = []
+    for client in range(CLIENTS):
+        for project in range(PROJECTS):
+            path = os.path.join(root, f"client-{client}", f"project-{project}", "briefing", settings.CUT_LIST_DIR)
+            os.makedirs(path)
+            os.makedirs(os.path.join(root, f"client-{client}", f"project-{project}", "desenhos"))
+            cut_lists.append(path)
+    return cut_lists
+
+
+@mock.patch.object(WatchManager, "load_index", lambda self: {})
+class WatchManagerTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.realpath(self.directory.name)
+        self.cut_lists = make_tree(self.root)
+        self.handler = RecordingHandler()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def wait_for_event(self, path: str):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                event = self.handler.events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if event.src_path == path:
+                return event
+        self.fail(f"No event for '{path}'.")
+
+    @unittest.skipUnless(sys.platform.startswith("linux") and inotify.is_supported(), "inotify is Linux only")
+    def test_shared_instance_watches_more_directories_than_instances(self):
+        observer = SharedInotifyObserver()
+        observer.start()
+        manager = WatchManager(observer, self.handler, root=self.root, delay=0.1, interval=0)
+        try:
+            manager.start()
+            self.assertGreater(manager.count(CUT_LIST), 128)
+            self.assertEqual(manager.count(CUT_LIST), len(self.cut_lists))
+            # The root, the clients, the projects and their 'briefing' directories, but not 'desenhos'.
+            self.assertEqual(manager.count(PARENT), 1 + CLIENTS * (1 + PROJECTS * 2))
+            self.assertEqual(len(observer.emitters), 1)
+            self.assertEqual(len(next(iter(observer.emitters))), len(manager))
+
+            path = os.path.join(self.cut_lists[-1], "workbook.xlsx")
+            Path(path).touch()
+            self.assertEqual(self.wait_for_event(path).event_type, "created")
+        finally:
+            manager.stop()
+            observer.stop()
+            observer.join()
+
+    @unittest.skipUnless(sys.platform.startswith("linux") and inotify.is_supported(), "inotify is Linux only")
+    def test_new_cut_list_is_watched_and_scanned(self):
+        observer = SharedInotifyObserver()
+        observer.start()
+        manager = WatchManager(observer, self.handler, root=self.root, delay=0.1, interval=0)
+        try:
+            manager.start()
+            cut_list = os.path.join(self.root, "client-0", "project-9", "briefing", settings.CUT_LIST_DIR)
+            os.makedirs(cut_list)
+            deadline = time.monotonic() + 5
+            while manager.get_kind(cut_list) != CUT_LIST and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(manager.get_kind(cut_list), CUT_LIST)
+            self.assertIn(Path(cut_list), self.handler.scanned)
+        finally:
+            manager.stop()
+            observer.stop()
+            observer.join()
+
+    def test_falls_back_to_recursive_watch_when_instances_run_out(self):
+        observer = FailingObserver(limit=128)
+        manager = WatchManager(observer, self.handler, root=self.root, delay=0.1, interval=0)
+        manager.discover()
+        self.assertEqual(list(observer.scheduled.values()), [(self.root, True)])
+        self.assertEqual(len(manager), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
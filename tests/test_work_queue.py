@@ -0,0 +1,76 @@
+import os
+import queue
+import tempfile
+import threading
+import unittest
+
+from watchdog.events import FileCreatedEvent
+
+from utilities.work_queue import PRIORITY_BACKFILL, PRIORITY_LIVE, WorkQueue
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def make_item(self, name: str, event_type: str = 'created'):
+        return event_type, FileCreatedEvent(os.path.join(os.path.realpath(self.directory.name), name))
+
+    def test_pending_items_of_a_path_are_coalesced(self):
+        work_queue = WorkQueue(maxsize=10)
+        work_queue.put(self.make_item("a.xlsx"))
+        latest = self.make_item("a.xlsx", 'modified')
+        work_queue.put(latest)
+        self.assertEqual(work_queue.qsize(), 1)
+        self.assertIs(work_queue.get(block=False), latest)
+        self.assertRaises(queue.Empty, work_queue.get, block=False)
+
+    def test_live_items_come_before_backfill_items(self):
+        work_queue = WorkQueue(maxsize=10)
+        backfill = self.make_item("a.xlsx")
+        live = self.make_item("b.xlsx")
+        work_queue.put(backfill, priority=PRIORITY_BACKFILL)
+        work_queue.put(live, priority=PRIORITY_LIVE)
+        self.assertIs(work_queue.get(block=False), live)
+        self.assertIs(work_queue.get(block=False), backfill)
+
+    def test_coalesced_item_keeps_the_more_urgent_priority(self):
+        work_queue = WorkQueue(maxsize=10)
+        work_queue.put(self.make_item("a.xlsx"), priority=PRIORITY_BACKFILL)
+        work_queue.put(self.make_item("b.xlsx"), priority=PRIORITY_BACKFILL)
+        promoted = self.make_item("b.xlsx")
+        work_queue.put(promoted, priority=PRIORITY_LIVE)
+        self.assertIs(work_queue.get(block=False), promoted)
+        self.assertEqual(work_queue.get(block=False)[1].src_path, self.make_item("a.xlsx")[1].src_path)
+        self.assertRaises(queue.Empty, work_queue.get, block=False)
+
+    def test_same_priority_items_come_in_arrival_order(self):
+        work_queue = WorkQueue(maxsize=10)
+        items = [self.make_item(f"{name}.xlsx") for name in "cab"]
+        for item in items:
+            work_queue.put(item)
+        self.assertEqual([work_queue.get(block=False) for _ in items], items)
+
+    def test_new_paths_block_while_full(self):
+        work_queue = WorkQueue(maxsize=1)
+        work_queue.put(self.make_item("a.xlsx"))
+        self.assertRaises(queue.Full, work_queue.put, self.make_item("b.xlsx"), block=False)
+        # A pending path can still be replaced.
+        work_queue.put(self.make_item("a.xlsx"), block=False)
+        threading.Timer(0.1, work_queue.get).start()
+        work_queue.put(self.make_item("b.xlsx"), timeout=5)
+        self.assertEqual(work_queue.qsize(), 1)
+
+    def test_none_stops_the_consumer_once_drained(self):
+        work_queue = WorkQueue(maxsize=10)
+        item = self.make_item("a.xlsx")
+        work_queue.put(item)
+        work_queue.put(None)
+        self.assertIs(work_queue.get(), item)
+        self.assertIsNone(work_queue.get())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Admission of workbooks into the event queue once they and their '_ETQs.pdf' file have finished being written.
+
+Saving a workbook, locally or through a network share, is a sequence of writes and renames, and large files are copied
+in many writes. A workbook is only admitted once the size and mtime of both the workbook and its paired PDF file were
+the same on `STABILITY_CHECKS` consecutive probes, `STABILITY_PROBE_INTERVAL` seconds apart, and neither was modified
+within the last probe interval. Workbooks whose PDF file is still missing after `STABILITY_PDF_TIMEOUT` seconds, and
+workbooks still changing after `STABILITY_TIMEOUT` seconds, are dropped, like workbooks deleted while they were probed.
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import settings
+from utilities import functions
+from utilities.scheduler import DebounceScheduler
+from utilities.work_queue import PRIORITY_LIVE, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+# (size, mtime_ns) of the workbook and of the PDF file, None for a missing file.
+FileState = Optional[Tuple[int, int]]
+
+
+class Candidate(NamedTuple):
+    event: object
+    event_type: str
+    priority: int
+    first_seen: float
+    state: Tuple[FileState, FileState]
+    checks: int
+
+
+def get_file_state(path: Path) -> FileState:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class StabilityGate:
+    """
+    Holds workbooks back until they are stable, see the module docstring, then puts them in the event queue. Probes are
+    scheduled on a `DebounceScheduler`, so a new event for a workbook being probed starts its checks over.
+
+    Example:
+        gate = StabilityGate(event_queue)
+        threading.Thread(target=gate.run).start()
+        gate.submit(FileCreatedEvent(excel_path))
+        gate.stop()
+    """
+
+    def __init__(self, event_queue: WorkQueue, interval: Optional[float] = None, checks: Optional[int] = None,
+                 timeout: Optional[float] = None, pdf_timeout: Optional[float] = None) -> None:
+        self.event_queue = event_queue
+        self.interval = settings.STABILITY_PROBE_INTERVAL if interval is None else interval
+        self.checks = settings.STABILITY_CHECKS if checks is None else checks
+        self.timeout = settings.STABILITY_TIMEOUT if timeout is None else timeout
+        self.pdf_timeout = settings.STABILITY_PDF_TIMEOUT if pdf_timeout is None else pdf_timeout
+        self.scheduler = DebounceScheduler(delay=self.interval)
+        self._candidates: Dict[str, Candidate] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._candidates)
+
+    def submit(self, event, event_type: str = 'created', priority: int = PRIORITY_LIVE) -> None:
+        """
+        Starts probing a workbook, or starts its checks over if it is already being probed.
+        """
+        key = str(functions.validate_path(event.src_path))
+        with self._lock:
+            previous = self._candidates.get(key)
+            first_seen = previous.first_seen if previous is not None else time.monotonic()
+            self._candidates[key] = Candidate(event=event, event_type=event_type, priority=priority,
+                                              first_seen=first_seen, state=(None, None), checks=0)
+        self.scheduler.schedule(key)
+
+    def probe(self, key: str) -> None:
+        excel_path = Path(key)
+        state = (get_file_state(excel_path), get_file_state(functions.get_pdf_path(excel_path=excel_path)))
+        with self._lock:
+            candidate = self._candidates.get(key)
+            if candidate is None:
+                return
+            if state[0] is None:
+                logger.info(f"Dropping '{excel_path.name}', it was removed before it was stable.")
+                del self._candidates[key]
+                return
+            elapsed = time.monotonic() - candidate.first_seen
+            if state[1] is None and elapsed >= self.pdf_timeout:
+                logger.error(f"PDF path '{functions.get_pdf_path(excel_path=excel_path)}' does not exist!")
+                del self._candidates[key]
+                return
+            if elapsed > self.timeout:
+                logger.warning(f"Dropping '{excel_path.name}', it was still changing after {self.timeout}s.")
+                del self._candidates[key]
+                return
+            checks = candidate.checks + 1 if state == candidate.state and state[1] is not None else 1
+            if checks < self.checks or self.is_recent(state):
+                self._candidates[key] = candidate._replace(state=state, checks=checks)
+                admitted = None
+            else:
+                admitted = self._candidates.pop(key)
+        if admitted is None:
+            self.scheduler.schedule(key)
+            return
+        logger.debug(f"'{excel_path.name}' is stable after {time.monotonic() - admitted.first_seen:.1f}s.")
+        self.event_queue.put((admitted.event_type, admitted.event), priority=admitted.priority)
+
+    def is_recent(self, state: Tuple[FileState, FileState]) -> bool:
+        """
+        Whether a file was modified within the last probe interval, which the mtime resolution of network shares can
+        hide from the size and mtime comparison.
+        """
+        now_ns = time.time_ns()
+        return any(file_state is not None and now_ns - file_state[1] < self.interval * 10 ** 9
+                   for file_state in state)
+
+    def run(self) -> None:
+        """
+        Probes the workbooks as their probes come due, until the gate is stopped.
+        """
+        self.scheduler.run(self.probe)
+
+    def stop(self) -> None:
+        self.scheduler.stop()
@@ -0,0 +1,139 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Callable, Dict, Optional, Tuple
+
+import settings
+from utilities import functions, logs, metrics
+
+logger = logging.getLogger(__name__)
+
+
+def run_job(event_type: str, event) -> dict:
+    """
+    Entry point of a job in a worker process. The pipeline and its heavy dependencies are imported here, so that only
+    the worker processes ever load them. Returns the job report, see `metrics.job`.
+    """
+    from utilities import task
+    return task.process_event(event_type, event)
+
+
+class JobExecutor:
+    """
+    Runs label jobs on a pool of worker processes.
+
+    The tesseract pipeline is CPU-bound and holds the GIL in openpyxl and img2pdf, so jobs are dispatched to separate
+    processes instead of threads. Jobs are keyed by the resolved Excel path, which also identifies the paired
+    '_ETQs.pdf', and the executor guarantees that no two jobs for the same key run at once: an event that arrives while
+    its key is running is parked and re-submitted when the running job finishes, the latest event winning.
+
+    The number of jobs in flight is capped at the pool size, so any backlog stays in the caller's queue instead of the
+    pool's internal one.
+
+    Example:
+        executor = JobExecutor(max_workers=4)
+        executor.submit('created', event)
+        executor.shutdown()
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers = max_workers or settings.NUM_WORKER_THREADS
+        self._condition = threading.Condition(threading.RLock())
+        self._running: Dict[str, Future] = {}
+        self._pending: Dict[str, Tuple[str, object, Optional[Callable[[], None]]]] = {}
+        self._closed = False
+        self._pool = self._create_pool()
+        logger.info(f"Job executor started with {self.max_workers} worker processes "
+                    f"({settings.WORKER_START_METHOD}).")
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        context = multiprocessing.get_context(settings.WORKER_START_METHOD)
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context, initializer=logs.configure_worker,
+                                   initargs=logs.get_worker_args())
+
+    @staticmethod
+    def get_job_key(event) -> str:
+        return str(functions.validate_path(event.src_path))
+
+    def submit(self, event_type: str, event, callback: Optional[Callable[[], None]] = None) -> None:
+        """
+        Submits an event for processing, blocking while every worker is busy.
+
+        Args:
+            event_type (str): The type of the event, e.g. 'created'.
+            event: The watchdog event whose 'src_path' points to the Excel file.
+            callback (Callable[[], None], optional): Called once the job finished, or once a newer event replaced this
+            one while it was parked.
+        """
+        key = self.get_job_key(event)
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Cannot submit jobs after shutdown.")
+                if key in self._running:
+                    logger.debug(f"Job for '{key}' is running, parking the new event.")
+                    superseded = self._pending.get(key)
+                    self._pending[key] = (event_type, event, callback)
+                    if superseded is not None and superseded[2] is not None:
+                        superseded[2]()
+                    return
+                if len(self._running) < self.max_workers:
+                    break
+                self._condition.wait()
+            self._start(key, event_type, event, callback)
+
+    def _start(self, key: str, event_type: str, event, callback: Optional[Callable[[], None]] = None) -> None:
+        try:
+            future = self._pool.submit(run_job, event_type, event)
+        except BrokenProcessPool:
+            logger.error("Worker pool is broken, restarting it.")
+            self._pool = self._create_pool()
+            future = self._pool.submit(run_job, event_type, event)
+        self._running[key] = future
+        future.add_done_callback(partial(self._on_done, key, callback))
+
+    def _on_done(self, key: str, callback: Optional[Callable[[], None]], future: Future) -> None:
+        exception = future.exception()
+        if exception is not None:
+            logger.error(f"Job for '{key}' failed: {exception!r}")
+            metrics.record_job(None)
+        else:
+            metrics.record_job(future.result())
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Completion callback of '{key}' failed: {e!r}")
+        with self._condition:
+            self._running.pop(key, None)
+            parked = self._pending.pop(key, None)
+            try:
+                if parked is not None:
+                    self._start(key, *parked)
+            except Exception as e:
+                logger.error(f"Cannot restart the parked job for '{key}', dropping it: {e!r}")
+                if parked[2] is not None:
+                    try:
+                        parked[2]()
+                    except Exception as callback_error:
+                        logger.error(f"Completion callback of '{key}' failed: {callback_error!r}")
+            finally:
+                self._condition.notify_all()
+
+    def running_count(self) -> int:
+        with self._condition:
+            return len(self._running)
+
+    def shutdown(self) -> None:
+        """
+        Waits for running and parked jobs to finish and stops the worker processes.
+        """
+        with self._condition:
+            self._closed = True
+            while self._running or self._pending:
+                self._condition.wait()
+        self._pool.shutdown(wait=True)
+        logger.info("Job executor stopped.")
@@ -1,7 +1,12 @@
+import functools
 import logging
+import os
 import re
+import shutil
+import threading
+from collections import OrderedDict
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 import settings
 
 logger = logging.getLogger(__name__)
@@ -22,25 +27,96 @@ def get_pdf_path(excel_path: Path) -> Path:
     return excel_path.with_name(pdf_name)
 
 
+def get_excel_path(pdf_path: Path) -> Path:
+    excel_name = pdf_path.name[:-len("_ETQs.pdf")] + ".xlsx"
+    return pdf_path.with_name(excel_name)
+
+
+def get_output_path(pdf_path: Path) -> Path:
+    return pdf_path.parent / "CORRECTED" / f"{pdf_path.stem}_output.pdf"
+
+
 def verify(source_path: Path) -> bool:
     """
     Verifies if the given source path contains the specified reference as one of its parts and
     if it is not a directory.
 
-    This function takes a path and a reference string as input. It first checks if the source_path
-    is a directory, and if so, returns False. It then checks if the reference string is part of the path.
-    If it is, the function traverses up the path to confirm if any part of the path matches the reference string.
+    This function takes a path as input. It first checks if the reference string is part of the path, which needs no
+    filesystem access, and only then checks if the source_path is a directory, and if so, returns False.
 
     :param source_path: A Path object representing the source path to be verified.
     :return: True if the source path contains the reference and is not a directory, False otherwise.
     """
-    if source_path.is_dir():
-        return False
     if settings.CUT_LIST_DIR not in source_path.parts:
         return False
-    current_path = Path(*source_path.parts[source_path.parts.index(settings.CUT_LIST_DIR):])
-    while current_path != current_path.parent:  # Stop when reaching the root directory
-        if current_path.name == settings.CUT_LIST_DIR:
-            return True
-        current_path = current_path.parent
-    return False
+    return not source_path.is_dir()
+
+
+class PathClassifier:
+    """
+    Bounded LRU classifier for the '.../briefing/Listas de Corte e Etiquetas/<name>.xlsx' layout. The '~$<name>.xlsx'
+    lock files Office creates next to an open workbook are not valid.
+
+    Paths are matched with a single precompiled regular expression on the path string, so classifying a path never
+    touches the filesystem. Results are kept in a least recently used cache of at most `max_size` entries, which is safe
+    to share between the observer and scan threads. Hit, miss and eviction counts are available from `cache_info`.
+
+    Example:
+        classifier = PathClassifier(max_size=1024)
+        classifier.is_valid_path("/clientes/x/briefing/Listas de Corte e Etiquetas/lista.xlsx")  # True
+    """
+
+    def __init__(self, max_size: Optional[int] = None) -> None:
+        self.max_size = max_size or settings.PATH_CACHE_SIZE
+        separator = r'[\\/]'
+        self.pattern = re.compile(rf'(?:^|{separator})briefing{separator}{re.escape(settings.CUT_LIST_DIR)}'
+                                  rf'{separator}(?!~\$)[^\\/]+(?i:\.xlsx)$')
+        self._cache: OrderedDict[str, bool] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_valid_path(self, path: Union[str, Path]) -> bool:
+        path = str(path)
+        with self._lock:
+            result = self._cache.get(path)
+            if result is not None:
+                self._cache.move_to_end(path)
+                self.hits += 1
+                return result
+            self.misses += 1
+        result = self.pattern.search(path) is not None
+        with self._lock:
+            self._cache[path] = result
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def cache_info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._cache),
+                    "max_size": self.max_size}
+
+
+path_classifier = PathClassifier()
+
+
+@functools.cache
+def get_tesseract_cmd() -> Path:
+    """
+    Finds the tesseract executable, either `settings.TESSERACT_CMD` or the first 'tesseract' on the PATH, and checks
+    that it can be executed. The lookup runs once per process and does not spawn a subprocess.
+
+    :return: The path to the tesseract executable.
+    :raises FileNotFoundError: If tesseract is not installed or not executable.
+    """
+    command = settings.TESSERACT_CMD or shutil.which('tesseract')
+    if not command:
+        raise FileNotFoundError("The tesseract executable was not found on the PATH. Install tesseract-ocr or set "
+                                f"{settings.parse_env('TESSERACT_CMD')}.")
+    path = Path(command)
+    if not path.is_file() or not os.access(path, os.X_OK):
+        raise FileNotFoundError(f"The tesseract executable '{path}' does not exist or is not executable.")
+    return path
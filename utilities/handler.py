@@ -1,30 +1,32 @@
-import functools
-import logging.config
+import logging
 import os
-import time
 from pathlib import Path
-from queue import Queue
-from typing import Iterator
 
 from watchdog.events import FileCreatedEvent
 from watchdog.events import PatternMatchingEventHandler
 
-import settings
-from utilities import task
+from utilities import functions
+from utilities.admission import StabilityGate
+from utilities.scheduler import DebounceScheduler
+from utilities.work_queue import WorkQueue
 
-logging.config.dictConfig(settings.LOGGER)
 logger = logging.getLogger(__name__)
 
 
-def worker(event_queue):
+def worker(event_queue, executor=None, board=None):
     """
     Worker function that processes events from the event queue.
 
-    This function continuously retrieves events from the event queue and processes them using the `task.process_event`
-    method. The function breaks the loop and terminates when a `None` value is encountered in the event queue.
+    This function continuously retrieves events from the event queue and hands them to the job executor, which runs
+    `task.process_event` on its pool of worker processes. Without an executor the events are processed inline. With a
+    job board, the events are published to the board instead, and the replica that claims them runs them. The
+    function breaks the loop and terminates when a `None` value is encountered in the event queue, after the executor
+    has finished its running jobs.
 
     Args:
-        event_queue (queue.Queue): The queue from which events are retrieved.
+        event_queue (work_queue.WorkQueue): The queue from which events are retrieved.
+        executor (executor.JobExecutor, optional): The executor that runs the jobs. Defaults to None.
+        board (leases.LeaseBoard, optional): The job board shared with the other replicas. Defaults to None.
 
     Returns:
         None
@@ -33,47 +35,34 @@ def worker(event_queue):
     while True:
         event_tuple = event_queue.get()
         if event_tuple is None:
+            if executor is not None:
+                executor.shutdown()
             break
         event_type, event = event_tuple
-        task.process_event(event_type, event)
+        if board is not None:
+            board.publish(event_type, event.src_path)
+        elif executor is None:
+            from utilities import task
+            task.process_event(event_type, event)
+        else:
+            executor.submit(event_type, event)
 
 
-def delayed_scan_worker(event_queue: Queue, delayed_scan_queue: Queue, directories_in_queue: set):
+def delayed_scan_worker(scheduler: DebounceScheduler, event_handler: "ExcelEventHandler"):
     """
-    Verifies if the given source path contains the specified reference as one of its parts and
-    if it is not a directory.
+    Releases debounced directories to the event handler for scanning.
 
-    This function takes the following parameters:
+    Every directory touched by an event is scheduled with a trailing deadline that is pushed back on each new event.
+    As soon as deadlines pass, all due directories are released together and scanned, so one busy directory never
+    delays another. The function returns once the scheduler is stopped.
 
-    :param event_queue: A queue.Queue object representing the queue to which scan events are added.
-    :param delayed_scan_queue: A queue.Queue object representing the queue from which directories scheduled for delayed
-    scanning are retrieved.
-    :param directories_in_queue: A list containing the directories currently in the queue.
+    :param scheduler: The DebounceScheduler the event handler schedules directories on.
+    :param event_handler: The ExcelEventHandler whose `scan_directory` enqueues the files of a released directory.
 
     This function does not return a value.
 
     """
-    directory_timestamps = {}
-
-    while True:
-        directory = delayed_scan_queue.get()
-        if directory is None:
-            break
-
-        current_time = time.time()
-        if directory not in directory_timestamps:
-            directory_timestamps[directory] = current_time
-            directories_in_queue.add(directory)
-
-        elapsed_time = current_time - directory_timestamps[directory]
-        remaining_delay = max(0, settings.DELAY_FOR_SCAN - elapsed_time)
-        time.sleep(remaining_delay)
-
-        ExcelEventHandler(event_queue, delayed_scan_queue, directories_in_queue).scan_directory(directory)
-
-        # Remove the directory from the set and timestamp dictionary
-        directories_in_queue.remove(directory)
-        del directory_timestamps[directory]
+    scheduler.run(event_handler.scan_directory)
 
 
 class ExcelEventHandler(PatternMatchingEventHandler):
@@ -81,58 +70,58 @@ class ExcelEventHandler(PatternMatchingEventHandler):
     Event handler for monitoring Excel files with the .xlsx extension.
 
     This handler is designed to respond to file system events involving Excel files.
-    It ignores events related to directories and is not case-sensitive.
+    It ignores events related to directories and is not case-sensitive. Office lock files ('~$name.xlsx') are not valid
+    paths and are ignored.
+    With a stability gate, the files found are only queued once they and their PDF file stopped changing.
 
     Example usage:
-        event_handler = ExcelEventHandler()
+        event_handler = ExcelEventHandler(event_queue, scheduler, gate=StabilityGate(event_queue))
         observer = Observer()
         observer.schedule(event_handler, path='path_to_watch', recursive=False)
         observer.start()
     """
 
-    def __init__(self, event_queue: Queue, delayed_scan_queue: Queue,
-                 directories_in_queue: Queue | set | list | Iterator,
-                 process_scan: bool = False, *args, **kwargs) -> None:
+    def __init__(self, event_queue: WorkQueue, scheduler: DebounceScheduler, process_scan: bool = False,
+                 gate: StabilityGate = None, *args, **kwargs) -> None:
         patterns = ['*.xlsx']
         super().__init__(patterns=patterns, ignore_directories=True, case_sensitive=False)
         self.event_queue = event_queue
-        self.delayed_scan_queue = delayed_scan_queue
-        self.directories_in_queue = directories_in_queue
+        self.scheduler = scheduler
         self.process_scan = process_scan
+        self.gate = gate
 
         logger.info(f"------------- TAG WATCHER INITIALIZED -------------")
 
     @staticmethod
-    @functools.cache
     def parse_path(path: str) -> Path:
-        return Path(path).resolve()
+        return Path(os.path.abspath(path))
 
-    @functools.cache
-    def is_valid_path(self, path: str) -> bool:
-        path: Path = self.parse_path(path)
-        if path.is_dir():
-            return False
-        return path.parent.stem.__str__() == settings.CUT_LIST_DIR and path.parent.parent.stem.__str__() == 'briefing'
+    @staticmethod
+    def is_valid_path(path: str) -> bool:
+        return functions.path_classifier.is_valid_path(path)
 
     def add_to_event_queue(self, event):
-        logger.info(f"Adding to queue for processing.")
+        if self.gate is not None:
+            self.gate.submit(event)
+            return
+        logger.debug(f"Adding to queue for processing.")
         self.event_queue.put(('created', event))
 
     def add_to_dir_queue(self, path: Path):
         if not path.is_dir():
             path = path.parent
-        if path not in self.directories_in_queue:
-            self.directories_in_queue.add(path)
-            self.delayed_scan_queue.put(path)
+        self.scheduler.schedule(path)
 
-    def add_to_queue(self, event, msg: str = None):
+    def add_to_queue(self, event, msg: str = None, path: str = None):
         if msg is None:
             msg = "'Modified' event triggered for 'file':"
-        file_path: Path = self.parse_path(event.src_path)
+        if path is None:
+            path = event.src_path
+        file_path: Path = self.parse_path(path)
         dir_path = file_path.parent
-        msg += f" {event.src_path}"
-        if self.is_valid_path(event.src_path):
-            logger.info(msg)
+        msg += f" {path}"
+        if self.is_valid_path(path):
+            logger.debug(msg)
             self.add_to_dir_queue(dir_path)
             if self.process_scan:
                 self.add_to_event_queue(event)
@@ -144,12 +133,20 @@ class ExcelEventHandler(PatternMatchingEventHandler):
         self.add_to_queue(event, msg="'Created' event triggered for 'file':")
 
     def on_moved(self, event):
-        self.add_to_queue(event, msg=f"'Moved' event triggered for 'file':")
+        # Excel saves to a temporary file renamed over the workbook, so the workbook is the destination.
+        self.add_to_queue(event, msg=f"'Moved' event triggered for 'file':", path=event.dest_path)
 
     def scan_directory(self, directory):
-        for root, dirs, files in os.walk(directory):
-            for file in files:
-                path = Path(os.path.join(root, file))
-                logger.info(f"Found file: ... {path.parent}/{path.name}")
-                event = FileCreatedEvent(path)
-                self.event_queue.put(('created', event))
+        found = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not self.is_valid_path(entry.path):
+                    continue
+                found += 1
+                logger.debug(f"Found file: ... {directory}/{entry.name}")
+                event = FileCreatedEvent(entry.path)
+                if self.gate is not None:
+                    self.gate.submit(event)
+                else:
+                    self.event_queue.put(('created', event))
+        logger.info(f"Found {found} files in '{directory}'.")
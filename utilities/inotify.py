@@ -0,0 +1,177 @@
+"""
+Native observer whose watches all share one inotify instance, for the `WatchManager`.
+
+Each `schedule` of watchdog's `Observer` opens its own inotify instance and starts its own threads, and Linux allows
+128 instances per user by default (`fs.inotify.max_user_instances`), so non-recursive watches on every cut list
+directory cannot each be scheduled. Here a single watch is scheduled on the watched root, and its emitter adds and
+removes the inotify watches of any number of directories on one instance, up to `fs.inotify.max_user_watches`.
+
+Only the events of the watched directories themselves are reported, as by a non-recursive watch: created, deleted,
+modified and moved files and directories. A move between two watched directories is reported as one moved event.
+"""
+import ctypes
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from watchdog.events import (DirCreatedEvent, DirDeletedEvent, DirModifiedEvent, DirMovedEvent, FileCreatedEvent,
+                             FileDeletedEvent, FileModifiedEvent, FileMovedEvent)
+from watchdog.observers.api import DEFAULT_OBSERVER_TIMEOUT, BaseObserver, EventEmitter
+
+try:
+    from watchdog.observers.inotify_c import InotifyConstants, inotify_add_watch, inotify_init, inotify_rm_watch
+except Exception:  # Not Linux, or a libc without inotify
+    inotify_init = None
+
+logger = logging.getLogger(__name__)
+
+# Seconds an IN_MOVED_FROM event waits for its IN_MOVED_TO event before it is reported as a deletion.
+MOVE_TIMEOUT = 0.5
+
+EVENT_BUFFER_SIZE = 64 * 1024
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_supported() -> bool:
+    return inotify_init is not None
+
+
+def raise_error(path: Optional[str] = None) -> None:
+    error = ctypes.get_errno()
+    raise OSError(error, os.strerror(error), path)
+
+
+class SharedInotifyEmitter(EventEmitter):
+    """
+    Emits the events of the directories added with `add_watch`, read from one inotify instance. The watched root is
+    not watched until it is added too.
+    """
+
+    def __init__(self, event_queue, watch, timeout: float = DEFAULT_OBSERVER_TIMEOUT, **kwargs) -> None:
+        super().__init__(event_queue, watch, timeout=timeout, **kwargs)
+        self.mask = (InotifyConstants.IN_CREATE | InotifyConstants.IN_DELETE | InotifyConstants.IN_MODIFY |
+                     InotifyConstants.IN_ATTRIB | InotifyConstants.IN_MOVED_FROM | InotifyConstants.IN_MOVED_TO |
+                     InotifyConstants.IN_ONLYDIR | InotifyConstants.IN_DONT_FOLLOW | InotifyConstants.IN_EXCL_UNLINK)
+        self._fd = inotify_init()
+        if self._fd == -1:
+            raise_error()
+        self._paths: Dict[int, str] = {}
+        self._wds: Dict[str, int] = {}
+        # Cookie -> (time, source path, is a directory) of the IN_MOVED_FROM events waiting for their IN_MOVED_TO.
+        self._moves: Dict[int, Tuple[float, str, bool]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._wds)
+
+    def add_watch(self, path: str) -> None:
+        """
+        Starts reporting the events of a directory.
+
+        Raises:
+            OSError: If the directory cannot be watched, e.g. ENOSPC when `fs.inotify.max_user_watches` is reached.
+        """
+        wd = inotify_add_watch(self._fd, os.fsencode(path), self.mask)
+        if wd == -1:
+            raise_error(path)
+        with self._lock:
+            self._paths[wd] = path
+            self._wds[path] = wd
+
+    def remove_watch(self, path: str) -> None:
+        with self._lock:
+            wd = self._wds.pop(path, None)
+            if wd is None or self._paths.get(wd) != path:
+                return
+            del self._paths[wd]
+        if inotify_rm_watch(self._fd, wd) == -1 and ctypes.get_errno() != errno.EINVAL:
+            # EINVAL: the directory was deleted and the kernel already removed its watch.
+            raise_error(path)
+
+    def read_events(self, timeout: float):
+        if self._moves:
+            timeout = min(timeout, MOVE_TIMEOUT)
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return
+        try:
+            buffer = os.read(self._fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            yield wd, mask, cookie, os.fsdecode(name)
+
+    def queue_events(self, timeout: float) -> None:
+        for wd, mask, cookie, name in self.read_events(timeout):
+            if mask & InotifyConstants.IN_Q_OVERFLOW:
+                logger.warning("The inotify event queue overflowed, events were lost.")
+                self.queue_event(DirModifiedEvent(self.watch.path))
+                continue
+            with self._lock:
+                directory = self._paths.get(wd)
+                if directory is not None and mask & InotifyConstants.IN_IGNORED:
+                    # The directory was deleted or unmounted, its watch is gone.
+                    del self._paths[wd]
+                    if self._wds.get(directory) == wd:
+                        del self._wds[directory]
+                    continue
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            is_directory = bool(mask & InotifyConstants.IN_ISDIR)
+            if mask & InotifyConstants.IN_MOVED_FROM:
+                self._moves[cookie] = (time.monotonic(), path, is_directory)
+            elif mask & InotifyConstants.IN_MOVED_TO:
+                move = self._moves.pop(cookie, None)
+                if move is not None:
+                    self.queue_event((DirMovedEvent if is_directory else FileMovedEvent)(move[1], path))
+                else:
+                    self.queue_event((DirCreatedEvent if is_directory else FileCreatedEvent)(path))
+            elif mask & InotifyConstants.IN_CREATE:
+                self.queue_event((DirCreatedEvent if is_directory else FileCreatedEvent)(path))
+            elif mask & InotifyConstants.IN_DELETE:
+                self.queue_event((DirDeletedEvent if is_directory else FileDeletedEvent)(path))
+            elif mask & (InotifyConstants.IN_MODIFY | InotifyConstants.IN_ATTRIB):
+                self.queue_event((DirModifiedEvent if is_directory else FileModifiedEvent)(path))
+        # Moved out of the watched directories.
+        expired = time.monotonic() - MOVE_TIMEOUT
+        for cookie, (moved_at, path, is_directory) in list(self._moves.items()):
+            if moved_at < expired:
+                del self._moves[cookie]
+                self.queue_event((DirDeletedEvent if is_directory else FileDeletedEvent)(path))
+
+    def run(self) -> None:
+        try:
+            super().run()
+        finally:
+            os.close(self._fd)
+
+
+class SharedInotifyObserver(BaseObserver):
+    """
+    Observer whose emitters each watch any number of directories on one inotify instance, see the module docstring.
+
+    Example:
+        observer = SharedInotifyObserver()
+        watch = observer.schedule(event_handler, path=settings.WATCHING_DIR)
+        observer.start()
+        emitter = observer.get_emitter(watch)
+        emitter.add_watch(cut_list_dir)
+    """
+
+    def __init__(self, timeout: float = DEFAULT_OBSERVER_TIMEOUT) -> None:
+        super().__init__(SharedInotifyEmitter, timeout=timeout)
+
+    def get_emitter(self, watch) -> SharedInotifyEmitter:
+        return next(emitter for emitter in self.emitters if emitter.watch == watch)
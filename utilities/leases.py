@@ -0,0 +1,276 @@
+"""
+Coordination of several watcher replicas sharing the same `WATCHING_DIR`, through files on the shared volume only.
+
+Replicas do not process the events they see themselves. They publish them as job files on a shared job board, and
+every replica claims jobs from the board when it has idle workers, so work observed by a busy replica is taken over by
+an idle one. A job is claimed by creating its lease file with `O_CREAT | O_EXCL`, which exactly one replica can do, and
+renaming the job file to a running file of the claiming replica. The lease is renewed by a heartbeat and released when
+the job finishes. The lease of a replica that crashed expires after `LEASE_TTL` seconds, and its running jobs are then
+taken over by the next replica that looks at the board.
+
+The board directory looks like:
+
+    jobs/<job id>.json                  published jobs, the latest event of a path wins
+    jobs/<job id>.<replica>.running     claimed jobs
+    leases/<job id>.lease               leases, renewed by touching them
+
+Leases expire by the file mtime, so the clocks of the replicas and of the file server must be synchronized.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Union
+
+from watchdog.events import FileCreatedEvent
+
+import settings
+from utilities import functions
+
+logger = logging.getLogger(__name__)
+
+
+class Job(NamedTuple):
+    job_id: str
+    key: str
+    event_type: str
+    path: str
+
+
+def get_job_id(key: str) -> str:
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class LeaseBoard:
+    """
+    Shared job board with file leases, see the module docstring.
+
+    Example:
+        board = LeaseBoard()
+        board.start()
+        board.publish('created', excel_path)
+        for job in board.claim(limit=4):
+            ...
+            board.complete(job.job_id)
+        board.stop()
+    """
+
+    def __init__(self, directory: Optional[Union[str, Path]] = None, owner: Optional[str] = None,
+                 ttl: Optional[float] = None) -> None:
+        self.directory = Path(directory if directory is not None else settings.COORDINATION_DIR)
+        self.jobs_dir = self.directory / "jobs"
+        self.leases_dir = self.directory / "leases"
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.leases_dir.mkdir(parents=True, exist_ok=True)
+        self.owner = functions.clean_name(owner or settings.REPLICA_ID)
+        self.ttl = ttl or settings.LEASE_TTL
+        self._held: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    # Leases
+
+    def get_lease_path(self, job_id: str) -> Path:
+        return self.leases_dir / f"{job_id}.lease"
+
+    def is_expired(self, path: Path) -> bool:
+        try:
+            return time.time() - os.stat(path).st_mtime > self.ttl
+        except FileNotFoundError:
+            return True
+
+    @staticmethod
+    def read_lease(path: Path) -> dict:
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def acquire(self, job_id: str) -> bool:
+        """
+        Takes the lease of a job, breaking it if its holder stopped renewing it. Returns False if it is held.
+        """
+        path = self.get_lease_path(job_id)
+        for _ in range(2):
+            try:
+                descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self.is_expired(path) or not self.break_lease(path):
+                    return False
+                continue
+            token = uuid.uuid4().hex
+            with os.fdopen(descriptor, "w") as file:
+                json.dump({"owner": self.owner, "token": token}, file)
+            with self._lock:
+                self._held[job_id] = token
+            return True
+        return False
+
+    def break_lease(self, path: Path) -> bool:
+        """
+        Removes an expired lease. The lease is first renamed to a unique name, so that only one replica breaks it, and
+        put back if it turns out to have been renewed in the meantime.
+        """
+        tombstone = path.with_name(f"{path.name}.{uuid.uuid4().hex}.expired")
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return True
+        if self.is_expired(tombstone):
+            logger.warning(f"Breaking the expired lease '{path.name}' of '{self.read_lease(tombstone).get('owner')}'.")
+            tombstone.unlink(missing_ok=True)
+            return True
+        try:
+            os.link(tombstone, path)
+        except FileExistsError:
+            logger.error(f"The lease '{path.name}' was renewed and replaced while being broken.")
+        tombstone.unlink(missing_ok=True)
+        return False
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            token = self._held.pop(job_id, None)
+        path = self.get_lease_path(job_id)
+        if token is not None and self.read_lease(path).get("token") == token:
+            path.unlink(missing_ok=True)
+
+    def heartbeat(self) -> None:
+        with self._lock:
+            held = dict(self._held)
+        for job_id, token in held.items():
+            path = self.get_lease_path(job_id)
+            if self.read_lease(path).get("token") != token:
+                logger.error(f"Lost the lease of job {job_id}, another replica may be processing it.")
+                with self._lock:
+                    self._held.pop(job_id, None)
+                continue
+            try:
+                os.utime(path)
+            except OSError as e:
+                logger.error(f"Cannot renew the lease of job {job_id}: {e}")
+
+    def start(self) -> None:
+        """
+        Publishes again the jobs this replica was running when it last stopped, and starts renewing the held leases
+        every third of the lease TTL.
+        """
+        for path in self.jobs_dir.glob(f"*.{self.owner}.running"):
+            job_id = path.name.partition(".")[0]
+            logger.warning(f"Publishing again job {job_id}, interrupted by the last shutdown of this replica.")
+            try:
+                os.link(path, self.jobs_dir / f"{job_id}.json")
+            except FileExistsError:
+                pass
+            path.unlink(missing_ok=True)
+
+        def run() -> None:
+            while not self._stopped.wait(self.ttl / 3):
+                self.heartbeat()
+
+        self._heartbeat_thread = threading.Thread(target=run, name="lease-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+
+    # Jobs
+
+    def get_running_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.{self.owner}.running"
+
+    def publish(self, event_type: str, path: Union[str, Path]) -> None:
+        """
+        Publishes a job for an Excel file, replacing the job of the same file that is not claimed yet.
+        """
+        key = str(functions.validate_path(path))
+        job_id = get_job_id(key)
+        temporary_path = self.jobs_dir / f".{job_id}.{uuid.uuid4().hex}.tmp"
+        temporary_path.write_text(json.dumps({"key": key, "event_type": event_type, "path": str(path)}))
+        os.replace(temporary_path, self.jobs_dir / f"{job_id}.json")
+        logger.debug(f"Published job {job_id} for '{key}'.")
+
+    def take(self, job_id: str, source: Path) -> Optional[Job]:
+        """
+        Moves a job file to the running file of this replica, once its lease is held.
+        """
+        running_path = self.get_running_path(job_id)
+        try:
+            os.rename(source, running_path)
+            data = json.loads(running_path.read_text())
+        except OSError as e:
+            logger.debug(f"Cannot take job {job_id}: {e}")
+            self.release(job_id)
+            return None
+        except ValueError as e:
+            logger.error(f"Dropping the unreadable job {job_id}: {e}")
+            self.complete(job_id)
+            return None
+        return Job(job_id=job_id, key=data["key"], event_type=data["event_type"], path=data["path"])
+
+    def claim(self, limit: int) -> List[Job]:
+        """
+        Claims up to `limit` jobs: first the running jobs of replicas whose lease expired, then the published jobs,
+        oldest first.
+        """
+        if limit <= 0:
+            return []
+        orphans, published = [], []
+        with os.scandir(self.jobs_dir) as entries:
+            for entry in entries:
+                job_id, _, suffix = entry.name.partition(".")
+                if suffix == "json":
+                    try:
+                        published.append((entry.stat().st_mtime, job_id, Path(entry.path)))
+                    except FileNotFoundError:
+                        continue
+                elif suffix.endswith(".running") and suffix != f"{self.owner}.running":
+                    orphans.append((0, job_id, Path(entry.path)))
+        jobs = []
+        for _, job_id, path in orphans + sorted(published):
+            if len(jobs) >= limit:
+                break
+            if job_id in self._held or not self.acquire(job_id):
+                continue
+            if path.suffix == ".running":
+                logger.warning(f"Taking over job {job_id} from '{path.name}', its lease expired.")
+            job = self.take(job_id, path)
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    def complete(self, job_id: str) -> None:
+        self.get_running_path(job_id).unlink(missing_ok=True)
+        self.release(job_id)
+
+
+def coordination_worker(board: LeaseBoard, executor, stop: threading.Event, interval: Optional[float] = None) -> None:
+    """
+    Claims jobs from the board whenever the executor has idle workers, until `stop` is set.
+
+    :param board: The LeaseBoard shared by the replicas.
+    :param executor: The JobExecutor that runs the claimed jobs.
+    :param stop: Event set to stop claiming jobs. Claimed jobs keep running and their leases are renewed until the board
+        is stopped.
+    :param interval: Seconds between two looks at the board when there is nothing to claim. Defaults to
+        `settings.LEASE_POLL_INTERVAL`.
+    """
+    if interval is None:
+        interval = settings.LEASE_POLL_INTERVAL
+    while not stop.is_set():
+        try:
+            jobs = board.claim(limit=executor.max_workers - executor.running_count())
+        except OSError as e:
+            logger.error(f"Cannot read the job board: {e}")
+            jobs = []
+        for job in jobs:
+            executor.submit(job.event_type, FileCreatedEvent(job.path), callback=partial(board.complete, job.job_id))
+        if not jobs:
+            stop.wait(interval)
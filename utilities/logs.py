@@ -0,0 +1,124 @@
+"""
+Logging setup, applied once per process.
+
+Records are not written by the thread that logs them: a `QueueHandler` puts them on a queue, and a `QueueListener`
+thread of the main process writes them to the handlers of `settings.LOGGER`. Worker processes send their records to
+the same queue through the `configure_worker` initializer, so only the main process writes the log file and rotates it.
+
+Repetitive records below WARNING are rate limited per call site by `RateLimitFilter`.
+
+Example:
+    logs.configure()
+    executor = ProcessPoolExecutor(initializer=logs.configure_worker, initargs=logs.get_worker_args())
+"""
+import atexit
+import logging
+import logging.config
+import multiprocessing
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+import settings
+
+_listener: Optional[QueueListener] = None
+
+_queue = None
+
+_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `rate` records per second through for each call site, with bursts of up to `rate` records. Records at
+    WARNING or above are never dropped. The next record let through from a call site tells how many were dropped.
+    """
+
+    def __init__(self, rate: Optional[float] = None) -> None:
+        super().__init__()
+        self.rate = settings.LOG_RATE_LIMIT if rate is None else rate
+        # Call site -> (tokens, last update, dropped records).
+        self._buckets: Dict[Tuple[str, int], Tuple[float, float, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, dropped = self._buckets.get(key, (self.rate, now, 0))
+            tokens = min(self.rate, tokens + (now - updated_at) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+def get_queue_handler(log_queue) -> QueueHandler:
+    handler = QueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter())
+    return handler
+
+
+def configure(context=None) -> None:
+    """
+    Configures the logging of the main process, once: the handlers of `settings.LOGGER` are moved behind a queue and a
+    listener thread. Further calls do nothing.
+
+    Args:
+        context (optional): The multiprocessing context of the worker processes, whose queue is used. Defaults to the
+        context of `settings.WORKER_START_METHOD`.
+    """
+    global _listener, _queue
+    with _lock:
+        if _listener is not None:
+            return
+        logging.config.dictConfig(settings.LOGGER)
+        root = logging.getLogger()
+        handlers = list(root.handlers)
+        for handler in handlers:
+            root.removeHandler(handler)
+        _queue = (context or multiprocessing.get_context(settings.WORKER_START_METHOD)).Queue()
+        root.addHandler(get_queue_handler(_queue))
+        _listener = QueueListener(_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    atexit.register(stop)
+
+
+def stop() -> None:
+    """
+    Writes the records still in the queue and stops the listener thread.
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def get_worker_args() -> tuple:
+    """
+    Returns the arguments of `configure_worker` for the worker processes of this process.
+    """
+    return _queue, logging.getLogger().level
+
+
+def configure_worker(log_queue, level: int) -> None:
+    """
+    Initializer of worker processes: sends their records to the listener of the main process. Does nothing when the
+    main process did not call `configure`.
+    """
+    if log_queue is None:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(get_queue_handler(log_queue))
+    root.setLevel(level)
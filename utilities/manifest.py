@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class JobKey(NamedTuple):
+    """
+    Content fingerprint of everything a job's output depends on.
+    """
+    excel_digest: str
+    pdf_digest: str
+    config_digest: str
+
+
+def get_config_digest(config: dict) -> str:
+    """
+    Hashes a pipeline configuration dictionary in a stable way.
+
+    Args:
+        config (dict): JSON serializable pipeline configuration.
+
+    Returns:
+        str: The hex digest of the configuration.
+    """
+    payload = json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+PageTag = Tuple[str, Optional[int]]
+
+
+class Manifest:
+    """
+    Persistent SQLite manifest of the inputs each output PDF was produced from.
+
+    File digests are cached by size and mtime, so unchanged files are never re-hashed. A job can be skipped when the
+    key of its inputs matches the key recorded for its output, and the output itself is still the file that was
+    written. The tag name and value stamped on each page are recorded with the output, so that an output whose PDF is
+    unchanged can be updated page by page when only the workbook changes.
+
+    The manifest lives in the `STATE_DIR` of each replica. When replicas share a `COORDINATION_DIR`, the record of each
+    output is also written as a JSON file to its 'outputs' directory, and read from there when the local manifest has
+    no record matching the output, so the replica that claims a job another one already processed skips it or
+    re-stamps it instead of processing it in full. The shared records are plain files replaced atomically, since SQLite
+    is not safe on a network file system, and are keyed by the output path, so every replica must mount the watched
+    directory at the same path.
+
+    Example:
+        manifest = Manifest()
+        key = manifest.get_job_key(excel_path, pdf_path, config)
+        if not manifest.is_up_to_date(output_path, key):
+            ...
+            manifest.record(output_path, key)
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None,
+                 shared_dir: Optional[Union[str, Path]] = None) -> None:
+        self.path = Path(path) if path is not None else settings.MANIFEST_FILE
+        if shared_dir is None and settings.COORDINATION_DIR:
+            shared_dir = Path(settings.COORDINATION_DIR) / "outputs"
+        self.shared_dir = Path(shared_dir) if shared_dir is not None else None
+        if self.shared_dir is not None:
+            self.shared_dir.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT
+                );
+                CREATE TABLE IF NOT EXISTS outputs (
+                    path TEXT PRIMARY KEY, excel_digest TEXT, pdf_digest TEXT, config_digest TEXT,
+                    size INTEGER, mtime_ns INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS pages (
+                    output_path TEXT, page INTEGER, name TEXT, value INTEGER, PRIMARY KEY (output_path, page)
+                );
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get_file_digest(self, path: Path) -> str:
+        """
+        Returns the SHA-256 digest of a file, reusing the stored digest while its size and mtime are unchanged.
+
+        Args:
+            path (Path): The file to fingerprint.
+
+        Returns:
+            str: The hex digest of the file content.
+        """
+        stat = path.stat()
+        connection = self._connect()
+        row = connection.execute("SELECT size, mtime_ns, digest FROM files WHERE path = ?", (str(path),)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                               (str(path), stat.st_size, stat.st_mtime_ns, digest.hexdigest()))
+        return digest.hexdigest()
+
+    def get_job_key(self, excel_path: Path, pdf_path: Path, config: dict) -> JobKey:
+        return JobKey(excel_digest=self.get_file_digest(excel_path), pdf_digest=self.get_file_digest(pdf_path),
+                      config_digest=get_config_digest(config))
+
+    def get_shared_path(self, output_path: Path) -> Path:
+        return self.shared_dir / f"{hashlib.sha1(str(output_path).encode('utf-8')).hexdigest()}.json"
+
+    def read_shared(self, output_path: Path) -> Optional[dict]:
+        if self.shared_dir is None:
+            return None
+        try:
+            data = json.loads(self.get_shared_path(output_path).read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot read the shared record of '{output_path}': {e}")
+            return None
+        return data if data.get("path") == str(output_path) else None
+
+    def write_shared(self, output_path: Path, key: JobKey, stat: os.stat_result,
+                     pages: Optional[List[PageTag]]) -> None:
+        path = self.get_shared_path(output_path)
+        temporary_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            temporary_path.write_text(json.dumps({"path": str(output_path), "key": list(key), "size": stat.st_size,
+                                                  "mtime_ns": stat.st_mtime_ns, "pages": pages}))
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logger.error(f"Cannot write the shared record of '{output_path}': {e}")
+            temporary_path.unlink(missing_ok=True)
+
+    def get_record(self, output_path: Path) -> Optional[Tuple[JobKey, Optional[dict]]]:
+        """
+        Returns the key the output was last produced from, with the shared record it was read from or None if it was
+        read from the local manifest. Returns None if the output is missing or was changed since it was recorded,
+        locally or by another replica.
+        """
+        try:
+            stat = output_path.stat()
+        except FileNotFoundError:
+            return None
+        row = self._connect().execute(
+            "SELECT excel_digest, pdf_digest, config_digest, size, mtime_ns FROM outputs WHERE path = ?",
+            (str(output_path),)).fetchone()
+        if row is not None and (stat.st_size, stat.st_mtime_ns) == (row[3], row[4]):
+            return JobKey(*row[:3]), None
+        shared = self.read_shared(output_path)
+        if shared is not None and (stat.st_size, stat.st_mtime_ns) == (shared["size"], shared["mtime_ns"]):
+            return JobKey(*shared["key"]), shared
+        return None
+
+    def get_recorded_key(self, output_path: Path) -> Optional[JobKey]:
+        """
+        Returns the key the output was last produced from, or None if the output is missing or was changed since.
+        """
+        record = self.get_record(output_path)
+        return record[0] if record is not None else None
+
+    def is_up_to_date(self, output_path: Path, key: JobKey) -> bool:
+        return self.get_recorded_key(output_path) == key
+
+    def get_pages(self, output_path: Path) -> Optional[List[PageTag]]:
+        """
+        Returns the (tag name, tag value) stamped on each page of the output, or None if they were not recorded.
+        """
+        record = self.get_record(output_path)
+        if record is not None and record[1] is not None:
+            pages = record[1].get("pages")
+            return [(name, value) for name, value in pages] if pages else None
+        rows = self._connect().execute("SELECT name, value FROM pages WHERE output_path = ? ORDER BY page",
+                                       (str(output_path),)).fetchall()
+        return [(name, value) for name, value in rows] or None
+
+    def record(self, output_path: Path, key: JobKey, pages: Optional[List[PageTag]] = None) -> None:
+        """
+        Records the key an output was produced from, and optionally the tag stamped on each of its pages, in the local
+        manifest and in the shared records, if any.
+
+        Args:
+            output_path (Path): The output PDF, which must exist.
+            key (JobKey): The key of the inputs.
+            pages (List[PageTag], optional): The (tag name, tag value) of each page, in page order. Defaults to None.
+        """
+        stat = output_path.stat()
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?)",
+                               (str(output_path), *key, stat.st_size, stat.st_mtime_ns))
+            connection.execute("DELETE FROM pages WHERE output_path = ?", (str(output_path),))
+            if pages is not None:
+                connection.executemany("INSERT INTO pages VALUES (?, ?, ?, ?)",
+                                       [(str(output_path), page, name, value)
+                                        for page, (name, value) in enumerate(pages, start=1)])
+        if self.shared_dir is not None:
+            self.write_shared(output_path, key, stat, pages)
@@ -0,0 +1,293 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Worker processes record the stage timings and counters of the job they are running into a job report with `job`,
+`stage` and `count`. The report is returned to the watcher process, which aggregates it into the registry with
+`record_job`. The registry is served on an optional local HTTP endpoint and summarized periodically in the log.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+LabelValues = Tuple[str, ...]
+
+
+def format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        with self._lock:
+            return self.values.get(label_values, 0)
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self.values.values())
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{format_labels(self.labels, values)} {value}" for values, value in self.values.items()]
+
+
+class Gauge(Metric):
+    """
+    Gauge whose value is read from a callback at scrape time, so it costs nothing between scrapes.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]) -> None:
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {self.callback()}"]
+        except Exception as e:
+            logger.debug(f"Cannot read gauge '{self.name}': {e}")
+            return []
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            counts, totals = self.values.setdefault(label_values, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+
+    def get_sum(self, *label_values: str) -> float:
+        with self._lock:
+            return self.values[label_values][1][0] if label_values in self.values else 0.0
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for values, (counts, totals) in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels, values, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {totals[0]}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+REGISTRY = Registry()
+
+JOBS = REGISTRY.register(Counter("tag_watcher_jobs_total", "Jobs finished, by status.", ("status",)))
+
+JOB_DURATION = REGISTRY.register(Histogram("tag_watcher_job_duration_seconds", "Job latency, by status.", ("status",)))
+
+STAGE_DURATION = REGISTRY.register(Histogram("tag_watcher_stage_duration_seconds", "Time spent per stage and job.",
+                                             ("stage",)))
+
+PAGES = REGISTRY.register(Counter("tag_watcher_pages_total", "Pages processed."))
+
+PAGES_PER_SECOND = REGISTRY.register(Histogram("tag_watcher_job_pages_per_second", "Pages per second of each job.",
+                                               buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100)))
+
+EVENTS = REGISTRY.register(Counter("tag_watcher_job_events_total", "Job level counters such as cache hits, by name.",
+                                   ("name",)))
+
+
+def register_gauge(name: str, documentation: str, callback: Callable[[], float]) -> None:
+    REGISTRY.register(Gauge(name, documentation, callback))
+
+
+# Job reports, filled in by the worker process running the job.
+
+_report: Optional[dict] = None
+_report_lock = threading.Lock()
+
+
+@contextmanager
+def job() -> Iterator[dict]:
+    """
+    Collects the report of the job running in this process. The report holds the job status, its page count, the
+    seconds spent in each stage and job level counters.
+
+    Example:
+        with metrics.job() as report:
+            ...
+        return report
+    """
+    global _report
+    report = {"status": "processed", "pages": 0, "duration": 0.0, "stages": {}, "counters": {}}
+    started_at = time.perf_counter()
+    with _report_lock:
+        _report = report
+    try:
+        yield report
+    except Exception:
+        report["status"] = "failed"
+        raise
+    finally:
+        report["duration"] = time.perf_counter() - started_at
+        with _report_lock:
+            _report = None
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Adds the time spent in the block to the given stage of the current job report, if any.
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started_at
+        with _report_lock:
+            if _report is not None:
+                _report["stages"][name] = _report["stages"].get(name, 0.0) + elapsed
+
+
+def count(name: str, amount: int = 1) -> None:
+    with _report_lock:
+        if _report is not None:
+            _report["counters"][name] = _report["counters"].get(name, 0) + amount
+
+
+def set_status(status: str) -> None:
+    with _report_lock:
+        if _report is not None:
+            _report["status"] = status
+
+
+def set_pages(pages: int) -> None:
+    with _report_lock:
+        if _report is not None:
+            _report["pages"] = pages
+
+
+def record_job(report: Optional[dict]) -> None:
+    """
+    Aggregates a job report returned by a worker process into the registry.
+    """
+    if not report:
+        JOBS.inc(1, "failed")
+        return
+    status = report["status"]
+    JOBS.inc(1, status)
+    JOB_DURATION.observe(report["duration"], status)
+    for name, seconds in report["stages"].items():
+        STAGE_DURATION.observe(seconds, name)
+    for name, amount in report["counters"].items():
+        EVENTS.inc(amount, name)
+    if report["pages"]:
+        PAGES.inc(report["pages"])
+        if report["duration"] > 0:
+            PAGES_PER_SECOND.observe(report["pages"] / report["duration"])
+
+
+# Exposition
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+def start_server(host: Optional[str] = None, port: Optional[int] = None) -> ThreadingHTTPServer:
+    """
+    Serves the registry at 'http://<host>:<port>/metrics' from a daemon thread.
+    """
+    host = host or settings.METRICS_HOST
+    port = port or settings.METRICS_PORT
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+def summary_worker(stop: threading.Event, interval: Optional[float] = None) -> None:
+    """
+    Logs a summary line of the jobs finished during each interval until `stop` is set. Idle intervals are not logged.
+    """
+    interval = interval or settings.METRICS_LOG_INTERVAL
+    last_jobs, last_pages, last_time = JOBS.total(), PAGES.total(), time.monotonic()
+    while not stop.wait(interval):
+        jobs, pages, now = JOBS.total(), PAGES.total(), time.monotonic()
+        elapsed = now - last_time
+        if jobs == last_jobs:
+            continue
+        logger.info(f"Metrics: {jobs - last_jobs:.0f} jobs ({JOBS.get('processed'):.0f} processed, "
+                    f"{JOBS.get('incremental'):.0f} incremental, {JOBS.get('skipped'):.0f} skipped, "
+                    f"{JOBS.get('failed'):.0f} failed in total), {(pages - last_pages) / elapsed:.2f} pages/s "
+                    f"over the last {elapsed:.0f}s.")
+        last_jobs, last_pages, last_time = jobs, pages, now
@@ -0,0 +1,147 @@
+"""
+Pluggable OCR backends. Every backend takes a list of name crops and returns the raw text of each crop, in order.
+"""
+import logging
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy
+import pytesseract
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OcrBackend:
+    """
+    Base class for OCR backends.
+
+    Args:
+        config (str): Options passed to tesseract.
+    """
+    name = 'base'
+
+    def __init__(self, config: str) -> None:
+        self.config = config
+
+    def recognize(self, crops: List[numpy.ndarray]) -> List[str]:
+        """
+        Recognizes the text of every crop.
+
+        Args:
+            crops (List[numpy.ndarray]): The images to read.
+
+        Returns:
+            List[str]: The raw text of each crop, in the same order.
+        """
+        raise NotImplementedError
+
+
+class PytesseractBackend(OcrBackend):
+    """
+    Runs one tesseract process per crop. This is the original behaviour, the default backend and the fallback of the
+    tiled backend.
+    """
+    name = 'pytesseract'
+
+    def recognize(self, crops: List[numpy.ndarray]) -> List[str]:
+        return [pytesseract.image_to_string(crop, config=self.config) for crop in crops]
+
+
+class TiledPytesseractBackend(OcrBackend):
+    """
+    Stacks the crops vertically into one tiled image, separated by white bands, and recognizes it with a single
+    tesseract process. Words are assigned back to their tile by the center of their bounding box, so a line tesseract
+    merged across tiles is split again, and the words of each tile are put back in reading order.
+
+    Tesseract segments the tiled image as a whole, so the text of a tile may still differ from one call per crop.
+    Compare the name accuracy of both backends on representative labels before enabling it:
+
+        python -m benchmarks.run --benchmarks process --kinds scanned --ocr-backends pytesseract,tiled
+
+    Args:
+        config (str): Options passed to tesseract.
+        batch_size (int, optional): Maximum number of crops per tiled image. Tesseract refuses images taller than
+        32767 pixels. Defaults to `settings.OCR_BATCH_SIZE`.
+        separator (int, optional): Height in pixels of the white band between tiles. Defaults to 40.
+    """
+    name = 'tiled'
+
+    def __init__(self, config: str, batch_size: Optional[int] = None, separator: int = 40) -> None:
+        super().__init__(config)
+        self.batch_size = batch_size or settings.OCR_BATCH_SIZE
+        self.separator = separator
+
+    def tile(self, crops: List[numpy.ndarray]) -> Tuple[numpy.ndarray, List[Tuple[int, int]]]:
+        """
+        Builds the tiled image for a batch of crops.
+
+        Returns:
+            Tuple[numpy.ndarray, List[Tuple[int, int]]]: The tiled image and the (top, bottom) rows of each tile.
+        """
+        crops = [crop if crop.ndim == 3 else crop[:, :, numpy.newaxis].repeat(3, axis=2) for crop in crops]
+        width = max(crop.shape[1] for crop in crops)
+        height = sum(crop.shape[0] for crop in crops) + self.separator * (len(crops) + 1)
+        image = numpy.full((height, width, 3), 255, dtype=numpy.uint8)
+        bounds = []
+        top = self.separator
+        for crop in crops:
+            bottom = top + crop.shape[0]
+            image[top:bottom, :crop.shape[1]] = crop[:, :, :3]
+            bounds.append((top, bottom))
+            top = bottom + self.separator
+        return image, bounds
+
+    @staticmethod
+    def find_tile(center: float, bounds: List[Tuple[int, int]]) -> int:
+        distances = [0 if top <= center < bottom else min(abs(center - top), abs(center - bottom))
+                     for top, bottom in bounds]
+        return distances.index(min(distances))
+
+    def recognize_batch(self, crops: List[numpy.ndarray]) -> List[str]:
+        image, bounds = self.tile(crops)
+        data = pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+        lines: List[Dict[tuple, List[Tuple[int, int, str]]]] = [{} for _ in crops]
+        for index, text in enumerate(data['text']):
+            if not text.strip():
+                continue
+            top, height, left = data['top'][index], data['height'][index], data['left'][index]
+            tile = self.find_tile(top + height / 2, bounds)
+            line = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+            lines[tile].setdefault(line, []).append((top, left, text))
+        texts = []
+        for tile_lines in lines:
+            ordered = sorted(tile_lines.values(), key=lambda words: min(word[0] for word in words))
+            texts.append('\n'.join(' '.join(word[2] for word in sorted(words, key=lambda word: word[1]))
+                                   for words in ordered))
+        return texts
+
+    def recognize(self, crops: List[numpy.ndarray]) -> List[str]:
+        texts = []
+        for start in range(0, len(crops), self.batch_size):
+            texts.extend(self.recognize_batch(crops[start:start + self.batch_size]))
+        return texts
+
+
+BACKENDS: Dict[str, Type[OcrBackend]] = {
+    PytesseractBackend.name: PytesseractBackend,
+    TiledPytesseractBackend.name: TiledPytesseractBackend,
+}
+
+
+def get_backend(name: str, config: str) -> OcrBackend:
+    """
+    Creates the OCR backend registered under the given name.
+
+    Args:
+        name (str): The backend name, one of `BACKENDS`.
+        config (str): Options passed to tesseract.
+
+    Returns:
+        OcrBackend: The backend instance.
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown OCR backend '{name}', expected one of {sorted(BACKENDS)}.") from None
+    return backend_class(config=config)
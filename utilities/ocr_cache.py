@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy
+
+import settings
+from utilities.ocr import OcrBackend
+
+logger = logging.getLogger(__name__)
+
+
+def get_crop_fingerprint(crop: numpy.ndarray, config: str) -> str:
+    """
+    Hashes the pixels of a crop together with the OCR configuration. Color crops are converted to grayscale first, so
+    the same name region yields the same fingerprint whichever way it was rendered.
+
+    Args:
+        crop (numpy.ndarray): The name crop.
+        config (str): The OCR backend and tesseract options the text depends on.
+
+    Returns:
+        str: The hex digest of the crop.
+    """
+    if crop.ndim == 3:
+        crop = (crop[:, :, :3] @ numpy.array([0.299, 0.587, 0.114])).round().astype(numpy.uint8)
+    crop = numpy.ascontiguousarray(crop, dtype=numpy.uint8)
+    digest = hashlib.sha256()
+    digest.update(config.encode("utf-8"))
+    digest.update(repr(crop.shape).encode("utf-8"))
+    digest.update(crop.tobytes())
+    return digest.hexdigest()
+
+
+class OcrCache:
+    """
+    Bounded, disk-backed LRU cache of OCR results, stored in SQLite so it survives restarts and is shared by the worker
+    processes.
+
+    Args:
+        path (Union[str, Path], optional): The database file. Defaults to `settings.OCR_CACHE_FILE`.
+        max_entries (int, optional): Entries kept before the least recently used ones are evicted. Defaults to
+        `settings.OCR_CACHE_SIZE`.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, max_entries: Optional[int] = None) -> None:
+        self.path = Path(path) if path is not None else settings.OCR_CACHE_FILE
+        self.max_entries = max_entries or settings.OCR_CACHE_SIZE
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS ocr_cache (key TEXT PRIMARY KEY, text TEXT, last_used REAL);
+                CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache (last_used);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """
+        Returns the cached text of the given keys that are present, marking them as recently used.
+        """
+        if not keys:
+            return {}
+        connection = self._connect()
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ", ".join("?" * len(batch))
+            found.update(connection.execute(f"SELECT key, text FROM ocr_cache WHERE key IN ({placeholders})",
+                                            batch).fetchall())
+        if found:
+            with connection:
+                connection.executemany("UPDATE ocr_cache SET last_used = ? WHERE key = ?",
+                                       [(time.time(), key) for key in found])
+        return found
+
+    def put_many(self, items: Dict[str, str]) -> None:
+        """
+        Stores OCR results and evicts the least recently used entries beyond the size limit.
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO ocr_cache VALUES (?, ?, ?)",
+                                   [(key, text, now) for key, text in items.items()])
+            connection.execute("DELETE FROM ocr_cache WHERE key IN (SELECT key FROM ocr_cache "
+                               "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+
+class CachedOcrBackend(OcrBackend):
+    """
+    Memoizes another OCR backend by crop fingerprint. Only the crops missing from the cache are sent to the wrapped
+    backend, in a single call. Hits and misses are counted so they can be added to the job report.
+
+    Example:
+        backend = CachedOcrBackend(TiledPytesseractBackend(config), cache=OcrCache())
+        texts = backend.recognize(crops)
+        logger.info(f"{backend.hits} hits, {backend.misses} misses")
+    """
+
+    def __init__(self, backend: OcrBackend, cache: OcrCache) -> None:
+        super().__init__(config=backend.config)
+        self.name = f"cached-{backend.name}"
+        self.backend = backend
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def recognize(self, crops: List[numpy.ndarray]) -> List[str]:
+        keys = [get_crop_fingerprint(crop, config=f"{self.backend.name} {self.config}") for crop in crops]
+        cached = self.cache.get_many(list(set(keys)))
+        missing = [index for index, key in enumerate(keys) if key not in cached]
+        self.hits += len(crops) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            texts = self.backend.recognize([crops[index] for index in missing])
+            results = {keys[index]: text for index, text in zip(missing, texts)}
+            self.cache.put_many(results)
+            cached.update(results)
+        return [cached[key] for key in keys]
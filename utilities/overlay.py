@@ -0,0 +1,81 @@
+"""
+Vector output: stamps the tag on the original PDF pages with a small content stream, a filled box over the old value
+plus the new value as text, instead of re-encoding rasterized pages.
+"""
+import logging
+from typing import Optional, Tuple
+
+import pikepdf
+
+logger = logging.getLogger(__name__)
+
+POINTS_PER_INCH = 72
+
+
+def make_font(pdf: pikepdf.Pdf) -> pikepdf.Object:
+    """
+    Adds the standard Helvetica-Bold font to a document, to be shared by the overlays of all its pages.
+    """
+    return pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1,
+                                                BaseFont=pikepdf.Name('/Helvetica-Bold'),
+                                                Encoding=pikepdf.Name.WinAnsiEncoding))
+
+
+def get_overlay_commands(mediabox: Tuple[float, float, float, float], tag: Optional[int],
+                         mask_region: Tuple[Tuple[int, int], Tuple[int, int]], text_anchor: Tuple[int, int], dpi: int,
+                         font_name: str, font_size: float) -> bytes:
+    """
+    Builds the content stream operators drawing the mask box and the tag of a page.
+
+    The geometry is given in pixels at `dpi`, measured from the top left corner of the rendered page, the way pdf2image
+    renders the MediaBox. It is converted to PDF points measured from the bottom left corner.
+
+    Args:
+        mediabox (Tuple[float, float, float, float]): The (x0, y0, x1, y1) MediaBox of the page.
+        tag (Optional[int]): The value to write, or None to only draw the box.
+        mask_region (Tuple[Tuple[int, int], Tuple[int, int]]): The ((left, top), (right, bottom)) corners of the box.
+        text_anchor (Tuple[int, int]): The (left, baseline) position of the text.
+        dpi (int): The resolution the geometry is expressed in.
+        font_name (str): The name of the font resource, e.g. '/F1'.
+        font_size (float): The font size in points.
+
+    Returns:
+        bytes: The content stream operators.
+    """
+    scale = POINTS_PER_INCH / dpi
+    x0, y0, x1, y1 = mediabox
+    (left, top), (right, bottom) = mask_region
+    box_left, box_bottom = x0 + left * scale, y1 - bottom * scale
+    box_width, box_height = (right - left) * scale, (bottom - top) * scale
+    commands = f"q 0 g {box_left:.2f} {box_bottom:.2f} {box_width:.2f} {box_height:.2f} re f Q\n"
+    if tag is not None:
+        text_x, text_y = x0 + text_anchor[0] * scale, y1 - text_anchor[1] * scale
+        commands += f"q BT 1 g {font_name} {font_size:.2f} Tf {text_x:.2f} {text_y:.2f} Td ({tag}) Tj ET Q\n"
+    return commands.encode("ascii")
+
+
+def stamp_page(pdf: pikepdf.Pdf, page: pikepdf.Page, tag: Optional[int],
+               mask_region: Tuple[Tuple[int, int], Tuple[int, int]], text_anchor: Tuple[int, int], dpi: int,
+               font: pikepdf.Object, font_size: float) -> None:
+    """
+    Appends the mask box and the tag to a page, leaving its original content untouched. The original content is
+    wrapped in a saved graphics state so that it cannot affect the overlay.
+
+    Args:
+        pdf (pikepdf.Pdf): The document that owns the page.
+        page (pikepdf.Page): The page to stamp.
+        tag (Optional[int]): The value to write, or None to only draw the box.
+        mask_region (Tuple[Tuple[int, int], Tuple[int, int]]): The box corners in pixels at `dpi`.
+        text_anchor (Tuple[int, int]): The text position in pixels at `dpi`.
+        dpi (int): The resolution the geometry is expressed in.
+        font (pikepdf.Object): The font returned by `make_font`.
+        font_size (float): The font size in points.
+    """
+    if int(page.obj.get('/Rotate', 0)) % 360:
+        logger.warning("Stamping a rotated page, the overlay is placed in unrotated page coordinates.")
+    font_name = page.add_resource(font, pikepdf.Name.Font, prefix='TagFont')
+    mediabox = tuple(float(value) for value in page.mediabox)
+    commands = get_overlay_commands(mediabox, tag=tag, mask_region=mask_region, text_anchor=text_anchor, dpi=dpi,
+                                    font_name=str(font_name), font_size=font_size)
+    page.contents_add(pikepdf.Stream(pdf, b"q\n"), prepend=True)
+    page.contents_add(pikepdf.Stream(pdf, b"\nQ\n" + commands), prepend=False)
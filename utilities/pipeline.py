@@ -0,0 +1,99 @@
+"""
+Helpers to run the stages of one job concurrently in threads, connected by bounded queues. Rendering, OCR and encoding
+spend most of their time in poppler, tesseract, OpenCV and zlib, which release the GIL, so threads are enough to
+overlap them.
+"""
+import queue
+import threading
+from typing import Dict, Hashable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable[T], depth: int, name: str = "prefetch") -> Iterator[T]:
+    """
+    Iterates over an iterable in a background thread, at most `depth` items ahead of the consumer. An exception raised
+    by the iterable is raised again in the consumer. When the consumer stops early, the producer stops before its next
+    item.
+
+    Args:
+        iterable (Iterable[T]): The producer, e.g. a generator rendering pages.
+        depth (int): The capacity of the queue between the producer and the consumer.
+        name (str, optional): The name of the producer thread.
+
+    Example:
+        for images in prefetch(iter_page_chunks(pdf_path), depth=1):
+            ...
+    """
+    items: queue.Queue = queue.Queue(maxsize=max(depth, 1))
+    stopped = threading.Event()
+
+    def put(entry) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+            return
+        put((_DONE, None))
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+class Results:
+    """
+    Values produced by one stage and consumed by another as soon as each one is available, e.g. the tag name of each
+    page. A failure of the producer is raised in every consumer waiting for a missing value.
+
+    Example:
+        names = Results()
+        names.set(1, 'PAINEL_1')
+        names.get(1)  # 'PAINEL_1', blocks until the value is set
+    """
+
+    def __init__(self) -> None:
+        self._values: Dict[Hashable, object] = {}
+        self._error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+
+    def set(self, key: Hashable, value) -> None:
+        with self._condition:
+            self._values[key] = value
+            self._condition.notify_all()
+
+    def fail(self, error: BaseException) -> None:
+        with self._condition:
+            self._error = error
+            self._condition.notify_all()
+
+    def get(self, key: Hashable):
+        with self._condition:
+            while key not in self._values:
+                if self._error is not None:
+                    raise self._error
+                self._condition.wait()
+            return self._values[key]
@@ -0,0 +1,142 @@
+"""
+Polling observer for watch directories on network shares, where inotify events from other hosts never arrive.
+
+Unlike watchdog's `PollingObserver`, which stats every file of the tree on every interval, this observer only polls the
+cut list directories. They are found by a `reconcile.DirectoryCrawler` crawl, repeated every
+`POLLING_DISCOVERY_INTERVAL` seconds, which does not list directories whose mtime did not change. Each cut list
+directory is then stat'ed once per `POLLING_INTERVAL`, spread evenly over the interval, and only directories whose
+mtime changed are listed again. Saving a workbook replaces it, which updates the mtime of its directory.
+"""
+import logging
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+from watchdog.observers.api import DEFAULT_OBSERVER_TIMEOUT, BaseObserver, EventEmitter
+
+import settings
+from utilities import functions
+from utilities.reconcile import DirectoryCrawler, is_cut_list_dir
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two slices of a polling round.
+TICK = 0.25
+
+# A directory modified this recently may change again within the mtime resolution of the share, so it is listed again
+# on the next round even if its mtime did not change.
+RACY_WINDOW_NS = 2 * 10 ** 9
+
+FileStates = Dict[str, Tuple[int, int]]
+
+
+def list_workbooks(directory: str) -> FileStates:
+    """
+    Returns the (mtime_ns, size) of each valid workbook of a cut list directory, keyed by path.
+    """
+    workbooks = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and functions.path_classifier.is_valid_path(entry.path):
+                stat = entry.stat()
+                workbooks[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return workbooks
+
+
+class CutListPollingEmitter(EventEmitter):
+    """
+    Emits file events for the workbooks of the cut list directories below the watched path, see the module docstring.
+    The workbooks found by the first discovery are not reported, like the ones existing when a native observer starts.
+    """
+
+    def __init__(self, event_queue, watch, timeout: float = DEFAULT_OBSERVER_TIMEOUT, interval: Optional[float] = None,
+                 discovery_interval: Optional[float] = None, **kwargs) -> None:
+        super().__init__(event_queue, watch, timeout=timeout, **kwargs)
+        self.interval = settings.POLLING_INTERVAL if interval is None else interval
+        self.discovery_interval = settings.POLLING_DISCOVERY_INTERVAL if discovery_interval is None \
+            else discovery_interval
+        self.crawler = DirectoryCrawler(watch.path)
+        self._crawl_entries: Dict[str, Tuple[int, Optional[List[str]]]] = {}
+        # Directory -> (mtime_ns, or None to list it again, workbooks).
+        self._directories: Dict[str, Tuple[Optional[int], FileStates]] = {}
+        self._round: List[str] = []
+        self._cursor = 0
+        self._slice_size = 0
+        self._next_discovery: Optional[float] = None
+
+    def discover(self, initial: bool) -> None:
+        started_at = time.perf_counter()
+        _, self._crawl_entries = self.crawler.crawl(previous=self._crawl_entries)
+        found = {path for path in self._crawl_entries if is_cut_list_dir(path)}
+        for directory in found - self._directories.keys():
+            self._directories[directory] = (None, {})
+            if initial:
+                self.poll_directory(directory, emit=False)
+        for directory in self._directories.keys() - found:
+            _, workbooks = self._directories.pop(directory)
+            self.emit_changes(workbooks, {})
+        logger.info(f"Polling {len(self._directories)} cut list directories, discovered in "
+                    f"{time.perf_counter() - started_at:.3f}s.")
+
+    def poll_directory(self, directory: str, emit: bool = True) -> None:
+        last_mtime, workbooks = self._directories.get(directory, (None, {}))
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+            if mtime_ns == last_mtime:
+                return
+            started_at = time.time_ns()
+            current = list_workbooks(directory)
+        except FileNotFoundError:
+            # Dropped from the index on the next discovery.
+            current, mtime_ns = {}, None
+        except OSError as e:
+            logger.warning(f"Cannot poll '{directory}': {e}")
+            return
+        if mtime_ns is not None and started_at - mtime_ns < RACY_WINDOW_NS:
+            mtime_ns = None
+        self._directories[directory] = (mtime_ns, current)
+        if emit:
+            self.emit_changes(workbooks, current)
+
+    def emit_changes(self, previous: FileStates, current: FileStates) -> None:
+        for path, state in current.items():
+            if path not in previous:
+                self.queue_event(FileCreatedEvent(path))
+            elif previous[path] != state:
+                self.queue_event(FileModifiedEvent(path))
+        for path in previous.keys() - current.keys():
+            self.queue_event(FileDeletedEvent(path))
+
+    def queue_events(self, timeout: float) -> None:
+        if self.stopped_event.wait(TICK):
+            return
+        now = time.monotonic()
+        if self._next_discovery is None or now >= self._next_discovery:
+            self.discover(initial=self._next_discovery is None)
+            self._next_discovery = now + self.discovery_interval
+        if self._cursor >= len(self._round):
+            # Start a new round, polling a slice of the directories on every tick.
+            self._round, self._cursor = list(self._directories), 0
+            ticks = max(self.interval / TICK, 1)
+            self._slice_size = math.ceil(len(self._round) / ticks)
+        batch = self._round[self._cursor:self._cursor + self._slice_size]
+        self._cursor += len(batch) or 1
+        for directory in batch:
+            if directory in self._directories and not self.stopped_event.is_set():
+                self.poll_directory(directory)
+
+
+class CutListPollingObserver(BaseObserver):
+    """
+    Observer polling the cut list directories of the watched path, a drop-in replacement for watchdog's `Observer`.
+
+    Example:
+        observer = CutListPollingObserver()
+        observer.schedule(event_handler, path=settings.WATCHING_DIR, recursive=True)
+        observer.start()
+    """
+
+    def __init__(self, timeout: float = DEFAULT_OBSERVER_TIMEOUT) -> None:
+        super().__init__(CutListPollingEmitter, timeout=timeout)
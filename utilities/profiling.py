@@ -0,0 +1,192 @@
+"""
+Opt-in profiling of jobs, to find out why a particular pair is slow.
+
+A fraction `PROFILE_SAMPLE_RATE` of the jobs, all of them at 1, run under cProfile, and with `PROFILE_MEMORY` under
+tracemalloc too. The threads started by the job, e.g. the stages of `tesseract.process_pipelined`, are profiled along
+with the thread running it. Each profiled job leaves in `PROFILE_DIR`:
+
+    <time>-<name>-<pid>.prof    the cProfile statistics, for `python -m pstats` or snakeviz
+    <time>-<name>-<pid>.txt     the 40 most expensive functions by cumulative time
+    <time>-<name>-<pid>.json    the job paths, status, page count, duration, stage times and peak traced memory
+
+`report.json` keeps the `PROFILE_TOP_N` slowest jobs, the `PROFILE_TOP_N` jobs with the highest traced memory peak
+and the `PROFILE_TOP_N` most recent jobs. Dumps that fall out of all three lists are deleted. Worker processes update
+the report under a file lock.
+
+When `PROFILE_SAMPLE_RATE` is 0, the default, jobs run without any of this.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+import settings
+from utilities import functions
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SKIPPED_STATUSES = ('skipped', 'invalid')
+
+REPORT_FILE_NAME = "report.json"
+
+
+def should_profile() -> bool:
+    rate = settings.PROFILE_SAMPLE_RATE
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+class JobProfiler:
+    """
+    cProfile profiler of the calling thread and of the threads it starts while it is running.
+    """
+
+    def __init__(self) -> None:
+        self.profilers: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _profile_thread(self, frame, event, arg) -> None:
+        # Installed by `threading.setprofile`, so it runs on the first event of every new thread.
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread from the profiler of the job thread.
+            return
+        with self._lock:
+            self.profilers.append(profiler)
+
+    def start(self) -> None:
+        profiler = cProfile.Profile()
+        self.profilers.append(profiler)
+        threading.setprofile(self._profile_thread)
+        profiler.enable()
+
+    def stop(self) -> pstats.Stats:
+        self.profilers[0].disable()
+        threading.setprofile(None)
+        with self._lock:
+            return pstats.Stats(*self.profilers)
+
+
+@contextmanager
+def profile(excel_path: Union[str, Path], report: dict) -> Iterator[None]:
+    """
+    Profiles the block, a job whose report is collected by `metrics.job`, and writes its dumps once it finished.
+
+    Example:
+        with metrics.job() as report:
+            with profiling.profile(excel_path, report):
+                run_workbook(excel_path)
+    """
+    profiler = JobProfiler()
+    if settings.PROFILE_MEMORY:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    profiler.start()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        stats = profiler.stop()
+        duration = time.perf_counter() - started_at
+        peak = None
+        if settings.PROFILE_MEMORY:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        if failed:
+            report = dict(report, status="failed")
+        if report["status"] not in SKIPPED_STATUSES:
+            try:
+                write_profile(Path(excel_path), report=report, stats=stats, duration=duration, peak=peak)
+            except Exception as e:
+                logger.error(f"Cannot write the profile of '{excel_path}': {e}")
+
+
+def write_profile(excel_path: Path, report: dict, stats: pstats.Stats, duration: float, peak: Optional[int],
+                  directory: Optional[Path] = None) -> Path:
+    """
+    Writes the dumps of a profiled job and adds it to the rolling report. Returns the path of the '.prof' file.
+    """
+    directory = Path(directory or settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = f"{time.strftime('%Y%m%dT%H%M%S')}-{functions.clean_name(excel_path.stem)}-{os.getpid()}"
+    stats.dump_stats(directory / f"{stem}.prof")
+    summary = io.StringIO()
+    stats.stream = summary
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(40)
+    (directory / f"{stem}.txt").write_text(summary.getvalue())
+    entry = {
+        "profile": f"{stem}.prof",
+        "excel_path": str(excel_path),
+        "pdf_path": str(functions.get_pdf_path(excel_path=excel_path)),
+        "status": report["status"],
+        "pages": report["pages"],
+        "duration": round(duration, 3),
+        "stages": {name: round(seconds, 3) for name, seconds in report["stages"].items()},
+        "memory_peak": peak,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    (directory / f"{stem}.json").write_text(json.dumps(entry, indent=2))
+    update_report(directory, entry)
+    logger.info(f"Profiled '{excel_path.name}' in {duration:.1f}s, see '{directory / stem}.txt'.")
+    return directory / f"{stem}.prof"
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    with open(path, "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def update_report(directory: Path, entry: dict, top: Optional[int] = None) -> None:
+    """
+    Adds a job to the rolling report of the profile directory and deletes the dumps no longer listed in it.
+    """
+    top = top or settings.PROFILE_TOP_N
+    report_path = directory / REPORT_FILE_NAME
+    with locked(directory / f"{REPORT_FILE_NAME}.lock"):
+        try:
+            report = json.loads(report_path.read_text())
+        except (OSError, ValueError):
+            report = {}
+        entries = {item["profile"]: item for key in ("slowest", "memory", "recent") for item in report.get(key, [])}
+        entries[entry["profile"]] = entry
+        items = list(entries.values())
+        report = {
+            "slowest": sorted(items, key=lambda item: item["duration"], reverse=True)[:top],
+            "memory": sorted((item for item in items if item["memory_peak"] is not None),
+                             key=lambda item: item["memory_peak"], reverse=True)[:top],
+            "recent": sorted(items, key=lambda item: item["finished_at"], reverse=True)[:top],
+        }
+        temporary_path = directory / f".{REPORT_FILE_NAME}.{os.getpid()}.tmp"
+        temporary_path.write_text(json.dumps(report, indent=2))
+        os.replace(temporary_path, report_path)
+        kept = {item["profile"] for key in report for item in report[key]}
+        for name in entries.keys() - kept:
+            for suffix in (".prof", ".txt", ".json"):
+                (directory / name).with_suffix(suffix).unlink(missing_ok=True)
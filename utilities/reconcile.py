@@ -0,0 +1,254 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from watchdog.events import FileCreatedEvent
+
+import settings
+from utilities import functions
+from utilities.manifest import Manifest
+from utilities.work_queue import PRIORITY_BACKFILL, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+
+def is_cut_list_dir(path: str) -> bool:
+    parent, name = os.path.split(path)
+    return name == settings.CUT_LIST_DIR and os.path.basename(parent) == 'briefing'
+
+
+class DirectoryIndex:
+    """
+    Persistent index of the directories seen by the last crawl: their mtime and, for directories above the cut list
+    level, the names of their subdirectories. A directory whose mtime did not change has the same entries, so its
+    listing can be reused without reading it again.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None) -> None:
+        self.path = Path(path) if path is not None else settings.RECONCILE_INDEX_FILE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS directories "
+                                    "(path TEXT PRIMARY KEY, mtime_ns INTEGER, children TEXT)")
+
+    def load(self) -> Dict[str, Tuple[int, Optional[List[str]]]]:
+        rows = self.connection.execute("SELECT path, mtime_ns, children FROM directories").fetchall()
+        return {path: (mtime_ns, json.loads(children) if children is not None else None)
+                for path, mtime_ns, children in rows}
+
+    def replace(self, entries: Dict[str, Tuple[int, Optional[List[str]]]]) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM directories")
+            self.connection.executemany("INSERT INTO directories VALUES (?, ?, ?)",
+                                        [(path, mtime_ns, json.dumps(children) if children is not None else None)
+                                         for path, (mtime_ns, children) in entries.items()])
+
+
+class DirectoryCrawler:
+    """
+    Finds the cut list directories of a tree with a parallel `os.scandir` crawl. Directories below a cut list directory
+    are never entered, and directories whose mtime is unchanged since the previous crawl are not listed again: their
+    subdirectories are taken from the previous crawl.
+
+    Example:
+        changed, seen = DirectoryCrawler(root).crawl(previous={})
+    """
+
+    def __init__(self, root: Optional[Union[str, Path]] = None, workers: Optional[int] = None) -> None:
+        self.root = str(root if root is not None else settings.WATCHING_DIR)
+        self.workers = workers or settings.RECONCILE_WORKERS
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def list_subdirectories(path: str) -> List[str]:
+        with os.scandir(path) as entries:
+            return [entry.name for entry in entries
+                    if not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False)]
+
+    def visit(self, path: str, previous: Dict[str, Tuple[int, Optional[List[str]]]], seen: dict, changed: list,
+              force: bool) -> List[str]:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logger.warning(f"Cannot read '{path}': {e}")
+            return []
+        last = previous.get(path)
+        unchanged = last is not None and last[0] == mtime_ns
+        if is_cut_list_dir(path):
+            with self._lock:
+                seen[path] = (mtime_ns, None)
+                if force or not unchanged:
+                    changed.append(path)
+            return []
+        children = last[1] if unchanged and last[1] is not None else None
+        if children is None:
+            try:
+                children = self.list_subdirectories(path)
+            except OSError as e:
+                logger.warning(f"Cannot list '{path}': {e}")
+                return []
+        with self._lock:
+            seen[path] = (mtime_ns, children)
+        return [os.path.join(path, child) for child in children]
+
+    def crawl(self, previous: Dict[str, Tuple[int, Optional[List[str]]]],
+              force: bool = False) -> Tuple[List[str], Dict[str, Tuple[int, Optional[List[str]]]]]:
+        """
+        Crawls the tree and returns the cut list directories that changed since the previous crawl, together with the
+        entries of this crawl, to be passed as `previous` to the next one. Cut list directories have no children.
+
+        Args:
+            previous (Dict[str, Tuple[int, Optional[List[str]]]]): The entries of the previous crawl.
+            force (bool, optional): Return every cut list directory, changed or not. Defaults to False.
+        """
+        seen: Dict[str, Tuple[int, Optional[List[str]]]] = {}
+        changed: List[str] = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawl") as pool:
+            pending = {pool.submit(self.visit, self.root, previous, seen, changed, force)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for child in future.result():
+                        pending.add(pool.submit(self.visit, child, previous, seen, changed, force))
+        return changed, seen
+
+
+class Reconciler:
+    """
+    Finds '.xlsx'/'_ETQs.pdf' pairs whose 'CORRECTED' output is missing or out of date, and enqueues them on the event
+    queue with the backfill priority, behind live events. This catches up on changes made while the watcher was not
+    running.
+
+    An output recorded in the `Manifest` is out of date when the content of the workbook or of the PDF file differs
+    from the inputs it was produced from, so re-saving a file without changing it, which the job skips without
+    touching the output, does not make the pair stale. The digests are cached by size and mtime, so unchanged files are
+    not read. Outputs the manifest does not know, or that were changed since they were recorded, are out of date when
+    they are older than one of their inputs.
+
+    The tree is crawled by a `DirectoryCrawler`, starting from the persistent `DirectoryIndex` of the previous run, so
+    unchanged directories are not listed again and unchanged cut list directories are skipped. Cut list directories
+    that still had stale pairs are checked again on the next run, so jobs lost in a crash are not forgotten.
+
+    Example:
+        reconciler = Reconciler(event_queue)
+        reconciler.run()
+    """
+
+    def __init__(self, event_queue: WorkQueue, root: Optional[Union[str, Path]] = None, workers: Optional[int] = None,
+                 index: Optional[DirectoryIndex] = None, manifest: Optional[Manifest] = None) -> None:
+        self.event_queue = event_queue
+        self.crawler = DirectoryCrawler(root, workers=workers)
+        self.index = index or DirectoryIndex()
+        self.manifest = manifest or Manifest()
+
+    def crawl(self, force: bool = False) -> Tuple[List[str], Dict[str, Tuple[int, Optional[List[str]]]]]:
+        """
+        Crawls the tree and returns the cut list directories that changed since the last run, together with the new
+        index entries.
+
+        Args:
+            force (bool, optional): Return every cut list directory, changed or not. Defaults to False.
+        """
+        return self.crawler.crawl(previous=self.index.load(), force=force)
+
+    def is_stale(self, excel_path: Path, pdf_path: Path) -> bool:
+        """
+        Whether the output of a pair is missing or out of date, see the class docstring.
+
+        Raises:
+            FileNotFoundError: If the workbook or the PDF file does not exist.
+        """
+        inputs_mtime = max(excel_path.stat().st_mtime, pdf_path.stat().st_mtime)
+        output_path = functions.get_output_path(pdf_path)
+        try:
+            output_mtime = output_path.stat().st_mtime
+        except FileNotFoundError:
+            return True
+        recorded = self.manifest.get_recorded_key(output_path=output_path)
+        if recorded is None:
+            return output_mtime < inputs_mtime
+        return (recorded.excel_digest, recorded.pdf_digest) != (self.manifest.get_file_digest(excel_path),
+                                                                self.manifest.get_file_digest(pdf_path))
+
+    def get_stale_workbooks(self, directory: str) -> List[Path]:
+        """
+        Returns the workbooks of a cut list directory whose PDF exists and whose output is missing or out of date.
+        """
+        stale = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not functions.path_classifier.is_valid_path(entry.path):
+                    continue
+                excel_path = Path(entry.path)
+                try:
+                    if self.is_stale(excel_path, functions.get_pdf_path(excel_path=excel_path)):
+                        stale.append(excel_path)
+                except FileNotFoundError:
+                    continue
+        return stale
+
+    def run(self, force: bool = False) -> int:
+        """
+        Runs one reconciliation pass and enqueues the stale pairs.
+
+        Args:
+            force (bool, optional): Check every cut list directory, changed or not. Defaults to False.
+
+        Returns:
+            int: The number of enqueued workbooks.
+        """
+        started_at = time.perf_counter()
+        changed, seen = self.crawl(force=force)
+        enqueued = 0
+        for directory in changed:
+            try:
+                stale = self.get_stale_workbooks(directory)
+            except OSError as e:
+                logger.warning(f"Cannot list '{directory}': {e}")
+                seen.pop(directory, None)
+                continue
+            if stale:
+                # Forget the mtime so the directory is checked again until its outputs are up to date.
+                seen.pop(directory, None)
+            for excel_path in stale:
+                self.event_queue.put(('created', FileCreatedEvent(str(excel_path))), priority=PRIORITY_BACKFILL)
+                enqueued += 1
+        self.index.replace(seen)
+        logger.info(f"Reconciliation crawled {len(seen)} directories, checked {len(changed)} cut lists and enqueued "
+                     f"{enqueued} stale jobs in {time.perf_counter() - started_at:.3f}s.")
+        return enqueued
+
+
+def reconcile_worker(reconciler: Reconciler, trigger: threading.Event, stop: threading.Event,
+                     interval: Optional[float] = None, on_startup: Optional[bool] = None) -> None:
+    """
+    Runs a reconciliation pass at startup, then again whenever `trigger` is set or every `interval` seconds, until
+    `stop` is set.
+
+    :param reconciler: The Reconciler to run.
+    :param trigger: Event set to request an on-demand pass, e.g. from a signal handler.
+    :param stop: Event set to stop the worker. `trigger` must also be set to wake it up.
+    :param interval: Seconds between periodic passes. Defaults to `settings.RECONCILE_INTERVAL`; 0 disables them.
+    :param on_startup: Whether to run a pass at startup. Defaults to `settings.RECONCILE_ON_STARTUP`.
+    """
+    if interval is None:
+        interval = settings.RECONCILE_INTERVAL
+    if on_startup is None:
+        on_startup = settings.RECONCILE_ON_STARTUP
+    if not on_startup:
+        trigger.wait(interval or None)
+        trigger.clear()
+    while not stop.is_set():
+        try:
+            reconciler.run()
+        except Exception as e:
+            logger.error(f"Reconciliation failed: {e}")
+        trigger.wait(interval or None)
+        trigger.clear()
@@ -0,0 +1,97 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DebounceScheduler:
+    """
+    Thread-safe trailing debounce scheduler backed by a timer heap.
+
+    Every call to `schedule` (re)sets the deadline of a key to `delay` seconds from now, so a key is only released once
+    it has been quiet for the whole delay. All keys whose deadlines have passed are released together, regardless of
+    how many other keys are waiting. Superseded heap entries are discarded lazily when they reach the top of the heap.
+
+    Example:
+        scheduler = DebounceScheduler(delay=5)
+        scheduler.schedule(directory)
+        threading.Thread(target=scheduler.run, args=(handler.scan_directory,)).start()
+        scheduler.stop()
+    """
+
+    def __init__(self, delay: Optional[float] = None) -> None:
+        self.delay = settings.DELAY_FOR_SCAN if delay is None else delay
+        self._condition = threading.Condition()
+        self._deadlines: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._counter = itertools.count()
+        self._stopped = False
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._deadlines)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._condition:
+            return key in self._deadlines
+
+    def schedule(self, key: Hashable, delay: Optional[float] = None) -> None:
+        """
+        Schedules a key for release, pushing back its deadline if it is already waiting.
+
+        Args:
+            key (Hashable): The key to release, usually a directory Path.
+            delay (float, optional): Quiet period in seconds. Defaults to the scheduler delay.
+        """
+        deadline = time.monotonic() + (self.delay if delay is None else delay)
+        with self._condition:
+            self._deadlines[key] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._counter), key))
+            self._condition.notify()
+
+    def pop_due(self) -> Optional[List[Hashable]]:
+        """
+        Blocks until at least one key is due and returns every due key, or None once the scheduler is stopped.
+        """
+        with self._condition:
+            while not self._stopped:
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, _, key = heapq.heappop(self._heap)
+                    if self._deadlines.get(key) == deadline:
+                        del self._deadlines[key]
+                        due.append(key)
+                if due:
+                    return due
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._condition.wait(timeout)
+            return None
+
+    def run(self, callback: Callable[[Hashable], None]) -> None:
+        """
+        Releases due keys to the callback until the scheduler is stopped.
+
+        Args:
+            callback (Callable[[Hashable], None]): Called once for every released key.
+        """
+        while True:
+            due = self.pop_due()
+            if due is None:
+                break
+            for key in due:
+                try:
+                    callback(key)
+                except Exception as e:
+                    logger.error(f"Error while releasing '{key}': {e}")
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
@@ -1,17 +1,120 @@
 import logging.config
+from pathlib import Path
+from typing import Union
 
-from utilities import tesseract, functions
+from utilities import tesseract, functions, metrics, profiling
+from utilities.manifest import JobKey, Manifest
 
 logger = logging.getLogger(__name__)
 
+_manifest = None
 
-def process_event(event_type, event):
-    logger.info(f"Event type: {event_type} | Event src_path: {event.src_path}")
-    excel_path = functions.validate_path(event.src_path)
-    if not functions.verify(source_path=excel_path):
+
+def get_manifest() -> Manifest:
+    global _manifest
+    if _manifest is None:
+        _manifest = Manifest()
+    return _manifest
+
+
+def process_incrementally(excel_path: Path, pdf_path: Path, output_path: Path, key: JobKey) -> bool:
+    """
+    Updates an existing output when only the workbook changed since it was produced. The recorded tag names of every
+    page are looked up in the new workbook, and only the pages whose value changed are re-stamped.
+
+    :param excel_path: The path to the Excel file.
+    :param pdf_path: The path to the '_ETQs.pdf' file.
+    :param output_path: The path to the existing output PDF.
+    :param key: The key of the current inputs.
+    :return: True if the output was brought up to date, False if it has to be processed in full.
+    """
+    manifest = get_manifest()
+    recorded = manifest.get_recorded_key(output_path=output_path)
+    if recorded is None or (recorded.pdf_digest, recorded.config_digest) != (key.pdf_digest, key.config_digest):
+        return False
+    pages = manifest.get_pages(output_path=output_path)
+    if pages is None:
+        return False
+    names = [name for name, _ in pages]
+    try:
+        values = tesseract.get_tags_value_from_excel(excel_path=excel_path, tags=names)
+    except Exception as e:
+        logger.error(f"Cannot look up the tag values of '{excel_path.name}', processing it in full: {e}")
+        return False
+    changed = {page: value for page, ((_, old), value) in enumerate(zip(pages, values), start=1) if old != value}
+    with metrics.stage('restamp'):
+        if not tesseract.restamp(pdf_path=pdf_path, output_path=output_path, pages=changed):
+            return False
+    logger.info(f"Re-stamped {len(changed)} of {len(pages)} pages of '{output_path.name}'.")
+    manifest.record(output_path=output_path, key=key, pages=list(zip(names, values)))
+    return True
+
+
+def process_event(event_type, event) -> dict:
+    """
+    Processes the '.xlsx'/'_ETQs.pdf' pair of an event, see `process_workbook`.
+    """
+    logger.debug(f"Event type: {event_type} | Event src_path: {event.src_path}")
+    return process_workbook(event.src_path)
+
+
+def process_workbook(excel_path: Union[str, Path], force: bool = False) -> dict:
+    """
+    Processes the '.xlsx'/'_ETQs.pdf' pair of an Excel file and returns the job report collected by `metrics.job`, with
+    the job status: 'processed', 'incremental', 'skipped', 'invalid' or 'failed'.
+
+    A sample of the jobs is profiled when `settings.PROFILE_SAMPLE_RATE` is set, see `profiling`. When the job used
+    the OCR cache, its hits and misses are logged once the job finished.
+
+    :param excel_path: The path to the Excel file.
+    :param force: Process the pair in full even if its output is up to date.
+    :return: The job report.
+    """
+    with metrics.job() as report:
+        if profiling.should_profile():
+            with profiling.profile(excel_path, report):
+                run_workbook(excel_path, force=force)
+        else:
+            run_workbook(excel_path, force=force)
+    counters = report["counters"]
+    if 'ocr_cache_hits' in counters or 'ocr_cache_misses' in counters:
+        logger.info(f"OCR cache for '{Path(excel_path).name}': {counters.get('ocr_cache_hits', 0)} hits, "
+                    f"{counters.get('ocr_cache_misses', 0)} misses.")
+    return report
+
+
+def run_workbook(excel_path: Union[str, Path], force: bool = False):
+    excel_path = functions.validate_path(excel_path)
+    if not functions.path_classifier.is_valid_path(excel_path):
         logger.error(f"File path '{excel_path}' is not valid!")
+        metrics.set_status('invalid')
+        return
     pdf_path = functions.get_pdf_path(excel_path=excel_path)
     if not pdf_path.exists():
         logger.error(f"PDF path '{pdf_path}' does not exist!")
+        metrics.set_status('invalid')
+        return
+    manifest = get_manifest()
+    output_path = tesseract.get_output_path(pdf_path)
+    try:
+        config = tesseract.get_pipeline_config(pdf_path=pdf_path)
+    except ValueError as e:
+        logger.error(f"{e}")
+        metrics.set_status('failed')
+        return
+    with metrics.stage('fingerprint'):
+        key = manifest.get_job_key(excel_path=excel_path, pdf_path=pdf_path, config=config)
+    if force:
+        logger.info(f"Reprocessing '{excel_path.name}'.")
+    elif manifest.is_up_to_date(output_path=output_path, key=key):
+        logger.info(f"Output '{output_path.name}' is up to date, skipping.")
+        metrics.set_status('skipped')
+        return
+    elif process_incrementally(excel_path=excel_path, pdf_path=pdf_path, output_path=output_path, key=key):
+        metrics.set_status('incremental')
+        return
+    pages = tesseract.process(pdf_path=pdf_path, excel_path=excel_path, output_path=output_path)
+    if pages is None:
+        metrics.set_status('failed')
         return
-    tesseract.process(pdf_path=pdf_path, excel_path=excel_path)
+    manifest.record(output_path=output_path, key=key, pages=pages)
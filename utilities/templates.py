@@ -0,0 +1,209 @@
+"""
+Label templates: where the tag name is printed on a label, which box covers the old value and where the new value is
+written. Templates are independent of the rendering resolution, so the OCR and output DPIs can be chosen freely.
+
+A template is read from a JSON file, looked up for each '_ETQs.pdf' file in this order:
+
+1. '<stem>.template.json' next to the PDF file, for a single file.
+2. `settings.TEMPLATE_FILE_NAME` in the folder of the PDF file or one of its parents inside `WATCHING_DIR`.
+3. The file at `settings.LABEL_TEMPLATE`, if set.
+4. `DEFAULT_TEMPLATE`, the layout the pipeline has always used.
+
+Example file, in fractions of the page width and height:
+
+    {
+        "name": "60x40",
+        "units": "page",
+        "name_region": {"left": 0.03, "top": 0.55, "right": 0.8, "bottom": 0.68},
+        "mask_region": {"left": 0.83, "top": 0.55, "right": 0.99, "bottom": 0.7},
+        "text_anchor": [0.86, 0.66],
+        "font_size": 18
+    }
+
+`units` is 'page' for fractions of the page, 'pt' for PDF points or 'px' for pixels at the template `dpi`, all measured
+from the top left corner of the page. Missing keys are taken from `DEFAULT_TEMPLATE`, except the regions and the text
+anchor, which are required in units other than the default's and in pixels at another `dpi`. `font_size` is always in points.
+"""
+import functools
+import json
+import logging
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple, Union
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+POINTS_PER_INCH = 72
+
+UNITS = ('page', 'pt', 'px')
+
+GEOMETRY_KEYS = ('name_region', 'mask_region', 'text_anchor')
+
+
+class Box(NamedTuple):
+    left: float
+    top: float
+    right: float
+    bottom: float
+
+
+class Geometry(NamedTuple):
+    """
+    A template resolved for a page size and a resolution, in pixels.
+    """
+    crop_region: Tuple[float, float, float, float]
+    mask_region: Tuple[Tuple[float, float], Tuple[float, float]]
+    text_anchor: Tuple[float, float]
+    font_size: float
+
+    def rounded(self) -> "Geometry":
+        """
+        Returns the geometry in whole pixels, for raster images.
+        """
+        (left, top), (right, bottom) = self.mask_region
+        return Geometry(crop_region=tuple(round(value) for value in self.crop_region),
+                        mask_region=((round(left), round(top)), (round(right), round(bottom))),
+                        text_anchor=tuple(round(value) for value in self.text_anchor), font_size=self.font_size)
+
+
+class LabelTemplate(NamedTuple):
+    name: str
+    units: str
+    name_region: Box
+    mask_region: Box
+    text_anchor: Tuple[float, float]
+    font_size: float
+    dpi: float = 500
+
+    def get_scale(self, page_size: Optional[Tuple[float, float]], dpi: float) -> Tuple[float, float]:
+        """
+        Returns the horizontal and vertical factors from template units to pixels at `dpi`.
+
+        Args:
+            page_size (Optional[Tuple[float, float]]): The page width and height in points, needed for 'page' units.
+            dpi (float): The target resolution.
+        """
+        if self.units == 'page':
+            if page_size is None:
+                raise ValueError(f"Template '{self.name}' is relative to the page, the page size is required.")
+            width, height = page_size
+            return width * dpi / POINTS_PER_INCH, height * dpi / POINTS_PER_INCH
+        if self.units == 'pt':
+            return dpi / POINTS_PER_INCH, dpi / POINTS_PER_INCH
+        return dpi / self.dpi, dpi / self.dpi
+
+    def get_geometry(self, page_size: Optional[Tuple[float, float]], dpi: float) -> Geometry:
+        """
+        Resolves the template for a page size and a resolution.
+
+        Args:
+            page_size (Optional[Tuple[float, float]]): The page width and height in points.
+            dpi (float): The resolution of the geometry. Use 72 for PDF points.
+
+        Returns:
+            Geometry: The crop region as (top, bottom, left, right), the mask region as ((left, top), (right, bottom)),
+            the text anchor and the font size, all in pixels at `dpi`.
+
+        Example:
+            geometry = template.get_geometry(page_size=(283.4, 141.7), dpi=300).rounded()
+        """
+        x_scale, y_scale = self.get_scale(page_size, dpi)
+        name, mask = self.name_region, self.mask_region
+        return Geometry(
+            crop_region=(name.top * y_scale, name.bottom * y_scale, name.left * x_scale, name.right * x_scale),
+            mask_region=((mask.left * x_scale, mask.top * y_scale), (mask.right * x_scale, mask.bottom * y_scale)),
+            text_anchor=(self.text_anchor[0] * x_scale, self.text_anchor[1] * y_scale),
+            font_size=self.font_size * dpi / POINTS_PER_INCH,
+        )
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "units": self.units, "name_region": self.name_region._asdict(),
+                "mask_region": self.mask_region._asdict(), "text_anchor": list(self.text_anchor),
+                "font_size": self.font_size, "dpi": self.dpi}
+
+    @classmethod
+    def from_dict(cls, data: dict, base: Optional["LabelTemplate"] = None) -> "LabelTemplate":
+        """
+        Builds a template from its JSON representation, taking the missing keys from `base`.
+
+        Raises:
+            ValueError: If the units are unknown, a region is missing or a region or the dpi is malformed.
+        """
+        base = base or DEFAULT_TEMPLATE
+        values = base.to_dict()
+        values.update(data)
+        if values["units"] not in UNITS:
+            raise ValueError(f"Unknown template units '{values['units']}', expected one of {UNITS}.")
+        try:
+            dpi = float(values["dpi"])
+        except (TypeError, ValueError):
+            raise ValueError(f"Malformed template dpi '{values['dpi']}'.")
+        missing = [key for key in GEOMETRY_KEYS if key not in data]
+        if missing and values["units"] != base.units:
+            raise ValueError(f"Template in '{values['units']}' units is missing {', '.join(missing)}.")
+        if missing and values["units"] == 'px' and dpi != base.dpi:
+            raise ValueError(f"Template in pixels at {dpi:g} dpi is missing {', '.join(missing)}.")
+        try:
+            return cls(name=str(values["name"]), units=values["units"], name_region=Box(**values["name_region"]),
+                       mask_region=Box(**values["mask_region"]), text_anchor=tuple(values["text_anchor"]),
+                       font_size=float(values["font_size"]), dpi=dpi)
+        except TypeError as e:
+            raise ValueError(f"Malformed template: {e}")
+
+
+# The layout the pipeline was built for, in pixels at 500 dpi.
+DEFAULT_TEMPLATE = LabelTemplate(name="default", units="px", dpi=500, name_region=Box(70, 540, 1600, 670),
+                                 mask_region=Box(1630, 540, 1955, 690), text_anchor=(1700, 650), font_size=18)
+
+
+@functools.lru_cache(maxsize=64)
+def _load_template(path: str, mtime_ns: int) -> LabelTemplate:
+    return LabelTemplate.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def load_template(path: Union[str, Path]) -> LabelTemplate:
+    """
+    Reads a template file, parsing it only when it changed since it was last read by this process.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If the file is not a valid template.
+    """
+    path = Path(path)
+    return _load_template(str(path), path.stat().st_mtime_ns)
+
+
+def find_template_file(pdf_path: Path) -> Optional[Path]:
+    candidate = pdf_path.with_name(f"{pdf_path.stem}.template.json")
+    if candidate.is_file():
+        return candidate
+    root = settings.WATCHING_DIR
+    for directory in pdf_path.parents:
+        candidate = directory / settings.TEMPLATE_FILE_NAME
+        if candidate.is_file():
+            return candidate
+        if directory == root or root not in directory.parents:
+            break
+    if settings.LABEL_TEMPLATE:
+        return Path(settings.LABEL_TEMPLATE)
+    return None
+
+
+def get_template(pdf_path: Union[str, Path]) -> LabelTemplate:
+    """
+    Returns the template of a '_ETQs.pdf' file, see the module docstring.
+
+    Raises:
+        ValueError: If the template file of the PDF file cannot be read, rather than stamping with the wrong layout.
+
+    Example:
+        template = get_template(pdf_path)
+    """
+    path = find_template_file(Path(pdf_path))
+    if path is None:
+        return DEFAULT_TEMPLATE
+    try:
+        return load_template(path)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read the label template '{path}': {e}")
@@ -3,59 +3,60 @@ Created in Sep 2022
 supports the following Python versions: 3.6, 3.7, 3.8, 3.9, 3.10
 Developer: Iaggo Capitanio.
 """
-from typing import Union, List, Optional, Tuple
+from typing import Callable, Union, List, Optional, Tuple, Iterator, Dict
+from concurrent.futures import ThreadPoolExecutor
+import functools
 from pathlib import Path
 import os
-from pdf2image import convert_from_path
+import subprocess
+import tempfile
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL.PpmImagePlugin import PpmImageFile
 import cv2
 import numpy
-import pandas
+import pikepdf
 import pytesseract
 import img2pdf
 import io
 import logging
+import threading
+import uuid
+import settings
+from utilities import functions, metrics, ocr, overlay, pipeline, templates, textlayer, workbook
+from utilities.ocr_cache import CachedOcrBackend, OcrCache
 
 logger = logging.getLogger(__name__)
 
+PIPELINE_VERSION = 2
 
-def get_tesseract_path() -> Path:
-    """
-    This function aims to get the path that points to the tesseract executable. This function works in both operational
-    system: Linux and Windows.
-    @return:
-    """
-    import subprocess
-    import os
+# The default template at its native resolution, used by the helpers that take pixel coordinates without a template.
+DPI = 500
 
-    def find_tesseract(finder: str = "which") -> str:
-        """
-        Searches for the tesseract executable using the specified command to locate executables in the system. It
-        relies on a terminal command to find the path to the 'tesseract' executable.
+_DEFAULT_GEOMETRY = templates.DEFAULT_TEMPLATE.get_geometry(page_size=None, dpi=DPI).rounded()
 
-        For Linux, the default command is 'which', and for Windows, it is 'where'. The function returns the full path to
-        the tesseract executable as a string.
+CROP_REGION = list(_DEFAULT_GEOMETRY.crop_region)
 
-        Args:
-            finder (str, optional): Command used to find the executable in the system. Defaults to 'which' for Linux.
+MASK_REGION = _DEFAULT_GEOMETRY.mask_region
 
-        Returns:
-            str: Full path to the tesseract executable as a string.
+TEXT_ANCHOR = _DEFAULT_GEOMETRY.text_anchor
 
-        Example:
-            tesseract_path = find_tesseract()
-        """
-        output = subprocess.Popen([finder, 'tesseract'], stdout=subprocess.PIPE)
-        return output.communicate()[0].decode("utf-8")
+TEXT_FONT_SIZE = templates.DEFAULT_TEMPLATE.font_size
 
-    if os.name == 'nt':
-        result = find_tesseract(finder='where')
-    elif os.name == 'posix':
-        result = find_tesseract()
-    else:
-        raise OSError('Invalid OS')
-    tesseract_path: Path = Path(result.strip())
-    return tesseract_path
+# Pixel height of the text drawn by `cv2.putText` at font scale 1, used to convert font sizes to font scales.
+HERSHEY_FONT_HEIGHT = 31.25
+
+TESSERACT_CONFIG = r'--oem 3 --psm 6'
+
+_ocr_cache: Optional[OcrCache] = None
+
+
+def get_tesseract_path() -> Path:
+    """
+    This function aims to get the path that points to the tesseract executable. This function works in both operational
+    system: Linux and Windows. The lookup is done once per process and cached, see `functions.get_tesseract_cmd`.
+    @return:
+    """
+    return functions.get_tesseract_cmd()
 
 
 def get_tesseract_dir() -> Path:
@@ -72,7 +73,13 @@ def get_tesseract_dir() -> Path:
     return tesseract_path.parent
 
 
-pytesseract.pytesseract.tesseract_cmd = get_tesseract_path()
+@functools.cache
+def configure_tesseract() -> None:
+    """
+    Points pytesseract at the tesseract executable. Called before the first OCR call of the process instead of at import
+    time, so importing this module never searches the filesystem.
+    """
+    pytesseract.pytesseract.tesseract_cmd = str(get_tesseract_path())
 
 
 def normalize_name(name: str) -> str:
@@ -113,156 +120,431 @@ def convert_str_to_path(path: Union[Path, str]) -> Path:
     return path.resolve()
 
 
-def extract_tag_name_from_image(img: Union[str, Path, numpy.ndarray], crop_region: list = None) -> str:
+def get_tags_value_from_excel(excel_path: Union[str, Path], tags: list, sheet_name: str = workbook.SHEET_NAME) -> \
+        List[Optional[int]]:
     """
-    Extracts the tag name from a specific image. The image should follow certain size and dpi standards. The function
-    crops the image according to the specified matrix and extracts the string using the tesseract package.
+    Retrieves the corresponding tag values from the given Excel file for the provided list of tag names.
+
+    The name and value columns are read once into an index, which is reused while the file is unchanged. Tags that
+    cannot be found are logged and returned as None instead of failing the whole document.
 
     Args:
-        img (Union[str, Path, np.ndarray]): The target image, either as a file path (str or Path) or as a numpy array.
-        crop_region (list, optional): The region to crop the image. Defaults to None.
+        excel_path (Union[str, Path]): The path to the Excel file containing the tag data.
+        tags (List[str]): A list of tag names to search for in the Excel file.
+        sheet_name (str, optional): The name of the sheet in the Excel file containing the tag data. Defaults to
+        'DATA - Paineis'.
+
     Returns:
-        str: The tag name contained in the image.
+        List[Optional[int]]: A list of integer tag values corresponding to the provided tag names.
 
     Example:
-        tag_name = extract_tag_name_from_image("path/to/image.jpg")
+        tag_values = get_tags_value_from_excel(excel_path, tags, sheet_name)
     """
-    if crop_region is None:
-        crop_region = [540, 670, 70, 1600]
-    if isinstance(img, Path) or isinstance(img, str):
-        img = cv2.imread(img.__str__())
-    crop = img[crop_region[0]: crop_region[1], crop_region[2]: crop_region[3]]  # [rows, columns]
-    custom_config = r'--oem 3 --psm 6'  # Adding custom options
-    result = pytesseract.image_to_string(crop, config=custom_config)
-    return normalize_name(name=result)
+    with metrics.stage('excel'):
+        index = workbook.get_tag_index(excel_path, sheet_name=sheet_name)
+        return workbook.lookup_tag_values(index, tags=tags)
+
+
+def create_pdf_with_tags(images: List[numpy.ndarray], tags: List[Optional[int]], output_pdf_path: Path,
+                         save: bool = True, geometry: Optional[templates.Geometry] = None, dpi: int = DPI) -> None:
+    """
+    Creates a PDF file containing the given images with tags drawn on them.
+
+    The function takes a list of images as numpy arrays and a corresponding list of integer tags.
+    For each image, it draws the corresponding tag as text on the image and then saves the
+    modified images as a single PDF file.
+
+    Args:
+        images (List[numpy.ndarray]): A list of images as numpy arrays.
+        tags (List[Optional[int]]): A list of integer tags corresponding to each image in the 'images' list. Images
+        whose tag is None are left without text.
+        output_pdf_path (Path): The filename for the output PDF file.
+        save (bool): Save to a file.
+        geometry (templates.Geometry, optional): Where to write the tags, in pixels at `dpi`. Defaults to the default
+        template.
+        dpi (int, optional): The resolution the images were rendered at, which keeps the pages at their original size.
+        Defaults to `DPI`.
+
+    Returns:
+        None
+    """
+    if geometry is None:
+        geometry = templates.DEFAULT_TEMPLATE.get_geometry(page_size=None, dpi=dpi).rounded()
+    font_scale = geometry.font_size / HERSHEY_FONT_HEIGHT
+    thickness = max(1, round(font_scale))
+    buffer_list = []
+    logger.debug(f"Creating PDF file '{output_pdf_path}'")
+    for tag, image in zip(tags, images):
+        if tag is not None:
+            cv2.putText(image, str(tag), geometry.text_anchor, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255),
+                        thickness)
+        is_success, buffer = cv2.imencode(".png", image)
+        if is_success:
+            image_in_memory = io.BytesIO(buffer)
+            buffer_list.append(image_in_memory)
+    layout = img2pdf.get_fixed_dpi_layout_fun((dpi, dpi))
+    if save:
+        with open(output_pdf_path, "wb") as f:
+            f.write(img2pdf.convert(buffer_list, layout_fun=layout))
+    else:
+        return img2pdf.convert(buffer_list, layout_fun=layout)
 
 
-def extract_tag_value_from_dataframe(dataframe: pandas.DataFrame, tag_name: str,
-                                     column_header_tag_name: str = 'REF PEÇA (A)',
-                                     column_header_tag_value: str = 'ETIQ (H)') -> int:
+def get_ocr_cache() -> Optional[OcrCache]:
+    """
+    Returns the OCR result cache of this process, or None when `settings.OCR_CACHE_ENABLED` is off.
     """
-    Searches for a tag name in a given DataFrame and returns the corresponding value found.
+    global _ocr_cache
+    if settings.OCR_CACHE_ENABLED and _ocr_cache is None:
+        _ocr_cache = OcrCache()
+    return _ocr_cache
+
+
+def get_ocr_backend(name: Optional[str] = None) -> ocr.OcrBackend:
+    """
+    Returns the OCR backend with the given name, wrapped by the OCR result cache when it is enabled.
+
+    Args:
+        name (str, optional): The backend name. Defaults to `settings.OCR_BACKEND`.
+    """
+    configure_tesseract()
+    backend = ocr.get_backend(name or settings.OCR_BACKEND, config=TESSERACT_CONFIG)
+    cache = get_ocr_cache()
+    if cache is not None:
+        backend = CachedOcrBackend(backend, cache=cache)
+    return backend
+
+
+def recognize_tag_names(crops: List[numpy.ndarray]) -> List[str]:
+    """
+    Reads the tag names of many name crops with the configured OCR backend, in as few tesseract calls as the backend
+    allows. Crops already recognized before are answered from the OCR cache. If the backend fails, the crops are read
+    again one tesseract call at a time.
 
     Args:
-        dataframe (pd.DataFrame): The reference DataFrame to search. tag_name (str): The tag name to find.
-        column_header_tag_name (str, optional): The column header that contains the tag name. Defaults to
-        'REF PEÇA (A)'.
-        column_header_tag_value (str, optional): The column header that contains the tag value. Defaults to 'ETIQ (H)'.
+        crops (List[numpy.ndarray]): The name crops.
 
     Returns:
-        int: The value found corresponding to the tag name.
+        List[str]: The normalized tag name of each crop.
+    """
+    if not crops:
+        return []
+    backend = get_ocr_backend()
+    try:
+        texts = backend.recognize(crops)
+    except Exception as e:
+        if settings.OCR_BACKEND == ocr.PytesseractBackend.name:
+            raise
+        logger.warning(f"OCR backend '{backend.name}' failed, falling back to one call per page: {e}")
+        backend = get_ocr_backend(ocr.PytesseractBackend.name)
+        texts = backend.recognize(crops)
+    if isinstance(backend, CachedOcrBackend):
+        metrics.count('ocr_cache_hits', backend.hits)
+        metrics.count('ocr_cache_misses', backend.misses)
+    return [normalize_name(name=text) for text in texts]
+
+
+def get_page_runs(pages: List[int]) -> List[Tuple[int, int]]:
+    """
+    Groups page numbers into runs of consecutive pages.
 
     Example:
-        tag_value = extract_tag_value_from_dataframe(dataframe, "tag_name")
+        get_page_runs([1, 2, 3, 7, 9, 10])  # [(1, 3), (7, 7), (9, 10)]
     """
-    row = dataframe[dataframe[column_header_tag_name] == tag_name]
-    tag_value: int = int(row[column_header_tag_value].iloc[0])
-    return tag_value
+    runs = []
+    for page in sorted(pages):
+        if runs and runs[-1][1] == page - 1:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
 
 
-def draw_tags(images: List[numpy.ndarray], tags: List[int], output_folder: Path) -> None:
+def render_crops(pdf_path: Path, pages: List[int], crop_region: Tuple[int, int, int, int] = None,
+                 dpi: int = DPI) -> Dict[int, numpy.ndarray]:
     """
-    Draws tags on the given images and saves the annotated images to the specified output folder.
+    Renders only the name region of the given pages, in grayscale, with one 'pdftoppm' call per run of consecutive
+    pages. The crops are identical to slicing the full page rendered at the same dpi, at a fraction of the cost.
 
     Args:
-        images (List[np.ndarray]): A list of images in numpy.ndarray format.
-        tags (List[int]): A list of integer tags corresponding to each image.
-        output_folder (Path): The output folder where the annotated images will be saved.
+        pdf_path (Path): The path to the PDF file.
+        pages (List[int]): The 1-based page numbers to render.
+        crop_region (Tuple[int, int, int, int]): The region (top, bottom, left, right) in pixels at the given dpi.
+        dpi (int, optional): The rendering resolution. Defaults to `DPI`.
 
-    Example:
-        draw_tags(images, tags, output_folder)
+    Returns:
+        Dict[int, numpy.ndarray]: The crops keyed by page number.
     """
-    for tag, image in zip(tags, images):
-        cv2.putText(image, str(tag), (1700, 650), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 4)
-        cv2.imwrite(output_folder.joinpath(f"{tag}.png").__str__(), image)
+    if crop_region is None:
+        crop_region = CROP_REGION
+    top, bottom, left, right = crop_region
+    crops = {}
+    with tempfile.TemporaryDirectory(prefix="tag-watcher-") as temporary_dir:
+        for first_page, last_page in get_page_runs(pages):
+            prefix = Path(temporary_dir) / str(first_page)
+            command = ["pdftoppm", "-r", str(dpi), "-x", str(left), "-y", str(top), "-W", str(right - left),
+                       "-H", str(bottom - top), "-gray", "-f", str(first_page), "-l", str(last_page),
+                       str(pdf_path), str(prefix)]
+            subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            for path in Path(temporary_dir).glob(f"{first_page}-*.pgm"):
+                page = int(path.stem.rsplit('-', 1)[1])
+                crops[page] = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    return crops
+
+
+def get_tag_names(pdf_path: Path, page_count: int, crop_region: Tuple[int, int, int, int] = None,
+                  dpi: int = DPI) -> List[str]:
+    """
+    Reads the tag name of every page of a PDF file. Names are taken from the text layer when possible; the name
+    regions of the remaining pages are rendered and recognized together by the OCR backend.
 
+    Args:
+        pdf_path (Path): The path to the PDF file.
+        page_count (int): The number of pages of the PDF file.
+        crop_region (Tuple[int, int, int, int]): The region (top, bottom, left, right) containing the name, in pixels
+        at `dpi`.
+        dpi (int, optional): The resolution the name regions are rendered at for OCR. Defaults to `DPI`.
 
-def get_tags_value_from_excel(excel_path: Union[str, Path], tags: list, sheet_name: str = 'DATA - Paineis') -> \
-        List[int]:
+    Returns:
+        List[str]: The tag name of each page, in page order.
     """
-    Retrieves the corresponding tag values from the given Excel file for the provided list of tag names.
+    with metrics.stage('text_layer'):
+        names = get_tag_names_from_text_layer(pdf_path, crop_region=crop_region, dpi=dpi)
+    if names:
+        logger.info(f"Read {len(names)} tag names from the text layer of '{pdf_path.name}'.")
+    missing = [page for page in range(1, page_count + 1) if page not in names]
+    if missing:
+        with metrics.stage('rasterize_crops'):
+            crops = render_crops(pdf_path, pages=missing, crop_region=crop_region, dpi=dpi)
+        with metrics.stage('ocr'):
+            names.update(zip(missing, recognize_tag_names([crops[page] for page in missing])))
+    return [names[page] for page in range(1, page_count + 1)]
+
+
+def get_tag_names_from_text_layer(pdf_path: Path, crop_region: Tuple[int, int, int, int] = None,
+                                  dpi: int = DPI) -> Dict[int, str]:
+    """
+    Reads the tag names of a PDF file from its text layer, without rendering or OCR. Returns an empty dictionary when
+    `settings.TEXT_LAYER_ENABLED` is off.
 
     Args:
-        excel_path (Union[str, Path]): The path to the Excel file containing the tag data.
-        tags (List[str]): A list of tag names to search for in the Excel file.
-        sheet_name (str, optional): The name of the sheet in the Excel file containing the tag data. Defaults to
-        'DATA - Paineis'.
+        pdf_path (Path): The path to the PDF file.
+        crop_region (Tuple[int, int, int, int]): The region (top, bottom, left, right) containing the name, in pixels
+        at `dpi`.
+        dpi (int, optional): The resolution the crop region is expressed in. Defaults to `DPI`.
 
     Returns:
-        List[int]: A list of integer tag values corresponding to the provided tag names.
+        Dict[int, str]: The tag names keyed by 1-based page number, for the pages with usable text only.
 
     Example:
-        tag_values = get_tags_value_from_excel(excel_path, tags, sheet_name)
+        names = get_tag_names_from_text_layer(pdf_path)
     """
+    if not settings.TEXT_LAYER_ENABLED:
+        return {}
+    if crop_region is None:
+        crop_region = CROP_REGION
+    texts = textlayer.get_text_in_region(pdf_path, crop_region=crop_region, dpi=dpi)
+    names = {page: normalize_name(name=text) for page, text in texts.items()}
+    return {page: name for page, name in names.items() if name}
 
-    dataframe = pandas.read_excel(excel_path, sheet_name=sheet_name)
-    dataframe = dataframe.assign(tag='')
-    return [extract_tag_value_from_dataframe(dataframe=dataframe, tag_name=tag_name) for tag_name in tags]
 
+def iter_crop_batches(pdf_path: Path, pages: List[int], crop_region: Tuple[int, int, int, int], dpi: int,
+                      batch_size: Optional[int] = None) -> Iterator[Tuple[List[int], Dict[int, numpy.ndarray]]]:
+    """
+    Renders the name regions of the given pages in batches of `settings.OCR_BATCH_SIZE` pages.
 
-def create_pdf_with_tags(images: List[numpy.ndarray], tags: List[int], output_pdf_path: Path,
-                         save: bool = True) -> None:
+    Yields:
+        Tuple[List[int], Dict[int, numpy.ndarray]]: The page numbers of the batch and their crops.
     """
-    Creates a PDF file containing the given images with tags drawn on them.
+    if batch_size is None:
+        batch_size = settings.OCR_BATCH_SIZE
+    for start in range(0, len(pages), batch_size):
+        batch = pages[start:start + batch_size]
+        with metrics.stage('rasterize_crops'):
+            crops = render_crops(pdf_path, pages=batch, crop_region=crop_region, dpi=dpi)
+        yield batch, crops
 
-    The function takes a list of images as numpy arrays and a corresponding list of integer tags.
-    For each image, it draws the corresponding tag as text on the image and then saves the
-    modified images as a single PDF file.
+
+def read_tag_names(pdf_path: Path, page_count: int, crop_region: Tuple[int, int, int, int], dpi: int,
+                   names: pipeline.Results, stopped: threading.Event) -> None:
+    """
+    Pipelined counterpart of `get_tag_names`: publishes the name of each page to `names` as soon as it is known. The
+    name regions of the next batch are rendered while the current batch is being recognized.
 
     Args:
-        images (List[numpy.ndarray]): A list of images as numpy arrays.
-        tags (List[int]): A list of integer tags corresponding to each image in the 'images' list.
-        output_pdf_path (Path): The filename for the output PDF file.
-        save (bool): Save to a file.
+        pdf_path (Path): The path to the PDF file.
+        page_count (int): The number of pages of the PDF file.
+        crop_region (Tuple[int, int, int, int]): The region (top, bottom, left, right) containing the name, in pixels
+        at `dpi`.
+        dpi (int): The resolution the name regions are rendered at.
+        names (pipeline.Results): Receives the tag name of each page, keyed by page number, or the error.
+        stopped (threading.Event): Set when the job failed, to stop before the next batch.
+    """
+    try:
+        with metrics.stage('text_layer'):
+            known = get_tag_names_from_text_layer(pdf_path, crop_region=crop_region, dpi=dpi)
+        if known:
+            logger.info(f"Read {len(known)} tag names from the text layer of '{pdf_path.name}'.")
+        for page, name in known.items():
+            names.set(page, name)
+        missing = [page for page in range(1, page_count + 1) if page not in known]
+        batches = iter_crop_batches(pdf_path, pages=missing, crop_region=crop_region, dpi=dpi)
+        for batch, crops in pipeline.prefetch(batches, depth=settings.PIPELINE_DEPTH, name="render-crops"):
+            if stopped.is_set():
+                return
+            with metrics.stage('ocr'):
+                recognized = recognize_tag_names([crops[page] for page in batch])
+            for page, name in zip(batch, recognized):
+                names.set(page, name)
+    except BaseException as e:
+        names.fail(e)
+        raise
+
+
+def load_tag_index(excel_path: Path) -> dict:
+    with metrics.stage('excel'):
+        return workbook.get_tag_index(excel_path)
+
+
+def get_pipeline_config(pdf_path: Optional[Path] = None) -> dict:
+    """
+    Returns every setting that affects the content of an output PDF. Results produced with a different configuration
+    are never reused.
+
+    Args:
+        pdf_path (Path, optional): The PDF file the configuration applies to, which selects the label template.
+        Defaults to the default template.
 
     Returns:
-        None
+        dict: The pipeline configuration.
+
+    Raises:
+        ValueError: If the label template of the PDF file cannot be read.
     """
-    buffer_list = []
-    logger.info(f"Creating PDF file '{output_pdf_path}'")
-    for tag, image in zip(tags, images):
-        cv2.putText(image, str(tag), (1700, 650), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 4)
-        is_success, buffer = cv2.imencode(".png", image)
-        if is_success:
-            image_in_memory = io.BytesIO(buffer)
-            buffer_list.append(image_in_memory)
-    if save:
-        with open(output_pdf_path, "wb") as f:
-            f.write(img2pdf.convert(buffer_list))
-    else:
-        return img2pdf.convert(buffer_list)
+    template = templates.get_template(pdf_path) if pdf_path is not None else templates.DEFAULT_TEMPLATE
+    return {
+        "version": PIPELINE_VERSION,
+        "template": template.to_dict(),
+        "ocr_dpi": settings.OCR_DPI,
+        "output_dpi": settings.OUTPUT_DPI,
+        "tesseract_config": TESSERACT_CONFIG,
+        "ocr_backend": settings.OCR_BACKEND,
+        "output_mode": settings.OUTPUT_MODE,
+        "text_layer": settings.TEXT_LAYER_ENABLED,
+    }
+
+
+def get_output_path(pdf_path: Union[Path, str]) -> Path:
+    """
+    Returns the default output path for a PDF file, a file named '<stem>_output.pdf' inside a 'CORRECTED' folder next
+    to the PDF file. The folder is created if it does not exist.
+
+    Args:
+        pdf_path (Union[Path, str]): The path to the PDF file containing the images.
+
+    Returns:
+        Path: The output path.
+    """
+    output_path = functions.get_output_path(convert_str_to_path(pdf_path))
+    os.makedirs(output_path.parent, exist_ok=True)
+    return output_path
+
+
+def get_page_count(pdf_path: Path) -> int:
+    return pdfinfo_from_path(pdf_path)["Pages"]
 
 
-def get_tags_from_images(images: List[Union[Path, str]], crop_region: Tuple[int, int, int, int] = None) -> List[str]:
+def get_page_info(pdf_path: Path) -> Tuple[int, Tuple[float, float]]:
     """
-    Extracts tag names from the given images.
+    Returns the number of pages of a PDF file and the width and height of its first page in points. The labels of a
+    file are expected to share one page size.
+
+    Example:
+        page_count, page_size = get_page_info(pdf_path)  # 12, (283.46, 141.73)
+    """
+    info = pdfinfo_from_path(pdf_path)
+    width, _, height = info["Page size"].split()[:3]
+    return info["Pages"], (float(width), float(height))
+
+
+def get_media_size(page: pikepdf.Page) -> Tuple[float, float]:
+    left, bottom, right, top = (float(value) for value in page.mediabox)
+    return right - left, top - bottom
+
+
+def iter_page_chunks(pdf_path: Path, chunk_size: Optional[int] = None, dpi: int = DPI,
+                     page_count: Optional[int] = None) -> Iterator[List[numpy.ndarray]]:
+    """
+    Rasterizes a PDF file in bounded chunks of pages, so that only one chunk is held in memory at a time.
 
     Args:
-        images (List[Union[Path, str]]): A list of image paths.
-        crop_region (Tuple[int, int, int, int]): The region of interest (ROI) to crop from the image.
-        The ROI is specified as a tuple of integers (top, bottom, left, right).
+        pdf_path (Path): The path to the PDF file.
+        chunk_size (int, optional): The number of pages rendered per chunk. Defaults to `settings.RASTER_CHUNK_SIZE`.
+        dpi (int, optional): The rendering resolution. Defaults to `DPI`.
+        page_count (int, optional): The number of pages, if already known.
 
-    Returns:
-        List[str]: A list of tag names extracted from the images.
+    Yields:
+        List[numpy.ndarray]: The writable page images of the next chunk.
 
     Example:
-        tags = get_tags_from_images(images, crop_region)
+        for images in iter_page_chunks(pdf_path):
+            ...
+    """
+    if chunk_size is None:
+        chunk_size = settings.RASTER_CHUNK_SIZE
+    if page_count is None:
+        page_count = get_page_count(pdf_path)
+    for first_page in range(1, page_count + 1, chunk_size):
+        last_page = min(first_page + chunk_size - 1, page_count)
+        with metrics.stage('rasterize'):
+            images: List[PpmImageFile] = convert_from_path(pdf_path=pdf_path, dpi=dpi, first_page=first_page,
+                                                           last_page=last_page)
+            arrays = [numpy.array(image) for image in images]
+            del images
+        yield arrays
+
+
+def merge_pdfs(paths: List[Path], output_pdf_path: Path) -> None:
     """
-    tags = []
-    for image in images:
-        tags.append(extract_tag_name_from_image(image, crop_region))
-    return tags
+    Concatenates PDF files into a single PDF file. The output is written to a uniquely named temporary file next to the
+    target and moved into place, so readers never see a partially written PDF and two replicas writing the same output
+    never write to the same file.
+
+    Args:
+        paths (List[Path]): The PDF files to concatenate, in order.
+        output_pdf_path (Path): The filename for the output PDF file.
+    """
+    temporary_path = output_pdf_path.with_name(f".{output_pdf_path.name}.{uuid.uuid4().hex}.tmp")
+    with pikepdf.new() as pdf:
+        sources = [pikepdf.open(path) for path in paths]
+        try:
+            for source in sources:
+                pdf.pages.extend(source.pages)
+            pdf.save(temporary_path)
+        finally:
+            for source in sources:
+                source.close()
+    os.replace(temporary_path, output_pdf_path)
 
 
 def process(pdf_path: Union[Path, str], excel_path: Union[Path, str],
-            output_path: Optional[Union[str, Path]] = None) -> None:
+            output_path: Optional[Union[str, Path]] = None) -> Optional[List[Tuple[str, Optional[int]]]]:
     """
     Processes a PDF file, extracts tag names from images, retrieves tag values from an Excel file, and draws tags on
     images.
 
     This function takes a PDF file containing images, converts the images to digital format, extracts tag names from the
-    images, retrieves the corresponding tag values from an Excel file, and draws the tags on the images. The modified
-    images are saved in the specified output folder.
+    images, retrieves the corresponding tag values from an Excel file, and draws the tags on the images. Names found in
+    the text layer of the PDF file are used as they are, and the name regions of the remaining pages are rendered and
+    sent to OCR together. The output is then written according to `settings.OUTPUT_MODE`: 'raster' re-renders every
+    page in bounded chunks (see `write_raster_output`), while 'vector' appends a small overlay to the original pages
+    (see `write_vector_output`). Peak memory depends on the chunk size, not on the page count.
+
+    The label layout comes from the template of the PDF file (see `templates.get_template`). Name regions are rendered
+    at `settings.OCR_DPI` and raster output at `settings.OUTPUT_DPI`.
+
+    With `settings.PIPELINE_DEPTH` above 0 the stages run concurrently (see `process_pipelined`), otherwise one after
+    the other.
 
     Args:
         pdf_path (Union[Path, str]): The path to the PDF file containing the images.
@@ -271,6 +553,10 @@ def process(pdf_path: Union[Path, str], excel_path: Union[Path, str],
         saved. If not provided, a folder named 'output' will be created in the same directory as the PDF file. Defaults
         to None.
 
+    Returns:
+        Optional[List[Tuple[str, Optional[int]]]]: The tag name and tag value of each page if the output PDF was
+        written, None otherwise.
+
     Example:
         process(pdf_path, excel_path, output_path)
 
@@ -278,21 +564,222 @@ def process(pdf_path: Union[Path, str], excel_path: Union[Path, str],
     pdf_path = convert_str_to_path(pdf_path)
     excel_path = convert_str_to_path(excel_path)
     if output_path is None:
-        output_folder = pdf_path.parent / "CORRECTED"
-        os.makedirs(output_folder, exist_ok=True)
-        output_path = output_folder / f"{pdf_path.stem}_output.pdf"
-
-    original_images: List[PpmImageFile] = convert_from_path(pdf_path=pdf_path, dpi=500)
-    original_digital_images = [numpy.asarray(image) for image in original_images]
-    for img in original_digital_images:
-        cv2.rectangle(img, (1630, 540), (1955, 690), (0, 0, 0), -1)
+        output_path = get_output_path(pdf_path)
+    output_path = convert_str_to_path(output_path)
+
     try:
-        create_pdf(excel=excel_path, images=original_digital_images, output_pdf_path=output_path)
+        if settings.PIPELINE_DEPTH > 0:
+            return process_pipelined(pdf_path, excel_path=excel_path, output_path=output_path)
+        template = templates.get_template(pdf_path)
+        page_count, page_size = get_page_info(pdf_path)
+        metrics.set_pages(page_count)
+        geometry = template.get_geometry(page_size, dpi=settings.OCR_DPI).rounded()
+        tag_names = get_tag_names(pdf_path, page_count=page_count, crop_region=geometry.crop_region,
+                                  dpi=settings.OCR_DPI)
+        tag_values = get_tags_value_from_excel(excel_path=excel_path, tags=tag_names)
+        if settings.OUTPUT_MODE == 'vector':
+            write_vector_output(pdf_path, output_path=output_path, tags=tag_values, template=template)
+        else:
+            write_raster_output(pdf_path, output_path=output_path, tags=tag_values, page_count=page_count,
+                                template=template, page_size=page_size)
     except Exception as e:
         logger.error(f"Error while processing {pdf_path.name}: {e}")
+        return None
+    return list(zip(tag_names, tag_values))
 
 
-def create_pdf(excel: Path, images: list, output_pdf_path: Path | str, crop_region: Tuple[int, int, int, int] = None):
-    tags_char = get_tags_from_images(images=images, crop_region=crop_region)
-    tags_value = get_tags_value_from_excel(excel_path=excel, tags=tags_char)
-    create_pdf_with_tags(images=images, tags=tags_value, output_pdf_path=output_pdf_path)
+def process_pipelined(pdf_path: Path, excel_path: Path, output_path: Path) -> List[Tuple[str, Optional[int]]]:
+    """
+    Runs the stages of `process` concurrently: the workbook index is loaded while the name regions are rendered, the
+    next batch of name regions is rendered while the current one is recognized, and in raster mode the pages are
+    rendered and encoded while the names are still being read. Each chunk of pages is stamped as soon as the names of
+    its pages are known. Stages are connected by queues of `settings.PIPELINE_DEPTH` items, which bounds the memory
+    used by the pages rendered ahead. Stage times overlap, so their sum can exceed the duration of the job.
+
+    Raises:
+        Exception: Any error of a stage, after the other stages stopped.
+    """
+    template = templates.get_template(pdf_path)
+    page_count, page_size = get_page_info(pdf_path)
+    metrics.set_pages(page_count)
+    geometry = template.get_geometry(page_size, dpi=settings.OCR_DPI).rounded()
+    names = pipeline.Results()
+    stopped = threading.Event()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage") as pool:
+        index_future = pool.submit(load_tag_index, excel_path)
+        names_future = pool.submit(read_tag_names, pdf_path, page_count=page_count, crop_region=geometry.crop_region,
+                                   dpi=settings.OCR_DPI, names=names, stopped=stopped)
+        tag_values: Dict[int, Optional[int]] = {}
+
+        def get_tags(pages: range) -> List[Optional[int]]:
+            values = workbook.lookup_tag_values(index_future.result(), tags=[names.get(page) for page in pages])
+            tag_values.update(zip(pages, values))
+            return values
+
+        try:
+            if settings.OUTPUT_MODE == 'vector':
+                write_vector_output(pdf_path, output_path=output_path, tags=get_tags(range(1, page_count + 1)),
+                                    template=template)
+            else:
+                write_raster_output(pdf_path, output_path=output_path, tags=get_tags, page_count=page_count,
+                                    template=template, page_size=page_size)
+            names_future.result()
+        finally:
+            stopped.set()
+    pages = range(1, page_count + 1)
+    return [(names.get(page), tag_values[page]) for page in pages]
+
+
+def write_raster_output(pdf_path: Path, output_path: Path,
+                        tags: Union[List[Optional[int]], Callable[[range], List[Optional[int]]]],
+                        page_count: Optional[int] = None, template: templates.LabelTemplate = templates.DEFAULT_TEMPLATE,
+                        page_size: Optional[Tuple[float, float]] = None) -> None:
+    """
+    Writes the output as a raster PDF. The pages are streamed in chunks of `settings.RASTER_CHUNK_SIZE`: each chunk is
+    rendered at `settings.OUTPUT_DPI`, masked, stamped and encoded to a temporary PDF, and the chunks are merged into
+    the output at the end. With `settings.PIPELINE_DEPTH` above 0, the next chunks are rendered while the current one
+    is encoded.
+
+    Args:
+        pdf_path (Path): The path to the PDF file containing the images.
+        output_path (Path): The filename for the output PDF file.
+        tags (Union[List[Optional[int]], Callable[[range], List[Optional[int]]]]): The tag value of each page, or a
+        function returning the tag values of a range of page numbers, called once the chunk of those pages is masked.
+        page_count (int, optional): The number of pages, if already known.
+        template (templates.LabelTemplate, optional): The label layout. Defaults to the default template.
+        page_size (Tuple[float, float], optional): The page size in points, required by page-relative templates.
+    """
+    dpi = settings.OUTPUT_DPI
+    geometry = template.get_geometry(page_size, dpi=dpi).rounded()
+    with tempfile.TemporaryDirectory(prefix="tag-watcher-") as temporary_dir:
+        chunk_paths = []
+        offset = 0
+        chunks = iter_page_chunks(pdf_path, dpi=dpi, page_count=page_count)
+        if settings.PIPELINE_DEPTH > 0:
+            chunks = pipeline.prefetch(chunks, depth=settings.PIPELINE_DEPTH, name="render-pages")
+        for index, images in enumerate(chunks):
+            with metrics.stage('mask'):
+                for img in images:
+                    cv2.rectangle(img, *geometry.mask_region, (0, 0, 0), -1)
+            chunk_path = Path(temporary_dir) / f"{index:05d}.pdf"
+            if callable(tags):
+                chunk_tags = tags(range(offset + 1, offset + len(images) + 1))
+            else:
+                chunk_tags = tags[offset:offset + len(images)]
+            with metrics.stage('encode'):
+                create_pdf_with_tags(images=images, tags=chunk_tags, output_pdf_path=chunk_path, geometry=geometry,
+                                     dpi=dpi)
+            offset += len(images)
+            chunk_paths.append(chunk_path)
+            del images
+        with metrics.stage('write'):
+            merge_pdfs(paths=chunk_paths, output_pdf_path=output_path)
+
+
+def write_vector_output(pdf_path: Path, output_path: Path, tags: List[Optional[int]],
+                        template: templates.LabelTemplate = templates.DEFAULT_TEMPLATE) -> None:
+    """
+    Writes the output as the original PDF pages with a vector overlay per page: a filled box over the old value and
+    the new value as text. No page is rasterized, so the output stays close to the size of the original.
+
+    Args:
+        pdf_path (Path): The path to the PDF file.
+        output_path (Path): The filename for the output PDF file.
+        tags (List[Optional[int]]): The tag value of each page.
+        template (templates.LabelTemplate, optional): The label layout. Defaults to the default template.
+    """
+    logger.info(f"Creating PDF file '{output_path}'")
+    temporary_path = output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex}.tmp")
+    with pikepdf.open(pdf_path) as pdf:
+        with metrics.stage('stamp'):
+            font = overlay.make_font(pdf)
+            for page, tag in zip(pdf.pages, tags):
+                stamp_vector_page(pdf, page, tag=tag, template=template, font=font)
+        with metrics.stage('write'):
+            pdf.save(temporary_path)
+    os.replace(temporary_path, output_path)
+
+
+def stamp_vector_page(pdf: pikepdf.Pdf, page: pikepdf.Page, tag: Optional[int], template: templates.LabelTemplate,
+                      font: pikepdf.Object) -> None:
+    """
+    Stamps a page with `overlay.stamp_page`, resolving the template in PDF points for the size of that page.
+    """
+    geometry = template.get_geometry(get_media_size(page), dpi=templates.POINTS_PER_INCH)
+    overlay.stamp_page(pdf, page, tag=tag, mask_region=geometry.mask_region, text_anchor=geometry.text_anchor,
+                       dpi=templates.POINTS_PER_INCH, font=font, font_size=template.font_size)
+
+
+def splice_pages(output_path: Path, pages: Dict[int, pikepdf.Page]) -> None:
+    """
+    Replaces pages of an existing PDF file, writing through a uniquely named temporary file.
+
+    Args:
+        output_path (Path): The PDF file to update.
+        pages (Dict[int, pikepdf.Page]): The new pages, keyed by 1-based page number.
+    """
+    temporary_path = output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex}.tmp")
+    with pikepdf.open(output_path) as output:
+        for page_number, page in pages.items():
+            output.pages[page_number - 1] = page
+        output.save(temporary_path)
+    os.replace(temporary_path, output_path)
+
+
+def restamp(pdf_path: Union[Path, str], output_path: Union[Path, str], pages: Dict[int, Optional[int]]) -> bool:
+    """
+    Re-stamps only the given pages of an existing output PDF with new tag values, and splices them into the output.
+    This is used when the workbook changed but the PDF file did not, so the tag names of every page are already known.
+    In raster mode the changed pages are re-rendered; in vector mode the overlay is re-applied to the original pages.
+
+    Args:
+        pdf_path (Union[Path, str]): The path to the PDF file containing the images.
+        output_path (Union[Path, str]): The existing output PDF, produced from the same PDF file.
+        pages (Dict[int, Optional[int]]): The new tag value of each changed page, keyed by 1-based page number.
+
+    Returns:
+        bool: True if the output PDF was updated, False otherwise.
+
+    Example:
+        restamp(pdf_path, output_path, {3: 12, 7: 40})
+    """
+    pdf_path = convert_str_to_path(pdf_path)
+    output_path = convert_str_to_path(output_path)
+    if not pages:
+        return True
+    metrics.set_pages(len(pages))
+    try:
+        template = templates.get_template(pdf_path)
+        if settings.OUTPUT_MODE == 'vector':
+            with pikepdf.open(pdf_path) as pdf:
+                font = overlay.make_font(pdf)
+                for page_number, tag in pages.items():
+                    stamp_vector_page(pdf, pdf.pages[page_number - 1], tag=tag, template=template, font=font)
+                splice_pages(output_path, pages={number: pdf.pages[number - 1] for number in pages})
+            return True
+        dpi = settings.OUTPUT_DPI
+        _, page_size = get_page_info(pdf_path)
+        geometry = template.get_geometry(page_size, dpi=dpi).rounded()
+        with tempfile.TemporaryDirectory(prefix="tag-watcher-") as temporary_dir:
+            page_paths = {}
+            for first_page, last_page in get_page_runs(list(pages)):
+                for start in range(first_page, last_page + 1, settings.RASTER_CHUNK_SIZE):
+                    end = min(start + settings.RASTER_CHUNK_SIZE - 1, last_page)
+                    images = convert_from_path(pdf_path=pdf_path, dpi=dpi, first_page=start, last_page=end)
+                    for page, image in zip(range(start, end + 1), images):
+                        image = numpy.array(image)
+                        cv2.rectangle(image, *geometry.mask_region, (0, 0, 0), -1)
+                        page_paths[page] = Path(temporary_dir) / f"{page:05d}.pdf"
+                        create_pdf_with_tags(images=[image], tags=[pages[page]], output_pdf_path=page_paths[page],
+                                             geometry=geometry, dpi=dpi)
+                    del images
+            sources = {page: pikepdf.open(path) for page, path in page_paths.items()}
+            try:
+                splice_pages(output_path, pages={page: source.pages[0] for page, source in sources.items()})
+            finally:
+                for source in sources.values():
+                    source.close()
+    except Exception as e:
+        logger.error(f"Error while re-stamping {output_path.name}: {e}")
+        return False
+    return True
@@ -0,0 +1,122 @@
+"""
+Reads tag names straight from the text layer of label PDFs exported by the CAD/label software, using the 'pdftotext'
+tool from poppler-utils, which pdf2image already requires.
+"""
+import logging
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+POINTS_PER_INCH = 72
+
+Word = Tuple[float, float, str]
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def run_pdftotext(pdf_path: Path, first_page: Optional[int] = None, last_page: Optional[int] = None,
+                  timeout: int = 60) -> str:
+    """
+    Runs 'pdftotext -bbox' on a PDF file and returns its XHTML output, which lists every word of every page together
+    with its bounding box in points, measured from the top left corner of the page.
+
+    Args:
+        pdf_path (Path): The path to the PDF file.
+        first_page (int, optional): The first page to read. Defaults to the first page of the document.
+        last_page (int, optional): The last page to read. Defaults to the last page of the document.
+        timeout (int, optional): Seconds to wait for pdftotext. Defaults to 60.
+
+    Returns:
+        str: The XHTML document written by pdftotext.
+    """
+    command = ["pdftotext", "-bbox", "-enc", "UTF-8"]
+    if first_page is not None:
+        command += ["-f", str(first_page)]
+    if last_page is not None:
+        command += ["-l", str(last_page)]
+    command += [str(pdf_path), "-"]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=True)
+    return result.stdout.decode("utf-8")
+
+
+def parse_words(document: str) -> List[List[Word]]:
+    """
+    Parses the output of 'pdftotext -bbox' into the words of each page.
+
+    Args:
+        document (str): The XHTML document written by pdftotext.
+
+    Returns:
+        List[List[Word]]: For every page, a list of (x center, y center, text) tuples in points.
+    """
+    pages = []
+    for element in ElementTree.fromstring(document).iter():
+        name = _local_name(element.tag)
+        if name == 'page':
+            pages.append([])
+        elif name == 'word' and pages and element.text and element.text.strip():
+            x = (float(element.get('xMin')) + float(element.get('xMax'))) / 2
+            y = (float(element.get('yMin')) + float(element.get('yMax'))) / 2
+            pages[-1].append((x, y, element.text.strip()))
+    return pages
+
+
+def words_in_region(words: Sequence[Word], crop_region: Sequence[int], dpi: int, line_tolerance: float = 3.0) -> str:
+    """
+    Joins the words whose centers fall inside a crop region into text, one line per text row.
+
+    Args:
+        words (Sequence[Word]): The words of a page, as returned by `parse_words`.
+        crop_region (Sequence[int]): The region (top, bottom, left, right) in pixels at the given dpi.
+        dpi (int): The resolution the crop region is expressed in.
+        line_tolerance (float, optional): Maximum vertical distance in points between words of the same row.
+
+    Returns:
+        str: The text inside the region, or an empty string.
+    """
+    scale = POINTS_PER_INCH / dpi
+    top, bottom, left, right = (value * scale for value in crop_region)
+    selected = sorted((y, x, text) for x, y, text in words if top <= y <= bottom and left <= x <= right)
+    lines: List[List[Tuple[float, str]]] = []
+    last_y = None
+    for y, x, text in selected:
+        if last_y is None or y - last_y > line_tolerance:
+            lines.append([])
+        lines[-1].append((x, text))
+        last_y = y
+    return '\n'.join(' '.join(text for _, text in sorted(line)) for line in lines)
+
+
+def get_text_in_region(pdf_path: Path, crop_region: Sequence[int], dpi: int) -> Dict[int, str]:
+    """
+    Reads the text inside the crop region of every page of a PDF file from its text layer, with a single pdftotext
+    call per document.
+
+    Args:
+        pdf_path (Path): The path to the PDF file.
+        crop_region (Sequence[int]): The region (top, bottom, left, right) in pixels at the given dpi.
+        dpi (int): The resolution the crop region is expressed in.
+
+    Returns:
+        Dict[int, str]: The text found on each page, keyed by the 1-based page number. Pages without text in the
+        region are left out, and an empty dictionary is returned if the text layer cannot be read.
+
+    Example:
+        texts = get_text_in_region(pdf_path, crop_region=[540, 670, 70, 1600], dpi=500)
+    """
+    try:
+        pages = parse_words(run_pdftotext(pdf_path))
+    except (OSError, subprocess.SubprocessError, ElementTree.ParseError) as e:
+        logger.warning(f"Could not read the text layer of '{pdf_path.name}': {e}")
+        return {}
+    texts = {}
+    for page_number, words in enumerate(pages, start=1):
+        text = words_in_region(words, crop_region=crop_region, dpi=dpi)
+        if text:
+            texts[page_number] = text
+    return texts
@@ -0,0 +1,273 @@
+"""
+Targeted watch registration for native observers.
+
+A recursive watch on `WATCHING_DIR` places an inotify watch on every directory of the tree. The `WatchManager` instead
+watches the cut list directories, non-recursively with the Excel event handler, and the 'parent' directories a new cut
+list directory can appear in, non-recursively with a handler that only looks at directories:
+
+- the ancestors of every known cut list directory and every 'briefing' directory,
+- every directory above the depth of the deepest 'briefing' directory, where new clients and projects are created.
+
+Folders next to 'briefing' and everything below them are not watched. When a directory appears, disappears or is moved
+under a parent directory, that subtree is crawled again after a short delay and the watches are added or removed. The
+whole tree is also crawled again every `WATCH_DISCOVERY_INTERVAL` seconds to catch anything the parent watches missed.
+
+With a `SharedInotifyObserver` all the watches share one inotify instance. With another observer each directory is
+scheduled on its own, and once the observer cannot schedule more watches, e.g. on Linux where each one opens an inotify
+instance, the manager falls back to a single recursive watch of the whole tree.
+"""
+import errno
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers.api import BaseObserver, ObservedWatch
+
+import settings
+from utilities.inotify import SharedInotifyEmitter, SharedInotifyObserver
+from utilities.reconcile import DirectoryCrawler, DirectoryIndex
+from utilities.scheduler import DebounceScheduler
+
+logger = logging.getLogger(__name__)
+
+CUT_LIST = 'cut_list'
+
+PARENT = 'parent'
+
+Entries = Dict[str, Tuple[int, Optional[list]]]
+
+
+class ParentDirectoryHandler(FileSystemEventHandler):
+    """
+    Schedules a new crawl of the directories created, deleted or moved in a parent directory. File events are ignored.
+    """
+
+    def __init__(self, manager: "WatchManager") -> None:
+        super().__init__()
+        self.manager = manager
+
+    def on_created(self, event):
+        if event.is_directory:
+            self.manager.scheduler.schedule(event.src_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.manager.scheduler.schedule(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            self.manager.scheduler.schedule(event.src_path)
+            self.manager.scheduler.schedule(event.dest_path)
+
+
+class SharedWatchHandler(FileSystemEventHandler):
+    """
+    Passes the events of a `SharedInotifyObserver` to the handler of the directory they happened in: file events of cut
+    list directories to the Excel event handler, directory events of parent directories to the `ParentDirectoryHandler`.
+    """
+
+    def __init__(self, manager: "WatchManager") -> None:
+        super().__init__()
+        self.manager = manager
+
+    def dispatch(self, event):
+        if event.src_path == self.manager.root:
+            # Only reported when the inotify event queue overflowed.
+            self.manager.scheduler.schedule(self.manager.root, delay=0)
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        kinds = {self.manager.get_kind(os.path.dirname(path)) for path in paths if path}
+        if event.is_directory and PARENT in kinds:
+            self.manager.parent_handler.dispatch(event)
+        elif not event.is_directory and CUT_LIST in kinds:
+            self.manager.event_handler.dispatch(event)
+
+
+class WatchManager:
+    """
+    Registers non-recursive watches on the cut list directories and their parent levels, see the module docstring.
+
+    Example:
+        observer = Observer()
+        observer.start()
+        manager = WatchManager(observer, event_handler)
+        manager.start()
+        ...
+        manager.stop()
+    """
+
+    def __init__(self, observer: BaseObserver, event_handler: FileSystemEventHandler,
+                 root: Optional[Union[str, Path]] = None, delay: Optional[float] = None,
+                 interval: Optional[float] = None) -> None:
+        self.observer = observer
+        self.event_handler = event_handler
+        self.parent_handler = ParentDirectoryHandler(self)
+        self.root = os.path.abspath(root if root is not None else settings.WATCHING_DIR)
+        self.interval = settings.WATCH_DISCOVERY_INTERVAL if interval is None else interval
+        self.scheduler = DebounceScheduler(delay=settings.DELAY_FOR_SCAN if delay is None else delay)
+        self._watches: Dict[str, Tuple[str, Optional[ObservedWatch]]] = {}
+        self._emitter: Optional[SharedInotifyEmitter] = None
+        self._recursive_watch: Optional[ObservedWatch] = None
+        self._entries: Entries = {}
+        self._max_parent_depth: Optional[int] = None
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._watches)
+
+    def count(self, kind: str) -> int:
+        with self._lock:
+            return sum(1 for watch_kind, _ in self._watches.values() if watch_kind == kind)
+
+    def get_kind(self, path: str) -> Optional[str]:
+        with self._lock:
+            kind, _ = self._watches.get(path, (None, None))
+            return kind
+
+    def get_depth(self, path: str) -> int:
+        relative = os.path.relpath(path, self.root)
+        return 0 if relative == os.curdir else len(relative.split(os.sep))
+
+    def is_under(self, path: str, directory: str) -> bool:
+        return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+    def select(self, entries: Entries) -> Dict[str, str]:
+        """
+        Returns the directories of a crawl that should be watched, with the kind of their watch.
+        """
+        cut_lists = [path for path, (_, children) in entries.items() if children is None]
+        if cut_lists:
+            deepest = max(self.get_depth(path) for path in cut_lists) - 1
+            self._max_parent_depth = max(self._max_parent_depth or 0, deepest)
+        selected = dict.fromkeys(cut_lists, CUT_LIST)
+        for path in cut_lists:
+            parent = os.path.dirname(path)
+            while self.is_under(parent, self.root) and parent not in selected:
+                selected[parent] = PARENT
+                parent = os.path.dirname(parent)
+        for path, (_, children) in entries.items():
+            if children is None or path in selected:
+                continue
+            if self._max_parent_depth is None or self.get_depth(path) < self._max_parent_depth or \
+                    os.path.basename(path) == 'briefing':
+                selected[path] = PARENT
+        return selected
+
+    def discover(self, directory: Optional[str] = None) -> None:
+        """
+        Crawls the tree, or only the subtree of a directory, and updates the watches of the crawled directories. Cut
+        list directories found after the first discovery are also scanned, since files may have been written to them
+        before their watch was registered.
+        """
+        directory = os.path.abspath(directory) if directory is not None else self.root
+        started_at = time.perf_counter()
+        with self._lock:
+            if self._recursive_watch is not None:
+                return
+            initial = not self._entries
+            previous = {path: entry for path, entry in self._entries.items() if self.is_under(path, directory)}
+            crawled: Entries = {}
+            if os.path.isdir(directory):
+                _, crawled = DirectoryCrawler(directory).crawl(previous=self.load_index() if initial else previous)
+            for path in previous:
+                self._entries.pop(path, None)
+            self._entries.update(crawled)
+            selected = self.select(crawled)
+            removed = [path for path in self._watches if self.is_under(path, directory) and path not in selected]
+            for path in removed:
+                self.remove_watch(path)
+            added = [path for path in selected if path not in self._watches and self.add_watch(path, selected[path])]
+        if self._recursive_watch is not None:
+            return
+        if not initial:
+            for path in added:
+                if selected[path] == CUT_LIST:
+                    self.event_handler.add_to_dir_queue(Path(path))
+        if initial or directory == self.root:
+            logger.info(f"Watching {len(self)} directories ({self.count(CUT_LIST)} cut list, {self.count(PARENT)} "
+                        f"parent), registered in {time.perf_counter() - started_at:.3f}s.")
+        elif added or removed:
+            logger.info(f"Added {len(added)} and removed {len(removed)} watches below '{directory}', now watching "
+                        f"{len(self)} directories.")
+
+    def load_index(self) -> Entries:
+        """
+        Returns the directory index of the last reconciliation, so the first crawl does not list unchanged directories.
+        """
+        try:
+            return DirectoryIndex().load()
+        except Exception as e:
+            logger.warning(f"Cannot read the directory index, crawling the whole tree: {e}")
+            return {}
+
+    def add_watch(self, path: str, kind: str) -> bool:
+        if self._recursive_watch is not None:
+            return False
+        watch = None
+        try:
+            if self._emitter is not None:
+                self._emitter.add_watch(path)
+            else:
+                handler = self.event_handler if kind == CUT_LIST else self.parent_handler
+                watch = self.observer.schedule(handler, path, recursive=False)
+        except OSError as e:
+            if self._emitter is None and e.errno == errno.EMFILE:
+                self.watch_recursively(e)
+            else:
+                logger.error(f"Cannot watch '{path}': {e}")
+            return False
+        self._watches[path] = (kind, watch)
+        return True
+
+    def remove_watch(self, path: str) -> None:
+        _, watch = self._watches.pop(path)
+        try:
+            if self._emitter is not None:
+                self._emitter.remove_watch(path)
+            else:
+                self.observer.unschedule(watch)
+        except (KeyError, OSError) as e:
+            logger.debug(f"Watch of '{path}' was already gone: {e}")
+
+    def watch_recursively(self, error: OSError) -> None:
+        """
+        Replaces the watches by a recursive watch of the whole tree, once the observer cannot schedule more watches.
+        """
+        logger.error(f"Cannot schedule more watches ({error}), watching the whole tree recursively instead.")
+        for path in list(self._watches):
+            self.remove_watch(path)
+        self._recursive_watch = self.observer.schedule(self.event_handler, self.root, recursive=True)
+
+    def start(self) -> None:
+        """
+        Registers the watches of the whole tree, then keeps them up to date from a background thread. The observer must
+        be started first.
+        """
+        if isinstance(self.observer, SharedInotifyObserver):
+            watch = self.observer.schedule(SharedWatchHandler(self), self.root, recursive=False)
+            self._emitter = self.observer.get_emitter(watch)
+        self.discover()
+
+        def rediscover() -> None:
+            while not self._stopped.wait(self.interval):
+                self.scheduler.schedule(self.root, delay=0)
+
+        self._threads = [threading.Thread(target=self.scheduler.run, args=(self.discover,), name="watch-discovery")]
+        if self.interval:
+            self._threads.append(threading.Thread(target=rediscover, name="watch-rediscovery", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.scheduler.stop()
+        for thread in self._threads:
+            if not thread.daemon:
+                thread.join()
@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import settings
+from utilities import functions
+
+logger = logging.getLogger(__name__)
+
+# Lower values are processed first.
+PRIORITY_LIVE = 0
+
+PRIORITY_BACKFILL = 1
+
+
+def get_item_key(item: Tuple[str, object]) -> str:
+    """
+    Returns the key pending items are coalesced by, the resolved Excel path, like `JobExecutor.get_job_key`.
+    """
+    _, event = item
+    return str(functions.validate_path(event.src_path))
+
+
+def get_job_size(key: str) -> int:
+    """
+    Returns the size of the '_ETQs.pdf' paired with an Excel path, a cheap estimate of the cost of its job.
+    """
+    try:
+        return os.stat(functions.get_pdf_path(excel_path=Path(key))).st_size
+    except OSError:
+        return 0
+
+
+class WorkQueue:
+    """
+    Bounded priority queue of '(event_type, event)' items that coalesces pending items by Excel path.
+
+    Putting an item whose path is already pending replaces the pending item, so the latest event wins and the path is
+    processed once; the pending item keeps the more urgent of the two priorities and its place among items of that
+    priority. New paths block while the queue holds `maxsize` paths, which pushes back on the scanning thread instead
+    of growing without limit. Items are returned by priority, then smaller jobs first, then in arrival order.
+
+    Like `queue.Queue`, `put(None)` asks the consumer to stop: it never blocks, and `get` returns None once every
+    pending item has been returned.
+
+    Example:
+        event_queue = WorkQueue(maxsize=1000)
+        event_queue.put(('created', event), priority=PRIORITY_BACKFILL)
+        event_type, event = event_queue.get()
+    """
+
+    def __init__(self, maxsize: Optional[int] = None) -> None:
+        self.maxsize = settings.EVENT_QUEUE_SIZE if maxsize is None else maxsize
+        self._condition = threading.Condition()
+        self._heap: List[Tuple[int, int, int, str]] = []
+        self._pending: Dict[str, Tuple[Tuple[int, int, int, str], Tuple[str, object]]] = {}
+        self._counter = itertools.count()
+        self._closed = False
+
+    def qsize(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def __len__(self) -> int:
+        return self.qsize()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._condition:
+            return key in self._pending
+
+    def put(self, item: Optional[Tuple[str, object]], priority: int = PRIORITY_LIVE, block: bool = True,
+            timeout: Optional[float] = None) -> None:
+        """
+        Adds an item, or replaces the pending item with the same path.
+
+        Args:
+            item (Optional[Tuple[str, object]]): The '(event_type, event)' item, or None to stop the consumer.
+            priority (int, optional): `PRIORITY_LIVE` or `PRIORITY_BACKFILL`. Defaults to `PRIORITY_LIVE`.
+            block (bool, optional): Wait for room when the queue is full. Defaults to True.
+            timeout (float, optional): Seconds to wait for room. Defaults to waiting forever.
+
+        Raises:
+            queue.Full: If there is no room after `timeout` seconds, or at once when `block` is False.
+        """
+        if item is None:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            return
+        key = get_item_key(item)
+        with self._condition:
+            if self._coalesce(key, item, priority):
+                return
+        size = get_job_size(key)
+        with self._condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while key not in self._pending and len(self._pending) >= self.maxsize > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise queue.Full
+                self._condition.wait(remaining)
+            if not self._coalesce(key, item, priority):
+                entry = (priority, size, next(self._counter), key)
+                heapq.heappush(self._heap, entry)
+                self._pending[key] = (entry, item)
+                self._condition.notify_all()
+
+    def _coalesce(self, key: str, item: Tuple[str, object], priority: int) -> bool:
+        pending = self._pending.get(key)
+        if pending is None:
+            return False
+        entry, _ = pending
+        if priority < entry[0]:
+            # The superseded heap entry is skipped by `get`.
+            entry = (priority,) + entry[1:]
+            heapq.heappush(self._heap, entry)
+        self._pending[key] = (entry, item)
+        logger.debug(f"Coalesced pending event for '{key}'.")
+        return True
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Optional[Tuple[str, object]]:
+        """
+        Removes and returns the most urgent item, or None once the queue is stopped and drained.
+
+        Raises:
+            queue.Empty: If no item is available after `timeout` seconds, or at once when `block` is False.
+        """
+        with self._condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                while self._heap:
+                    entry = heapq.heappop(self._heap)
+                    pending = self._pending.get(entry[3])
+                    if pending is not None and pending[0] == entry:
+                        del self._pending[entry[3]]
+                        self._condition.notify_all()
+                        return pending[1]
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not block or (remaining is not None and remaining <= 0):
+                    raise queue.Empty
+                self._condition.wait(remaining)
@@ -0,0 +1,100 @@
+import functools
+import logging
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Union
+
+import openpyxl
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+SHEET_NAME = 'DATA - Paineis'
+
+TAG_NAME_HEADER = 'REF PEÇA (A)'
+
+TAG_VALUE_HEADER = 'ETIQ (H)'
+
+
+def read_tag_index(excel_path: Union[str, Path], sheet_name: str = SHEET_NAME, name_header: str = TAG_NAME_HEADER,
+                   value_header: str = TAG_VALUE_HEADER) -> Dict[Hashable, object]:
+    """
+    Reads the tag name and tag value columns of a workbook into a dictionary from name to value.
+
+    The workbook is opened in read-only streaming mode and only the columns between the two headers are read. When a
+    name appears more than once, the first row wins, as it did with the DataFrame lookup.
+
+    Args:
+        excel_path (Union[str, Path]): The path to the Excel file containing the tag data.
+        sheet_name (str, optional): The sheet containing the tag data. Defaults to 'DATA - Paineis'.
+        name_header (str, optional): The header of the tag name column. Defaults to 'REF PEÇA (A)'.
+        value_header (str, optional): The header of the tag value column. Defaults to 'ETIQ (H)'.
+
+    Returns:
+        Dict[Hashable, object]: The raw cell value of each tag name.
+    """
+    workbook = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name]
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        try:
+            name_column, value_column = header.index(name_header), header.index(value_header)
+        except ValueError:
+            raise KeyError(f"Sheet '{sheet_name}' must have the columns '{name_header}' and '{value_header}'.")
+        first_column = min(name_column, value_column)
+        rows = sheet.iter_rows(min_row=2, min_col=first_column + 1, max_col=max(name_column, value_column) + 1,
+                               values_only=True)
+        index = {}
+        for row in rows:
+            name = row[name_column - first_column]
+            if name is not None:
+                index.setdefault(name, row[value_column - first_column])
+        return index
+    finally:
+        workbook.close()
+
+
+@functools.lru_cache(maxsize=settings.WORKBOOK_CACHE_SIZE)
+def _get_cached_tag_index(excel_path: str, mtime_ns: int, size: int, sheet_name: str) -> Dict[Hashable, object]:
+    return read_tag_index(excel_path, sheet_name=sheet_name)
+
+
+def get_tag_index(excel_path: Union[str, Path], sheet_name: str = SHEET_NAME) -> Dict[Hashable, object]:
+    """
+    Returns the tag index of a workbook, parsing it only when it changed since it was last read by this process.
+
+    Args:
+        excel_path (Union[str, Path]): The path to the Excel file containing the tag data.
+        sheet_name (str, optional): The sheet containing the tag data. Defaults to 'DATA - Paineis'.
+
+    Returns:
+        Dict[Hashable, object]: The raw cell value of each tag name. The dictionary is shared and must not be modified.
+
+    Example:
+        index = get_tag_index(excel_path)
+    """
+    stat = Path(excel_path).stat()
+    return _get_cached_tag_index(str(excel_path), stat.st_mtime_ns, stat.st_size, sheet_name)
+
+
+def lookup_tag_values(index: Dict[Hashable, object], tags: List[str]) -> List[Optional[int]]:
+    """
+    Looks up the integer value of each tag name. A missing or non numeric value is logged as an error for that tag and
+    returned as None, so one bad tag does not prevent the other labels from being stamped.
+
+    Args:
+        index (Dict[Hashable, object]): The tag index returned by `get_tag_index`.
+        tags (List[str]): The tag names to look up.
+
+    Returns:
+        List[Optional[int]]: The value of each tag, or None when it could not be found.
+    """
+    values = []
+    for tag_name in tags:
+        value = index.get(tag_name)
+        try:
+            values.append(int(value))
+        except (TypeError, ValueError):
+            logger.error(f"No valid value found for tag '{tag_name}' (got {value!r}).")
+            values.append(None)
+    return values